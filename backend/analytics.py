@@ -0,0 +1,295 @@
+"""
+Vectorized training analytics over a user's set history.
+
+Every completed set is logged in `set_logs` (weight, reps, exercise, time).
+The history is pulled with one aggregation that returns each exercise's sets
+as parallel arrays, so the driver never materializes one dict per set; it is
+then held as NumPy columns and all statistics are computed with array
+operations:
+
+- weekly volume, its rolling 4-week sum and week-over-week deltas
+- per-muscle-group load over the last 4 weeks
+- per-exercise working weight trend (least squares over sessions) projected
+  a few weeks ahead
+
+bench/training_analytics.py times them on synthetic histories.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorClientSession
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import logging
+
+import numpy as np
+
+from leaderboard import week_key
+from models.workout import MAX_REPS
+
+logger = logging.getLogger(__name__)
+
+MS_PER_DAY = 86_400_000
+ROLLING_WEEKS = 4
+MAX_WEEKS = 104
+# Enough history for the longest weekly view, including its first rolling window
+HISTORY_DAYS = (MAX_WEEKS + ROLLING_WEEKS) * 7
+# Muscle group of each exercise in the workout templates
+MUSCLE_GROUPS = {
+    "Supino Reto": "Peito",
+    "Supino Inclinado": "Peito",
+    "Crucifixo": "Peito",
+    "Tríceps Testa": "Tríceps",
+    "Puxada Frontal": "Costas",
+    "Remada Baixa": "Costas",
+    "Rosca Direta": "Bíceps",
+}
+DEFAULT_MUSCLE_GROUP = "Outros"
+
+EPOCH = datetime(1970, 1, 1)
+
+@dataclass
+class SetHistory:
+    """Columnar set history, 12 bytes per set; `exercise` holds indices into `exercises`"""
+    exercises: List[str]
+    exercise: np.ndarray  # uint16
+    day: np.ndarray       # int32, days since the epoch
+    weight: np.ndarray    # float32
+    reps: np.ndarray      # uint16
+
+    def __len__(self):
+        return len(self.day)
+
+    @property
+    def nbytes(self) -> int:
+        return self.exercise.nbytes + self.day.nbytes + self.weight.nbytes + self.reps.nbytes
+
+    def volume(self) -> np.ndarray:
+        return self.weight.astype(np.float64) * self.reps
+
+def week_index(days: np.ndarray) -> np.ndarray:
+    """Monday-based week number (the epoch fell on a Thursday)"""
+    return (days + 3) // 7
+
+def day_to_datetime(day: int) -> datetime:
+    return EPOCH + timedelta(days=int(day))
+
+async def load_set_history(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    since: Optional[datetime] = None,
+    session: Optional[AsyncIOMotorClientSession] = None
+) -> SetHistory:
+    match = {"userId": user_id}
+    if since is not None:
+        match["completedAt"] = {"$gte": since}
+    groups = await db.set_logs.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": "$exerciseName",
+            "time": {"$push": {"$toLong": "$completedAt"}},
+            "weight": {"$push": "$weight"},
+            "reps": {"$push": "$reps"}
+        }}
+    ], session=session).to_list(None)
+
+    exercises = []
+    columns = []
+    skipped = 0
+    for group in groups:
+        # As floats first: rows logged before reps and weight were bounded may not fit the columns
+        time = np.asarray(group["time"], dtype=np.float64)
+        weight = np.asarray(group["weight"], dtype=np.float64)
+        reps = np.asarray(group["reps"], dtype=np.float64)
+        valid = valid_sets(time, weight, reps)
+        skipped += len(valid) - int(valid.sum())
+        if valid.any():
+            exercises.append(group["_id"])
+            columns.append((time[valid], weight[valid], reps[valid]))
+    if skipped:
+        logger.warning("Skipped %s invalid set logs of user %s", skipped, user_id)
+    if not exercises:
+        return empty_history()
+
+    return SetHistory(
+        exercises=exercises,
+        exercise=np.repeat(np.arange(len(exercises), dtype=np.uint16), [len(time) for time, _, _ in columns]),
+        day=(np.concatenate([time for time, _, _ in columns]).astype(np.int64) // MS_PER_DAY).astype(np.int32),
+        weight=np.concatenate([weight for _, weight, _ in columns]).astype(np.float32),
+        reps=np.concatenate([reps for _, _, reps in columns]).astype(np.uint16)
+    )
+
+def valid_sets(time: np.ndarray, weight: np.ndarray, reps: np.ndarray) -> np.ndarray:
+    """Sets with a completion time, a weight that fits float32 and reps within 1..MAX_REPS (NaN fails every test)"""
+    return (
+        np.isfinite(time)
+        & (weight >= 0) & (weight <= np.finfo(np.float32).max)
+        & (reps >= 1) & (reps <= MAX_REPS)
+    )
+
+def workout_set_logs(workout: Dict) -> List[Dict]:
+    """Set logs for a workout's completed sets, for history logged before (or outside) set completion.
+
+    Only the planned weight and reps and the workout's completion time are
+    known, so every set is logged with those. They are marked `derived`.
+    """
+    completed_at = workout.get("completedAt") or workout["date"]
+    return [
+        {
+            "userId": workout["userId"],
+            "workoutId": workout["id"],
+            "exerciseId": exercise["id"],
+            "exerciseName": exercise["name"],
+            "weight": float(exercise["weight"]),
+            "reps": int(exercise["reps"]),
+            "completedAt": completed_at,
+            "derived": True
+        }
+        for exercise in workout.get("exercises", [])
+        for _ in range(min(exercise.get("completedSets", 0), exercise["sets"]))
+    ]
+
+def empty_history() -> SetHistory:
+    return SetHistory(
+        [], np.empty(0, np.uint16), np.empty(0, np.int32), np.empty(0, np.float32), np.empty(0, np.uint16)
+    )
+
+def weekly_volume(history: SetHistory, today: int, weeks: int) -> Dict:
+    """Volume of the last `weeks` weeks with rolling sums and deltas"""
+    current = week_index(np.int64(today))
+    # Extra leading weeks so the first rolling window is complete
+    first = current - weeks - ROLLING_WEEKS + 2
+    offsets = week_index(history.day.astype(np.int64)) - first
+    mask = (offsets >= 0) & (offsets <= current - first)
+    volume = np.bincount(
+        offsets[mask], weights=history.volume()[mask], minlength=int(current - first + 1)
+    )
+
+    rolling = np.convolve(volume, np.ones(ROLLING_WEEKS), mode="valid")
+    shown = volume[-weeks:]
+    previous = volume[-weeks - 1:-1]
+    delta = shown - previous
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta_percent = np.where(previous > 0, delta / previous * 100, np.nan)
+
+    return {
+        "first_week": int(current - weeks + 1),
+        "volume": shown,
+        "rolling": rolling[-weeks:],
+        "delta": delta,
+        "delta_percent": delta_percent
+    }
+
+def muscle_group_load(history: SetHistory, today: int, days: int = ROLLING_WEEKS * 7) -> Dict:
+    """Volume and set count per muscle group over the last `days` days"""
+    groups = sorted(set(MUSCLE_GROUPS.get(name, DEFAULT_MUSCLE_GROUP) for name in history.exercises))
+    exercise_group = np.array(
+        [groups.index(MUSCLE_GROUPS.get(name, DEFAULT_MUSCLE_GROUP)) for name in history.exercises], dtype=np.int32
+    )
+    mask = history.day > today - days
+    codes = exercise_group[history.exercise[mask]]
+    volume = np.bincount(codes, weights=history.volume()[mask], minlength=len(groups))
+    sets = np.bincount(codes, minlength=len(groups))
+    return {"groups": groups, "volume": volume, "sets": sets}
+
+def weight_projections(history: SetHistory, horizon_days: int) -> Dict:
+    """Least-squares trend of each exercise's working weight, projected ahead.
+
+    The working weight of a session is the heaviest set of that exercise on
+    that day; the trend is fitted over sessions, not individual sets.
+    """
+    exercises = len(history.exercises)
+    if not len(history):
+        return {"exercise": np.empty(0, dtype=np.int64)}
+
+    # One row per (exercise, day) session with its top weight
+    span = int(history.day.max()) + 1
+    sessions, inverse = np.unique(history.exercise.astype(np.int64) * span + history.day, return_inverse=True)
+    top_weight = np.full(len(sessions), -np.inf)
+    np.maximum.at(top_weight, inverse, history.weight.astype(np.float64))
+    exercise = (sessions // span).astype(np.int32)
+    day = (sessions % span).astype(np.float64)
+
+    # Center days per exercise for numerical stability
+    n = np.bincount(exercise, minlength=exercises).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_day = np.bincount(exercise, weights=day, minlength=exercises) / n
+        x = day - mean_day[exercise]
+        sum_y = np.bincount(exercise, weights=top_weight, minlength=exercises)
+        sum_xy = np.bincount(exercise, weights=x * top_weight, minlength=exercises)
+        sum_xx = np.bincount(exercise, weights=x * x, minlength=exercises)
+        slope = np.where(sum_xx > 0, sum_xy / sum_xx, 0.0)
+        intercept = sum_y / n
+
+    # Sessions are sorted by (exercise, day): each exercise's last session is just before the next one starts
+    last_session = np.cumsum(n.astype(np.int64)) - 1
+    last_day = (sessions % span)[last_session]
+    target = last_day + horizon_days
+
+    fitted = (n >= 2) & (sum_xx > 0)
+    return {
+        "exercise": np.arange(exercises),
+        "sessions": n.astype(np.int64),
+        "current": top_weight[last_session],
+        "last_day": last_day,
+        "slope_per_week": slope * 7,
+        "projected": np.where(
+            fitted,
+            np.maximum(intercept + slope * (target - mean_day), 0.0),
+            top_weight[last_session]
+        ),
+        "projected_day": target
+    }
+
+def compute_analytics(history: SetHistory, today: int, weeks: int, horizon_weeks: int) -> Dict:
+    """All analytics for one user, ready for the TrainingAnalytics response model"""
+    volume = weekly_volume(history, today, weeks)
+    load = muscle_group_load(history, today)
+    projections = weight_projections(history, horizon_weeks * 7)
+
+    week_labels = [week_key(day_to_datetime((volume["first_week"] + i) * 7 - 3)) for i in range(weeks)]
+    total_load = float(load["volume"].sum())
+
+    return {
+        "totalSets": len(history),
+        "weeks": [
+            {
+                "week": label,
+                "volume": float(volume["volume"][i]),
+                "rollingVolume": float(volume["rolling"][i]),
+                "delta": float(volume["delta"][i]),
+                "deltaPercent": None if np.isnan(volume["delta_percent"][i]) else float(volume["delta_percent"][i])
+            }
+            for i, label in enumerate(week_labels)
+        ],
+        "muscleGroups": [
+            {
+                "group": group,
+                "volume": float(load["volume"][i]),
+                "sets": int(load["sets"][i]),
+                "share": float(load["volume"][i] / total_load) if total_load else 0.0
+            }
+            for i, group in enumerate(load["groups"])
+        ],
+        "projections": [
+            {
+                "exercise": history.exercises[i],
+                "muscleGroup": MUSCLE_GROUPS.get(history.exercises[i], DEFAULT_MUSCLE_GROUP),
+                "sessions": int(projections["sessions"][i]),
+                "currentWeight": float(projections["current"][i]),
+                "slopePerWeek": float(projections["slope_per_week"][i]),
+                "projectedWeight": round(float(projections["projected"][i]), 1),
+                "projectedAt": day_to_datetime(projections["projected_day"][i])
+            }
+            for i in projections["exercise"]
+        ]
+    }
+
+def synthetic_history(sets: int, exercises: int = len(MUSCLE_GROUPS), days: int = 3 * 365, seed: int = 0) -> SetHistory:
+    """Random but plausible history: steadily progressing weights over `days` days"""
+    rng = np.random.default_rng(seed)
+    today = (datetime.utcnow() - EPOCH).days
+    day = np.sort(rng.integers(today - days, today + 1, sets)).astype(np.int32)
+    exercise = rng.integers(0, exercises, sets).astype(np.uint16)
+    base = rng.uniform(20, 100, exercises)
+    weight = np.round(base[exercise] * (1 + (day - day.min()) / days * 0.3) + rng.normal(0, 2.5, sets), 1)
+    names = list(MUSCLE_GROUPS)[:exercises] + [f"Exercício {i}" for i in range(len(MUSCLE_GROUPS), exercises)]
+    return SetHistory(names, exercise, day, weight.astype(np.float32), rng.integers(6, 13, sets).astype(np.uint16))
@@ -0,0 +1,174 @@
+"""
+Hot/cold tiering of workouts.
+
+Completed workouts older than ARCHIVE_AFTER_DAYS move from `workouts` to
+`workouts_archive` (on the same shard), so the hot collection and its indexes
+only hold recent and scheduled workouts. Before a workout leaves the hot
+collection its numbers are folded into the owner's `users.archived` summary,
+which the stats endpoints and the rollup reconciliation add to what they
+count in `workouts`.
+
+The job works in batches and resumes an interrupted one first. A batch is
+claimed by stamping `archiveBatch` on its workouts; it is then copied
+(upserts), folded (at most once per user and batch, recorded in
+`users.archiveBatches`) and deleted, each step safe to repeat.
+
+Reads that reach back past the cutoff, such as a date range starting before
+it or a full export, go to both tiers through `find_workouts` and
+`iter_workouts`. Everything else reads only the hot collection.
+
+Users moving to another shard are left alone until the move is over: the
+archive writes keep the workouts' timestamps, which the move's final copy
+relies on. Their part of a batch stays claimed and is finished where they land.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional
+import asyncio
+import os
+import uuid
+import logging
+
+from database import get_shard_router
+
+logger = logging.getLogger(__name__)
+
+# Never archive inside the longest window a hot-only query reads (26 weeks of coach progress, plus this week)
+HOT_MIN_DAYS = 26 * 7 + 7
+ARCHIVE_AFTER_DAYS = max(int(os.environ.get('ARCHIVE_AFTER_DAYS', 365)), HOT_MIN_DAYS)
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+# Pause between batches so the job does not monopolise the shard
+ARCHIVE_BATCH_PAUSE_SECONDS = 0.1
+# Batch ids remembered per user; only the latest can ever be resumed
+ARCHIVE_BATCH_HISTORY = 20
+
+def archive_cutoff(now: Optional[datetime] = None) -> datetime:
+    """Completed workouts dated before this are (or are about to be) archived"""
+    today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+def reaches_archive(since: Optional[datetime]) -> bool:
+    """Whether a query starting at `since` (None: all history) needs the archive"""
+    return since is None or since < archive_cutoff()
+
+def workout_summary(workouts: List[Dict]) -> Dict[str, Dict[str, float]]:
+    """Per-user totals of completed workouts, as the progress stats compute them"""
+    totals: Dict[str, Dict[str, float]] = defaultdict(lambda: {"workouts": 0, "volume": 0.0, "weight": 0.0, "exercises": 0})
+    for workout in workouts:
+        user_totals = totals[workout["userId"]]
+        user_totals["workouts"] += 1
+        for exercise in workout["exercises"]:
+            if exercise["completed"]:
+                user_totals["volume"] += exercise["sets"] * exercise["reps"] * exercise["weight"]
+                user_totals["weight"] += exercise["weight"]
+                user_totals["exercises"] += 1
+    return totals
+
+async def _archive_batch(shard_db: AsyncIOMotorDatabase, home_db: AsyncIOMotorDatabase, batch_id: str, moving: List[str]) -> int:
+    workouts = await shard_db.workouts.find({"archiveBatch": batch_id, "userId": {"$nin": moving}}).to_list(None)
+    if not workouts:
+        return 0
+
+    # 1. Copy
+    await shard_db.workouts_archive.bulk_write([
+        ReplaceOne({"_id": workout["_id"]}, {k: v for k, v in workout.items() if k != "archiveBatch"}, upsert=True)
+        for workout in workouts
+    ], ordered=False)
+
+    # 2. Fold into the owners' summaries, skipping users this batch already reached
+    folded_at = datetime.utcnow()
+    await home_db.users.bulk_write([
+        UpdateOne(
+            {"id": user_id, "archiveBatches": {"$ne": batch_id}},
+            {
+                "$inc": {f"archived.{key}": value for key, value in totals.items()},
+                "$push": {"archiveBatches": {"$each": [batch_id], "$slice": -ARCHIVE_BATCH_HISTORY}},
+                "$set": {"updatedAt": folded_at}
+            }
+        )
+        for user_id, totals in workout_summary(workouts).items()
+    ], ordered=False)
+
+    # 3. Delete, unless written since the copy (the batch is then resumed next time)
+    result = await shard_db.workouts.bulk_write([
+        DeleteOne({"_id": workout["_id"], "archiveBatch": batch_id, "version": workout.get("version")})
+        for workout in workouts
+    ], ordered=False)
+    return result.deleted_count
+
+async def archive_workouts(shard_db: AsyncIOMotorDatabase, home_db: AsyncIOMotorDatabase, cutoff: Optional[datetime] = None) -> int:
+    """Move one shard's old completed workouts to the archive, batch by batch"""
+    cutoff = cutoff or archive_cutoff()
+    archived = 0
+    while True:
+        moving = get_shard_router().moving_users()
+        # An interrupted batch is finished before a new one is claimed
+        pending = await shard_db.workouts.find_one(
+            {"archiveBatch": {"$exists": True}, "userId": {"$nin": moving}}, {"archiveBatch": 1}
+        )
+        if pending:
+            batch_id = pending["archiveBatch"]
+            logger.info("Resuming archive batch %s", batch_id)
+        else:
+            ids = [
+                workout["_id"]
+                async for workout in shard_db.workouts.find(
+                    {
+                        "status": "completed",
+                        "date": {"$lt": cutoff},
+                        "userId": {"$nin": moving},
+                        # Late completions stay hot until they age out too
+                        "$or": [{"completedAt": {"$lt": cutoff}}, {"completedAt": {"$exists": False}}]
+                    },
+                    {"_id": 1}
+                ).limit(ARCHIVE_BATCH_SIZE)
+            ]
+            if not ids:
+                return archived
+            batch_id = str(uuid.uuid4())
+            await shard_db.workouts.update_many(
+                {"_id": {"$in": ids}, "archiveBatch": {"$exists": False}},
+                {"$set": {"archiveBatch": batch_id}}
+            )
+        archived += await _archive_batch(shard_db, home_db, batch_id, moving)
+        await asyncio.sleep(ARCHIVE_BATCH_PAUSE_SECONDS)
+
+async def find_workouts(
+    db: AsyncIOMotorDatabase,
+    query: Dict,
+    since: Optional[datetime],
+    projection: Optional[Dict] = None,
+    limit: int = 100
+) -> List[Dict]:
+    """Workouts matching `query` sorted by date, from the archive too when `since` reaches it"""
+    workouts = await db.workouts.find(query, projection).sort("date", 1).to_list(limit)
+    if not reaches_archive(since):
+        return workouts
+    archived = await db.workouts_archive.find(query, projection).sort("date", 1).to_list(limit)
+    return sorted(archived + workouts, key=lambda workout: workout["date"])[:limit]
+
+async def _next(cursor) -> Optional[Dict]:
+    try:
+        return await cursor.next()
+    except StopAsyncIteration:
+        return None
+
+async def iter_workouts(
+    db: AsyncIOMotorDatabase,
+    query: Dict,
+    projection: Optional[Dict] = None,
+    batch_size: int = 100
+) -> AsyncIterator[Dict]:
+    """Stream the workouts matching `query` from both tiers, merged by date"""
+    cursors = [
+        db[collection].find(query, projection).sort("date", 1).batch_size(batch_size)
+        for collection in ("workouts_archive", "workouts")
+    ]
+    heads = [await _next(cursor) for cursor in cursors]
+    while any(head is not None for head in heads):
+        # Take from whichever tier has the earlier workout next
+        index = min((i for i, head in enumerate(heads) if head is not None), key=lambda i: heads[i]["date"])
+        yield heads[index]
+        heads[index] = await _next(cursors[index])
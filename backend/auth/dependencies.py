@@ -1,14 +1,25 @@
-from fastapi import HTTPException, Depends
+from fastapi import HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from auth.jwt_handler import verify_token
-from typing import Dict
+from auth.revocation import revocation_list
+from database import get_database, get_user_database, get_shard_router
+from sharding import UserDatabase
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
 
 security = HTTPBearer()
 
+def authenticate_token(token: str) -> Optional[Dict]:
+    """Return the token payload, or None if it is invalid, expired or revoked"""
+    payload = verify_token(token)
+    if payload is None or revocation_list.is_revoked(payload.get("jti")):
+        return None
+    return payload
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
     """Get current user from JWT token"""
     token = credentials.credentials
-    payload = verify_token(token)
+    payload = authenticate_token(token)
     
     if payload is None:
         raise HTTPException(
@@ -17,4 +28,113 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    return payload
\ No newline at end of file
+    return payload
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+SHARD_MOVE_RETRY_SECONDS = 10
+
+async def get_user_db(request: Request, current_user: Dict = Depends(get_current_user)) -> UserDatabase:
+    """The current user's database handle (their shard for user-owned collections).
+
+    Writes are refused while the user's data is in the final step of a move
+    between shards; reads keep going to the source shard until the switch.
+    """
+    user_id = current_user["user_id"]
+    if request.method not in READ_METHODS and get_shard_router().is_locked(user_id):
+        raise HTTPException(
+            status_code=503,
+            detail="Dados em migração, tente novamente em instantes",
+            headers={"Retry-After": str(SHARD_MOVE_RETRY_SECONDS)}
+        )
+    return get_user_database(user_id)
+
+async def get_user_analytics_db(current_user: Dict = Depends(get_current_user)) -> UserDatabase:
+    """The current user's database handle with the analytics read preference"""
+    return get_user_database(current_user["user_id"], analytics=True)
+
+class UserLoader:
+    """
+    Request-scoped loader for user documents.
+
+    Each user document is read at most once per request: results (including
+    "not found") are memoized with the fields they were read with, and a later
+    call asking for fields outside that set re-reads the union once. Lookups of
+    several users are batched into a single `$in` query.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, user_id: str):
+        self.db = db
+        self.user_id = user_id
+        # user_id -> (document or None, fields read; None means the whole document)
+        self._memo: Dict[str, Tuple[Optional[Dict], Optional[FrozenSet[str]]]] = {}
+
+    def _covers(self, user_id: str, fields: Optional[FrozenSet[str]]) -> bool:
+        memo = self._memo.get(user_id)
+        if memo is None:
+            return False
+        loaded = memo[1]
+        return loaded is None or (fields is not None and fields <= loaded)
+
+    def _projection(self, user_ids: List[str], fields: Optional[FrozenSet[str]]) -> Tuple[Optional[FrozenSet[str]], Dict]:
+        """Fields to read so that every memo for `user_ids` ends up covering `fields`"""
+        if fields is None:
+            return None, {"_id": 0}
+        wanted = set(fields) | {"id"}
+        for user_id in user_ids:
+            memo = self._memo.get(user_id)
+            if memo is not None and memo[1] is not None:
+                wanted |= memo[1]
+        return frozenset(wanted), {"_id": 0, **{field: 1 for field in wanted}}
+
+    async def current(self, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        """The authenticated user's document, restricted to `fields` if given"""
+        return await self.load(self.user_id, fields)
+
+    async def load(self, user_id: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        return (await self.load_many([user_id], fields)).get(user_id)
+
+    async def load_many(self, user_ids: Iterable[str], fields: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """Documents of the users that exist, keyed by id, fetching missing ones in one query"""
+        fields = frozenset(fields) if fields is not None else None
+        user_ids = list(dict.fromkeys(user_ids))
+        missing = [user_id for user_id in user_ids if not self._covers(user_id, fields)]
+
+        if missing:
+            loaded_fields, projection = self._projection(missing, fields)
+            found = {
+                user["id"]: user
+                async for user in self.db.users.find({"id": {"$in": missing}}, projection)
+            }
+            for user_id in missing:
+                self._memo[user_id] = (found.get(user_id), loaded_fields)
+
+        return {
+            user_id: self._memo[user_id][0]
+            for user_id in user_ids
+            if self._memo[user_id][0] is not None
+        }
+
+    def forget(self, user_id: str):
+        """Drop a memoized document after the request has changed it"""
+        self._memo.pop(user_id, None)
+
+async def get_user_loader(
+    request: Request,
+    current_user: Dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+) -> UserLoader:
+    """The request's UserLoader, created on first use and kept in request.state"""
+    loader = getattr(request.state, "user_loader", None)
+    if loader is None:
+        loader = UserLoader(db, current_user["user_id"])
+        request.state.user_loader = loader
+    return loader
+
+def current_user_document(*fields: str):
+    """Dependency returning the authenticated user's document (only `fields`, if given); 404 if it is gone"""
+    async def dependency(loader: UserLoader = Depends(get_user_loader)) -> Dict:
+        user = await loader.current(fields or None)
+        if not user:
+            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        return user
+    return dependency
@@ -1,20 +1,35 @@
 import jwt
 from datetime import datetime, timedelta
 from typing import Dict, Optional
+import hashlib
 import os
+import secrets
+import uuid
 
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'fitness-app-secret-key-2025')
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_HOURS = 24 * 7  # 7 days
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', 15))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRE_DAYS', 30))
 
 def create_access_token(data: Dict) -> str:
     """Create JWT access token"""
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
-    to_encode.update({"exp": expire})
+    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_refresh_token() -> str:
+    """Create an opaque refresh token (only its hash is stored)"""
+    return secrets.token_urlsafe(32)
+
+def hash_refresh_token(token: str) -> str:
+    """Hash a refresh token for storage and lookup"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def refresh_token_expiry() -> datetime:
+    return datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+
 def verify_token(token: str) -> Optional[Dict]:
     """Verify JWT token and return payload"""
     try:
@@ -30,4 +45,4 @@ def get_user_id_from_token(token: str) -> Optional[str]:
     payload = verify_token(token)
     if payload:
         return payload.get("user_id")
-    return None
\ No newline at end of file
+    return None
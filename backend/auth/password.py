@@ -1,11 +1,102 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime
 import bcrypt
+import asyncio
+import os
+import time
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_TARGET_MS = float(os.environ.get('BCRYPT_TARGET_MS', 100))
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+
+# Home-shard `app_settings` document holding the deployment's cost factor
+ROUNDS_SETTING = "bcrypt_rounds"
+
+# Cost factor used for new hashes; pinned by BCRYPT_ROUNDS or set by calibration
+_rounds = int(os.environ.get('BCRYPT_ROUNDS', 12))
+_pinned = 'BCRYPT_ROUNDS' in os.environ
+_calibrated = _pinned
+
+def _time_hash(rounds: int) -> float:
+    """Milliseconds to hash a throwaway password at the given cost"""
+    salt = bcrypt.gensalt(rounds)
+    started = time.perf_counter()
+    bcrypt.hashpw(b"calibration-password", salt)
+    return (time.perf_counter() - started) * 1000
+
+def calibrate_rounds(target_ms: float = BCRYPT_TARGET_MS) -> int:
+    """Pick the cost factor whose hashing time is closest to target_ms on this machine"""
+    global _rounds, _calibrated
+    # Each extra round doubles the work, so one measurement predicts the rest
+    base_ms = min(_time_hash(BCRYPT_MIN_ROUNDS) for _ in range(2))
+    _rounds = min(
+        range(BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS + 1),
+        key=lambda rounds: abs(base_ms * 2 ** (rounds - BCRYPT_MIN_ROUNDS) - target_ms)
+    )
+    _calibrated = True
+
+    expected_ms = base_ms * 2 ** (_rounds - BCRYPT_MIN_ROUNDS)
+    metrics.set_gauge("bcrypt_rounds", _rounds)
+    metrics.set_gauge("bcrypt_expected_ms", round(expected_ms, 1))
+    logger.info("bcrypt cost set to %s (~%.0fms, target %.0fms)", _rounds, expected_ms, target_ms)
+    return _rounds
+
+async def ensure_calibrated(db: AsyncIOMotorDatabase):
+    """Adopt the deployment's cost factor, calibrating it first if none is stored.
+
+    Workers and machines calibrate to slightly different costs. The first one
+    to start stores its result on the home shard and every worker uses that,
+    so rehash-on-login never flips a hash between two costs. BCRYPT_ROUNDS
+    pins the cost instead; delete the setting to recalibrate.
+    """
+    global _rounds
+    if not _pinned:
+        stored = await db.app_settings.find_one({"_id": ROUNDS_SETTING})
+        if stored is None:
+            # Skipped when inherited from a preloading master
+            if not _calibrated:
+                await asyncio.to_thread(calibrate_rounds)
+            try:
+                stored = await db.app_settings.find_one_and_update(
+                    {"_id": ROUNDS_SETTING},
+                    {"$setOnInsert": {"rounds": _rounds, "calibratedAt": datetime.utcnow()}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                stored = await db.app_settings.find_one({"_id": ROUNDS_SETTING})
+        if stored["rounds"] != _rounds:
+            logger.info("bcrypt cost set to %s by the deployment setting", stored["rounds"])
+        _rounds = stored["rounds"]
+    metrics.set_gauge("bcrypt_rounds", _rounds)
+
+def current_rounds() -> int:
+    return _rounds
+
+def hash_rounds(hashed: str) -> int:
+    """Read the cost factor from a '$2b$<cost>$...' hash"""
+    return int(hashed.split('$')[2])
+
+def needs_rehash(hashed: str) -> bool:
+    """Whether a stored hash uses a different cost than the one in effect"""
+    try:
+        return hash_rounds(hashed) != _rounds
+    except (IndexError, ValueError):
+        return False
 
 def hash_password(password: str) -> str:
     """Hash password using bcrypt"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(_rounds)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     """Verify password against hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
\ No newline at end of file
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
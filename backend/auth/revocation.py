@@ -0,0 +1,106 @@
+"""
+In-memory access token revocation.
+
+Revoked token ids (jti) are stored in the small, TTL-indexed `revoked_tokens`
+collection and mirrored in every worker, so `get_current_user` can check
+revocation without a database round trip. A Bloom filter answers the common
+"not revoked" case; its positives are confirmed against an exact set.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import hashlib
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', 5))
+BLOOM_CAPACITY = 100_000
+BLOOM_HASHES = 7
+# Bits per expected entry for a ~1% false positive rate with 7 hashes
+BLOOM_BITS_PER_ENTRY = 10
+
+class BloomFilter:
+    def __init__(self, capacity: int = BLOOM_CAPACITY, hashes: int = BLOOM_HASHES):
+        self.size = capacity * BLOOM_BITS_PER_ENTRY
+        self.hashes = hashes
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class RevocationList:
+    def __init__(self):
+        self._bloom = BloomFilter()
+        self._revoked: Dict[str, datetime] = {}  # jti -> token expiry
+        self._synced_until: Optional[datetime] = None
+
+    def add(self, jti: str, expires_at: datetime):
+        if jti not in self._revoked:
+            self._bloom.add(jti)
+        self._revoked[jti] = expires_at
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti or jti not in self._bloom:
+            return False
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > datetime.utcnow()
+
+    def _prune(self):
+        """Forget expired tokens and rebuild the Bloom filter without them"""
+        now = datetime.utcnow()
+        expired = [jti for jti, expires_at in self._revoked.items() if expires_at <= now]
+        if not expired:
+            return
+        for jti in expired:
+            del self._revoked[jti]
+        self._bloom = BloomFilter(max(BLOOM_CAPACITY, len(self._revoked) * 2))
+        for jti in self._revoked:
+            self._bloom.add(jti)
+
+    async def refresh(self, db: AsyncIOMotorDatabase):
+        """Pull revocations recorded since the last sync (by any worker)"""
+        query = {"expiresAt": {"$gt": datetime.utcnow()}}
+        if self._synced_until is not None:
+            # Overlap slightly so revocations written with a lagging clock are not missed
+            query["revokedAt"] = {"$gte": self._synced_until - timedelta(seconds=REVOCATION_SYNC_SECONDS)}
+        synced_until = datetime.utcnow()
+
+        async for doc in db.revoked_tokens.find(query, {"_id": 0, "jti": 1, "expiresAt": 1}):
+            self.add(doc["jti"], doc["expiresAt"])
+        self._synced_until = synced_until
+        self._prune()
+
+    def __len__(self):
+        return len(self._revoked)
+
+revocation_list = RevocationList()
+
+async def revoke_token(db: AsyncIOMotorDatabase, payload: Dict):
+    """Revoke an access token until it would have expired anyway"""
+    jti = payload.get("jti")
+    if not jti:
+        return
+    expires_at = datetime.utcfromtimestamp(payload["exp"])
+    await db.revoked_tokens.update_one(
+        {"jti": jti},
+        {"$setOnInsert": {
+            "jti": jti,
+            "userId": payload.get("user_id"),
+            "expiresAt": expires_at,
+            "revokedAt": datetime.utcnow()
+        }},
+        upsert=True
+    )
+    revocation_list.add(jti, expires_at)
@@ -0,0 +1,63 @@
+"""
+Compression ratio and CPU cost per level on workout payloads, rendered as the
+API renders them. Run from backend/:
+
+    python -m bench.compression_levels --workouts 100
+"""
+from typing import Dict
+import argparse
+import json
+
+from middleware.compression import brotli, compressor, timed_compress
+from models.workout import Exercise, WorkoutResponse
+from routes.workouts import SAMPLE_WORKOUTS
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare compression ratio and CPU cost on workout payloads")
+    parser.add_argument("--workouts", type=int, default=100, help="workouts in the list payload")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    def workout(i: int) -> Dict:
+        template = SAMPLE_WORKOUTS[i % len(SAMPLE_WORKOUTS)]
+        return WorkoutResponse(
+            id=f"{i:08d}-0000-4000-8000-000000000000",
+            name=template["name"],
+            date="2024-01-01T00:00:00",
+            status="completed",
+            progress=100,
+            exercises=[Exercise(**exercise) for exercise in template["exercises"]]
+        ).model_dump(mode="json")
+
+    def render(content) -> bytes:
+        # As Starlette's JSONResponse renders it
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    payloads = {
+        "/api/workouts/": render([workout(i) for i in range(args.workouts)]),
+        "/api/workouts/upcoming": render([workout(i) for i in range(7)]),
+        "/api/workouts/today": render(workout(0)),
+    }
+    levels = [("gzip", level) for level in (1, 5, 6, 9)]
+    if brotli is not None:
+        levels += [("br", quality) for quality in (1, 4, 6, 11)]
+
+    print(f"{'route':<24}{'encoding':<10}{'bytes':>10}{'saved':>10}{'ratio':>8}{'cpu µs':>10}")
+    for route, body in payloads.items():
+        print(f"{route:<24}{'identity':<10}{len(body):>10}")
+        for encoding, level in levels:
+            compress = compressor(encoding, level)
+            compressed = b""
+            total = 0.0
+            for _ in range(args.repeat):
+                compressed, cpu_seconds = timed_compress(compress, body)
+                total += cpu_seconds
+            print(
+                f"{'':<24}{f'{encoding}-{level}':<10}{len(compressed):>10}{len(body) - len(compressed):>10}"
+                f"{len(body) / len(compressed):>8.1f}{total / args.repeat * 1e6:>10.0f}"
+            )
+    if brotli is None:
+        print("brotli not installed: gzip only")
+
+if __name__ == "__main__":
+    main()
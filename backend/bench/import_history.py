@@ -0,0 +1,96 @@
+"""
+History import throughput on a synthetic upload (target: 50k rows/s).
+
+Without --mongo-url the writes are discarded, which measures parsing and
+validation alone. Run from backend/:
+
+    python -m bench.import_history --workouts 20000 --format csv
+    python -m bench.import_history --workouts 20000 --mongo-url mongodb://localhost:27017
+"""
+from motor.motor_asyncio import AsyncIOMotorClient
+from datetime import datetime
+import argparse
+import asyncio
+import csv
+import io
+import time
+import uuid
+
+from models.user import ImportResponse
+from models.workout import Workout
+from routes.user import (
+    EXPORT_CSV_COLUMNS, EXPORT_FORMATS, _csv_rows, _iter_import_records, _iter_lines, _ndjson_line, import_records
+)
+from routes.workouts import SAMPLE_WORKOUTS
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark history import throughput")
+    parser.add_argument("--workouts", type=int, default=20_000)
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--mongo-url", help="import into a scratch database here instead of discarding writes")
+    args = parser.parse_args()
+
+    def upload() -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if args.format == "csv":
+            writer.writerow(EXPORT_CSV_COLUMNS)
+        for i in range(args.workouts):
+            template = SAMPLE_WORKOUTS[i % len(SAMPLE_WORKOUTS)]
+            workout = Workout(
+                userId="benchmark",
+                name=template["name"],
+                date=datetime(2020, 1, 1),
+                status="completed",
+                progress=100,
+                exercises=[{**exercise, "completed": True, "completedSets": exercise["sets"]} for exercise in template["exercises"]]
+            ).dict(exclude={"userId"})
+            if args.format == "csv":
+                writer.writerows(_csv_rows(workout))
+            else:
+                buffer.write(_ndjson_line({"type": "workout", **workout}))
+        return buffer.getvalue().encode("utf-8")
+
+    class DiscardedWrites:
+        deleted_count = 0
+
+        def __getattr__(self, name):
+            return self
+
+        async def __call__(self, *args, **kwargs):
+            return self
+
+    async def stream(body: bytes):
+        # As uvicorn hands over a request body
+        for start in range(0, len(body), 64 * 1024):
+            yield body[start:start + 64 * 1024]
+
+    async def run(body: bytes) -> ImportResponse:
+        if not args.mongo_url:
+            return await import_records(
+                DiscardedWrites(), "benchmark", _iter_import_records(_iter_lines(stream(body)), args.format), args.chunk_size
+            )
+        client = AsyncIOMotorClient(args.mongo_url)
+        db_name = f"import_benchmark_{uuid.uuid4().hex[:8]}"
+        try:
+            return await import_records(
+                client[db_name], "benchmark", _iter_import_records(_iter_lines(stream(body)), args.format), args.chunk_size
+            )
+        finally:
+            await client.drop_database(db_name)
+            client.close()
+
+    body = upload()
+    rows = body.count(b"\n") - (1 if args.format == "csv" else 0)
+    started = time.perf_counter()
+    result = asyncio.run(run(body))
+    elapsed = time.perf_counter() - started
+    print(
+        f"{args.format}: {rows} rows ({result.imported} workouts, {result.setLogs} set logs, {result.failed} failed) "
+        f"in {elapsed:.2f} s: {rows / elapsed:,.0f} rows/s, {result.imported / elapsed:,.0f} workouts/s"
+        + ("" if args.mongo_url else " (writes discarded)")
+    )
+
+if __name__ == "__main__":
+    main()
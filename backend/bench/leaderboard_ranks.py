@@ -0,0 +1,84 @@
+"""
+Leaderboard rank queries and live updates against synthetic users, in a
+scratch database that is dropped afterwards. Run from backend/:
+
+    python -m bench.leaderboard_ranks --users 1000000 --mongo-url mongodb://localhost:27017
+"""
+from motor.motor_asyncio import AsyncIOMotorClient
+from datetime import datetime
+from typing import Dict
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+
+from database import ensure_indexes
+from leaderboard import apply_bucket_moves, move_between_buckets, record_workout_volume, top_entries, user_rank, week_key
+
+async def benchmark(mongo_url: str, users: int, samples: int):
+    """Rank queries and live updates against `users` synthetic users in a scratch database"""
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[f"leaderboard_benchmark_{uuid.uuid4().hex[:8]}"]
+    week = week_key()
+    rng = random.Random(0)
+    try:
+        await ensure_indexes(db)
+        started = time.perf_counter()
+        deltas: Dict[int, int] = {}
+        for first in range(0, users, 10_000):
+            docs = []
+            for i in range(first, min(first + 10_000, users)):
+                volume = round(rng.lognormvariate(9, 1), 1)
+                move_between_buckets(deltas, None, volume)
+                docs.append({"week": week, "userId": f"user-{i:08d}", "volume": volume, "workouts": [], "rev": 1, "counted": True})
+            await db.leaderboard_weekly.insert_many(docs, ordered=False)
+        await apply_bucket_moves(db, week, deltas)
+        print(f"Loaded {users} users in {time.perf_counter() - started:.1f} s")
+
+        async def timed(name: str, operation):
+            timings = []
+            for _ in range(samples):
+                user_id = f"user-{rng.randrange(users):08d}"
+                operation_started = time.perf_counter()
+                await operation(user_id)
+                timings.append(time.perf_counter() - operation_started)
+            timings.sort()
+            print(
+                f"{name:<28}p50 {timings[len(timings) // 2] * 1000:8.2f} ms"
+                f"   p99 {timings[int(len(timings) * 0.99)] * 1000:8.2f} ms"
+            )
+
+        async def linear_rank(user_id: str):
+            # The previous implementation: count every user with more volume
+            doc = await db.leaderboard_weekly.find_one({"week": week, "userId": user_id})
+            await db.leaderboard_weekly.count_documents({"week": week, "volume": {"$gt": doc["volume"]}})
+
+        async def check_rank(user_id: str):
+            rank = await user_rank(db, week, user_id)
+            doc = await db.leaderboard_weekly.find_one({"week": week, "userId": user_id})
+            expected = await db.leaderboard_weekly.count_documents({"week": week, "volume": {"$gt": doc["volume"]}}) + 1
+            assert rank["rank"] == expected, (rank, expected)
+
+        await timed("top 10", lambda user_id: top_entries(db, week, 10))
+        await timed("my rank (rank tree)", lambda user_id: user_rank(db, week, user_id))
+        await timed("my rank (linear count)", linear_rank)
+        await timed("record workout volume", lambda user_id: record_workout_volume(
+            db, user_id, str(uuid.uuid4()), rng.uniform(1000, 20000), datetime.utcnow()
+        ))
+        await timed("rank check after updates", check_rank)
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark leaderboard rank queries")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--mongo-url", default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.mongo_url, args.users, args.samples))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Concurrent live sessions held by one worker: a server process runs the live
+hub, and a client process connects the sessions and publishes events to them.
+Run from backend/:
+
+    python -m bench.live_sessions --sessions 5000 --workouts 1000 --rounds 10
+"""
+from fastapi import WebSocket
+from starlette.applications import Starlette
+from starlette.routing import WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+import argparse
+import asyncio
+import json
+import multiprocessing
+import statistics
+import time
+import uvicorn
+import websockets
+
+from live import SEND_QUEUE_SIZE, LiveConnection, hub
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent live sessions held by one worker")
+    parser.add_argument("--sessions", type=int, default=5000, help="WebSocket connections to open")
+    parser.add_argument("--workouts", type=int, default=1000, help="workouts the sessions follow")
+    parser.add_argument("--rounds", type=int, default=10, help="events published to every workout")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    def serve():
+        async def session(websocket: WebSocket):
+            await websocket.accept()
+            connection = LiveConnection(websocket, "load", websocket.path_params["workout_id"])
+            hub.register(connection)
+            connection.push({"type": "ready"})
+            try:
+                while True:
+                    await websocket.receive_text()
+            except WebSocketDisconnect:
+                pass
+            finally:
+                await hub.unregister(connection)
+
+        async def control(websocket: WebSocket):
+            # Publish rounds of events to every workout, as set completions would
+            await websocket.accept()
+            rounds = json.loads(await websocket.receive_text())["rounds"]
+            for _ in range(rounds):
+                for workout_id in list(hub.channels):
+                    hub.publish(workout_id, {"type": "set_completed", "sentAt": time.time()})
+                await asyncio.sleep(0)
+            await websocket.send_json({"sessions": hub.connection_count()})
+            await websocket.close()
+
+        app = Starlette(routes=[WebSocketRoute("/control", control), WebSocketRoute("/live/{workout_id}", session)])
+        uvicorn.run(app, port=args.port, log_level="warning", ws_max_queue=SEND_QUEUE_SIZE, backlog=4096)
+
+    def rss_kib(pid: int) -> int:
+        with open(f"/proc/{pid}/status") as status:
+            return next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+
+    async def load(server_pid: int):
+        url = f"ws://127.0.0.1:{args.port}"
+        for _ in range(50):
+            try:
+                async with websockets.connect(f"{url}/live/probe") as probe:
+                    await probe.recv()
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+        baseline = rss_kib(server_pid)
+
+        latencies = []
+        received = [0]
+        everything = asyncio.Event()
+        expected = args.sessions * args.rounds
+
+        async def client(number: int, connected: asyncio.Semaphore):
+            async with connected:
+                socket = await websockets.connect(f"{url}/live/w{number % args.workouts}", max_queue=None)
+                await socket.recv()
+            return socket
+
+        async def listen(socket):
+            async for message in socket:
+                event = json.loads(message)
+                latencies.append(time.time() - event["sentAt"])
+                received[0] += 1
+                if received[0] == expected:
+                    everything.set()
+
+        started = time.perf_counter()
+        # Bounded concurrent handshakes, as clients reconnecting after a deploy would
+        handshakes = asyncio.Semaphore(200)
+        sockets = await asyncio.gather(*(client(n, handshakes) for n in range(args.sessions)))
+        connect_seconds = time.perf_counter() - started
+        held = rss_kib(server_pid)
+        listeners = [asyncio.create_task(listen(socket)) for socket in sockets]
+
+        started = time.perf_counter()
+        async with websockets.connect(f"{url}/control") as control:
+            await control.send(json.dumps({"rounds": args.rounds}))
+            reported = json.loads(await control.recv())
+        try:
+            await asyncio.wait_for(everything.wait(), timeout=120)
+        except asyncio.TimeoutError:
+            pass
+        deliver_seconds = time.perf_counter() - started
+
+        for socket in sockets:
+            await socket.close()
+        await asyncio.gather(*listeners, return_exceptions=True)
+
+        latencies.sort()
+        print(f"{reported['sessions']} sessions on one worker, connected in {connect_seconds:.1f} s")
+        print(f"worker RSS {baseline / 1024:.0f} MiB idle, {held / 1024:.0f} MiB holding them "
+              f"({(held - baseline) * 1024 / max(reported['sessions'], 1) / 1024:.1f} KiB per session)")
+        if latencies:
+            print(f"{received[0]}/{expected} events delivered in {deliver_seconds:.1f} s "
+                  f"({received[0] / deliver_seconds:.0f}/s), latency p50 {statistics.median(latencies) * 1000:.0f} ms, "
+                  f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+
+    server = multiprocessing.Process(target=serve, daemon=True)
+    server.start()
+    try:
+        asyncio.run(load(server.pid))
+    finally:
+        server.terminate()
+        server.join()
+
+if __name__ == "__main__":
+    main()
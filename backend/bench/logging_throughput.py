@@ -0,0 +1,100 @@
+"""
+Event loop latency of INFO logging under concurrent load against a slow
+stderr, writing directly vs through the bounded queue. Run from backend/:
+
+    python -m bench.logging_throughput --tasks 200 --records 50 --write-delay-us 200
+"""
+from typing import Dict
+import argparse
+import asyncio
+import logging
+import queue
+import time
+
+import metrics
+from logging_config import LOG_QUEUE_SIZE, DeferredFormatQueueHandler, DrainingQueueListener, JsonFormatter
+
+def dropped_records() -> float:
+    counters = metrics.snapshot()["counters"]
+    return sum(value for key, value in counters.items() if key.startswith("log_records_dropped"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Event loop latency of INFO logging, direct vs queued")
+    parser.add_argument("--tasks", type=int, default=200, help="concurrent simulated requests")
+    parser.add_argument("--records", type=int, default=50, help="records logged per request")
+    parser.add_argument("--write-delay-us", type=float, default=200, help="simulated stderr write latency")
+    parser.add_argument("--queue-size", type=int, default=LOG_QUEUE_SIZE, help="records the queue holds before dropping")
+    args = parser.parse_args()
+
+    class SlowStream:
+        """A congested stderr: every write blocks for a while"""
+
+        def write(self, text: str):
+            time.sleep(args.write_delay_us / 1e6)
+
+        def flush(self):
+            pass
+
+    async def load(logger: logging.Logger) -> Dict[str, float]:
+        lags = []
+        done = False
+
+        async def probe():
+            # How late a 1 ms timer fires: time the loop spent blocked
+            while not done:
+                started = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lags.append(time.perf_counter() - started - 0.001)
+
+        async def request(number: int):
+            for i in range(args.records):
+                logger.info("request %s step %s done in %.1f ms", number, i, 1.5, extra={"route": "/api/workouts/"})
+                await asyncio.sleep(0)
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(request(n) for n in range(args.tasks)))
+        elapsed = time.perf_counter() - started
+        done = True
+        await probe_task
+        lags.sort()
+        return {
+            "elapsed": elapsed,
+            "p50": lags[len(lags) // 2] if lags else 0.0,
+            "p99": lags[int(len(lags) * 0.99)] if lags else 0.0,
+            "max": lags[-1] if lags else 0.0,
+        }
+
+    records = args.tasks * args.records
+    print(f"{records} INFO records from {args.tasks} tasks, {args.write_delay_us:.0f} µs per stderr write")
+    print(f"{'pipeline':<10}{'wall ms':>10}{'loop lag p50 ms':>18}{'p99 ms':>10}{'max ms':>10}")
+
+    dropped = dropped_records()
+    for name in ("direct", "queued"):
+        logger = logging.getLogger(f"benchmark.{name}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        output = logging.StreamHandler(SlowStream())
+        output.setFormatter(JsonFormatter())
+        listener = None
+        if name == "direct":
+            logger.addHandler(output)
+        else:
+            log_queue = queue.Queue(args.queue_size)
+            logger.addHandler(DeferredFormatQueueHandler(log_queue))
+            listener = DrainingQueueListener(log_queue, output)
+            listener.start()
+        result = asyncio.run(load(logger))
+        if listener is not None:
+            drained = time.perf_counter()
+            listener.stop()
+            result["drain"] = time.perf_counter() - drained
+        print(
+            f"{name:<10}{result['elapsed'] * 1000:>10.0f}{result['p50'] * 1000:>18.2f}"
+            f"{result['p99'] * 1000:>10.2f}{result['max'] * 1000:>10.2f}"
+            + (f"   (listener drained the backlog in {result['drain'] * 1000:.0f} ms)" if "drain" in result else "")
+        )
+    print(f"queued pipeline dropped {dropped_records() - dropped:.0f} records on a full queue")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Training analytics timings on synthetic set histories (no database needed).
+Run from backend/:
+
+    python -m bench.training_analytics --sets 100000
+"""
+import argparse
+import time
+
+from analytics import MUSCLE_GROUPS, compute_analytics, synthetic_history
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark training analytics on synthetic set histories")
+    parser.add_argument("--sets", type=int, default=100_000)
+    parser.add_argument("--exercises", type=int, default=len(MUSCLE_GROUPS))
+    parser.add_argument("--weeks", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    history = synthetic_history(args.sets, args.exercises)
+    today = int(history.day.max())
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        compute_analytics(history, today, args.weeks, 4)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(
+        f"{args.sets} sets, {args.exercises} exercises: "
+        f"median {timings[len(timings) // 2] * 1000:.2f} ms, best {timings[0] * 1000:.2f} ms"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Cross-worker cache invalidation bus.
+
+Every worker tails a MongoDB change stream on `users`, `workouts` and
+`set_logs` (one per shard) and broadcasts "this user's data changed" to the
+in-process caches subscribed to `invalidation_bus`. Writes made by any worker
+or node therefore reach every local cache, not just the one in the process
+that made the write.
+
+The resume token is kept in memory, per process and stream: a stream that
+fails resumes where it stopped, while a restarted worker, whose caches start
+empty, follows the stream from "now". If the server can no longer resume
+(the oplog rolled past the token), the stream is reopened from "now" and the
+subscribers are told to drop everything, since changes in between are lost.
+
+Delete events carry no document. Their owner is read from the pre-image where
+the collection records them (`set_logs`, see `database.ensure_indexes`; needs
+MongoDB 6.0). Unattributed deletes are not broadcast: the workout deletes in
+this code base (archiving, shard moves, replacing pending plan days) never
+change what the caches derive, and flushing every cache on each of them would
+make the caches useless.
+
+Change streams need a replica set; against a standalone mongod the bus falls
+back to polling documents by their `updatedAt` stamp (`_id` for set logs).
+Polling cannot see deletes at all; set logs are only deleted by imports, which
+insert the replacements for the same user right after. A single-node replica
+set is enough to exercise the change-stream path locally:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval 'rs.initiate()'
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+import asyncio
+import os
+import logging
+
+import metrics
+from database import get_shard_databases
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = ("users", "workouts", "set_logs")
+# Field holding the owning user's id in each watched collection
+USER_FIELDS = {"users": "id", "workouts": "userId", "set_logs": "userId"}
+# Field the polling fallback follows; set logs are never updated, only inserted
+POLL_FIELDS = {"users": "updatedAt", "workouts": "updatedAt", "set_logs": "_id"}
+
+POLL_SECONDS = float(os.environ.get('INVALIDATION_POLL_SECONDS', 2))
+RETRY_SECONDS = 5
+# Server error code for "The $changeStream stage is only supported on replica sets"
+NOT_REPLICA_SET = 40573
+# Servers before 6.0 reject the fullDocumentBeforeChange option
+UNKNOWN_FIELD = 40415
+# InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost
+CANNOT_RESUME = (260, 280, 286)
+
+# Callback signature: (collection, user_id); user_id None means "any user"
+Subscriber = Callable[[str, Optional[str]], None]
+
+class InvalidationBus:
+    def __init__(self, get_dbs: Callable[[], List[AsyncIOMotorDatabase]]):
+        self.get_dbs = get_dbs
+        self.subscribers: List[Subscriber] = []
+        self.mode: Optional[str] = None
+        self.pre_images = True
+        self._tasks: List[asyncio.Task] = []
+
+    def subscribe(self, callback: Subscriber):
+        self.subscribers.append(callback)
+
+    def dispatch(self, collection: str, user_id: Optional[str]):
+        """Deliver an invalidation to every local subscriber"""
+        metrics.increment("cache_invalidations", labels={"collection": collection})
+        for callback in self.subscribers:
+            try:
+                callback(collection, user_id)
+            except Exception as e:
+                logger.error("Invalidation subscriber error: %s", e)
+
+    def dispatch_all(self):
+        """Tell every subscriber that any user's data may have changed"""
+        for collection in WATCHED_COLLECTIONS:
+            self.dispatch(collection, None)
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._run(db)) for db in self.get_dbs()]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, db: AsyncIOMotorDatabase):
+        # This stream's position, in memory only: see the module docstring
+        position: Dict[str, object] = {"token": None}
+        while True:
+            try:
+                await self._watch(db, position)
+            except OperationFailure as e:
+                if e.code == NOT_REPLICA_SET:
+                    logger.info("Change streams unavailable (standalone mongod), polling for invalidations")
+                    await self._poll(db)
+                elif e.code == UNKNOWN_FIELD and self.pre_images:
+                    logger.info("Change stream pre-images unsupported, deletes stay unattributed")
+                    self.pre_images = False
+                elif position["token"] is not None and (
+                    e.code in CANNOT_RESUME or e.has_error_label("NonResumableChangeStreamError")
+                ):
+                    # History lost or token rejected: whatever happened in between is unknown
+                    logger.warning("Invalidation stream cannot resume (%s), restarting from now", e)
+                    metrics.increment("cache_invalidation_resets")
+                    position["token"] = None
+                    self.dispatch_all()
+                else:
+                    logger.error("Invalidation stream error: %s", e)
+                    await asyncio.sleep(RETRY_SECONDS)
+            except PyMongoError as e:
+                logger.error("Invalidation stream error: %s", e)
+                await asyncio.sleep(RETRY_SECONDS)
+
+    def _set_mode(self, mode: str):
+        self.mode = mode
+        metrics.set_gauge("cache_invalidation_change_stream", 1 if mode == "change_stream" else 0)
+
+    async def _watch(self, db: AsyncIOMotorDatabase, position: Dict[str, object]):
+        user_fields = set(USER_FIELDS.values())
+        pipeline = [
+            {"$match": {
+                "ns.coll": {"$in": list(WATCHED_COLLECTIONS)},
+                "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+            }},
+            {"$project": {
+                "ns": 1,
+                "operationType": 1,
+                **{f"fullDocument.{field}": 1 for field in user_fields},
+                **{f"fullDocumentBeforeChange.{field}": 1 for field in user_fields}
+            }}
+        ]
+        options = {"full_document_before_change": "whenAvailable"} if self.pre_images else {}
+        resumed = position["token"] is not None
+        async with db.watch(pipeline, full_document="updateLookup", resume_after=position["token"], **options) as stream:
+            self._set_mode("change_stream")
+            logger.info("Invalidation bus following change stream (%s)", "resumed" if resumed else "from now")
+            while stream.alive:
+                change = await stream.try_next()
+                if stream.resume_token:
+                    position["token"] = stream.resume_token
+                if change is None:
+                    await asyncio.sleep(0.1)
+                    continue
+                collection = change["ns"]["coll"]
+                document = change.get("fullDocument") or change.get("fullDocumentBeforeChange") or {}
+                user_id = document.get(USER_FIELDS[collection])
+                if user_id is None:
+                    metrics.increment("cache_invalidation_unattributed", labels={"collection": collection})
+                    continue
+                self.dispatch(collection, user_id)
+
+    async def _poll(self, db: AsyncIOMotorDatabase):
+        """Fallback for standalone servers: scan recently stamped documents (deletes are not seen)"""
+        self._set_mode("polling")
+        since = {collection: datetime.utcnow() for collection in WATCHED_COLLECTIONS}
+        while True:
+            await asyncio.sleep(POLL_SECONDS)
+            for collection in WATCHED_COLLECTIONS:
+                user_field, poll_field = USER_FIELDS[collection], POLL_FIELDS[collection]
+                if poll_field == "_id":
+                    # ObjectIds of different clients are only ordered to the second
+                    bound = ObjectId.from_datetime(since[collection] - timedelta(seconds=1))
+                else:
+                    bound = since[collection]
+                cursor = db[collection].find(
+                    {poll_field: {"$gt": bound}},
+                    {"_id": 1, user_field: 1, poll_field: 1}
+                ).sort(poll_field, 1)
+                async for document in cursor:
+                    stamp = document[poll_field]
+                    if poll_field == "_id":
+                        stamp = stamp.generation_time.replace(tzinfo=None)
+                    since[collection] = max(since[collection], stamp)
+                    self.dispatch(collection, document.get(user_field))
+
+invalidation_bus = InvalidationBus(get_shard_databases)
@@ -1,38 +1,197 @@
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorDatabase
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List
+from sharding import ShardRouter, UserDatabase, configured_shards
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
-# MongoDB connection
+# Server codes for an index that exists with other options
+INDEX_CONFLICT_CODES = (85, 86)
+
+# MongoDB connection; client/database are the home shard (global collections)
 client = None
 database = None
+analytics_database = None
+shard_router = None
+
+# Analytics reads tolerate some lag, so they may go to secondaries.
+# MongoDB rejects maxStalenessSeconds below 90.
+ANALYTICS_READ_PREFERENCE = os.environ.get('ANALYTICS_READ_PREFERENCE', 'secondaryPreferred')
+ANALYTICS_MAX_STALENESS_SECONDS = int(os.environ.get('ANALYTICS_MAX_STALENESS_SECONDS', 90))
+CAUSAL_TOKENS_MAX_USERS = 10_000
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest
+}
+
+def build_read_preference(mode: str, max_staleness: int):
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {mode}")
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCES[mode](max_staleness=max_staleness)
 
 async def connect_to_mongo():
     """Create database connection"""
-    global client, database
+    global client, database, analytics_database, shard_router
     try:
-        mongo_url = os.environ.get('MONGO_URL')
         db_name = os.environ.get('DB_NAME', 'fitness_app')
+        max_pool_size = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+        min_pool_size = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
         
-        client = AsyncIOMotorClient(mongo_url)
-        database = client[db_name]
-        
-        # Test connection
-        await database.command("ping")
-        logger.info("Connected to MongoDB successfully")
+        # Connects (and pings) every shard
+        shard_router = ShardRouter(configured_shards())
+        await shard_router.connect(
+            db_name,
+            max_pool_size,
+            min_pool_size,
+            build_read_preference(ANALYTICS_READ_PREFERENCE, ANALYTICS_MAX_STALENESS_SECONDS)
+        )
+        home = shard_router.home
+        client, database, analytics_database = home.client, home.database, home.analytics_database
+        logger.info(
+            "Connected to MongoDB successfully (%s shards, pool %s-%s)",
+            len(shard_router.shards), min_pool_size, max_pool_size
+        )
         
     except Exception as e:
-        logger.error(f"Failed to connect to MongoDB: {str(e)}")
+        logger.error("Failed to connect to MongoDB: %s", e)
         raise
 
 async def close_mongo_connection():
     """Close database connection"""
-    global client
-    if client:
-        client.close()
+    if shard_router:
+        shard_router.close()
         logger.info("Disconnected from MongoDB")
 
+async def ensure_workout_day_index(db: AsyncIOMotorDatabase):
+    """One workout per user and day, so plans are upserted by day; replaces the older non-unique index"""
+    keys = [("userId", 1), ("date", 1)]
+    try:
+        await db.workouts.create_index(keys, unique=True)
+    except DuplicateKeyError as e:
+        logger.warning("Days booked twice in workouts, (userId, date) index left non-unique: %s", e)
+        await db.workouts.create_index(keys)
+    except OperationFailure as e:
+        if e.code not in INDEX_CONFLICT_CODES:
+            raise
+        await db.workouts.drop_index(keys)
+        await ensure_workout_day_index(db)
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    """Create the indexes the API queries rely on (no-op when they exist)"""
+    await db.users.create_index("id", unique=True)
+    await db.users.create_index("email", unique=True)
+    await db.workouts.create_index("id", unique=True)
+    await ensure_workout_day_index(db)
+    await db.workouts.create_index([("userId", 1), ("status", 1)])
+    await db.workouts.create_index([("status", 1), ("date", 1)])
+    await db.users.create_index("lastWorkoutAt", sparse=True)
+    await db.users.create_index("updatedAt")
+    await db.workouts.create_index("updatedAt")
+    await db.workouts.create_index("archiveBatch", sparse=True)
+    await db.workouts.create_index([("userId", 1), ("updatedAt", 1), ("id", 1)])
+    await db.workouts_archive.create_index("id", unique=True)
+    await db.workouts_archive.create_index([("userId", 1), ("date", 1)])
+    await db.workouts_archive.create_index([("userId", 1), ("updatedAt", 1), ("id", 1)])
+    await db.workout_tombstones.create_index([("userId", 1), ("updatedAt", 1), ("id", 1)])
+    await db.workout_tombstones.create_index("expiresAt", expireAfterSeconds=0)
+    await db.refresh_tokens.create_index("tokenHash", unique=True)
+    await db.refresh_tokens.create_index("expiresAt", expireAfterSeconds=0)
+    await db.revoked_tokens.create_index("jti", unique=True)
+    await db.revoked_tokens.create_index("expiresAt", expireAfterSeconds=0)
+    await db.revoked_tokens.create_index("revokedAt")
+    await db.leaderboard_weekly.create_index([("week", 1), ("userId", 1)], unique=True)
+    await db.leaderboard_weekly.create_index([("week", 1), ("volume", -1)])
+    await db.leaderboard_ranks.create_index([("week", 1), ("node", 1)], unique=True)
+    await db.set_logs.create_index([("userId", 1), ("completedAt", 1)])
+    try:
+        # Lets the invalidation bus attribute set log deletes to their user (cache_bus.py)
+        await db.command("collMod", "set_logs", changeStreamPreAndPostImages={"enabled": True})
+    except OperationFailure as e:
+        logger.info("Change stream pre-images not enabled on set_logs: %s", e)
+    await db.coach_links.create_index([("coachId", 1), ("athleteId", 1)], unique=True)
+    await db.coach_links.create_index("athleteId")
+    await db.coach_invites.create_index("code", unique=True)
+    await db.coach_invites.create_index("expiresAt", expireAfterSeconds=0)
+    await db.idempotency_keys.create_index("expiresAt", expireAfterSeconds=0)
+    await db.shard_overrides.create_index("updatedAt")
+    await db.shard_overrides.create_index("expiresAt", expireAfterSeconds=0)
+
+    # Documents written before updatedAt was stamped: delta sync orders by it
+    now = datetime.utcnow()
+    for collection in ("users", "workouts", "workouts_archive"):
+        await db[collection].update_many({"updatedAt": {"$exists": False}}, {"$set": {"updatedAt": now}})
+
 def get_database() -> AsyncIOMotorDatabase:
-    """Get database instance"""
-    return database
\ No newline at end of file
+    """Get database instance (home shard: global collections only)"""
+    return database
+
+def get_analytics_database() -> AsyncIOMotorDatabase:
+    """Home shard handle for read-heavy analytics, routed by ANALYTICS_READ_PREFERENCE"""
+    return analytics_database
+
+def get_user_database(user_id: str, analytics: bool = False) -> UserDatabase:
+    """Database handle for one user: their shard for user-owned collections, home for the rest"""
+    return shard_router.user_database(user_id, analytics)
+
+def get_shard_databases() -> List[AsyncIOMotorDatabase]:
+    """Every shard's database, home first, for cross-user jobs"""
+    return [shard.database for shard in shard_router.shards.values()]
+
+def get_shard_router() -> ShardRouter:
+    return shard_router
+
+class CausalTokens:
+    """
+    Last operation and cluster time seen per user.
+
+    A user's reads may be served by a lagging secondary. Starting the read's
+    session from the time of the user's last write makes the secondary wait
+    until it has applied that write, so users always see their own updates.
+    Tokens are kept per process and per client (operation times of one shard
+    mean nothing to another); at worst a read on another worker is as stale as
+    the read preference allows.
+    """
+
+    def __init__(self, max_users: int = CAUSAL_TOKENS_MAX_USERS):
+        self.max_users = max_users
+        self._tokens: OrderedDict = OrderedDict()
+
+    def record(self, key, session: AsyncIOMotorClientSession):
+        if session.operation_time is None:
+            return  # Standalone servers do not report operation times
+        self._tokens[key] = (session.operation_time, session.cluster_time)
+        self._tokens.move_to_end(key)
+        while len(self._tokens) > self.max_users:
+            self._tokens.popitem(last=False)
+
+    def apply(self, key, session: AsyncIOMotorClientSession):
+        token = self._tokens.get(key)
+        if token is None:
+            return
+        operation_time, cluster_time = token
+        session.advance_operation_time(operation_time)
+        if cluster_time is not None:
+            session.advance_cluster_time(cluster_time)
+
+causal_tokens = CausalTokens()
+
+@asynccontextmanager
+async def causal_session(user_id: str, db: AsyncIOMotorDatabase):
+    """Causally consistent session on `db`'s client that continues from the user's last write there"""
+    key = (id(db.client), user_id)
+    async with await db.client.start_session(causal_consistency=True) as session:
+        causal_tokens.apply(key, session)
+        yield session
+        causal_tokens.record(key, session)
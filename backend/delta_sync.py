@@ -0,0 +1,112 @@
+"""
+Delta sync for offline-first clients.
+
+Changes are read in (updatedAt, id) order from `workouts`, from
+`workouts_archive` (archiving keeps updatedAt, so a full sync or reset returns
+archived history and later syncs skip it) and from `workout_tombstones`, which
+records deleted workout ids. All three are indexed on (userId, updatedAt, id),
+so a sync reads only what changed after the client's cursor. The cursor is an
+opaque encoding of the last (updatedAt, id) delivered.
+
+Workers stamp updatedAt with their own clock, so a write can land slightly
+behind one already delivered. The final cursor of a sync therefore never goes
+past now - SYNC_SKEW_SECONDS: the last few seconds are delivered again on the
+next sync (clients upsert by id) rather than risk being skipped.
+
+Tombstones expire after SYNC_TOMBSTONE_DAYS. A cursor older than that can no
+longer be served incrementally, so the client is told to reset and gets a
+full sync.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import base64
+import binascii
+import json
+import os
+
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', 30))
+SYNC_SKEW_SECONDS = 5
+
+EPOCH = datetime(1970, 1, 1)
+
+# (updatedAt in milliseconds, id): MongoDB stores dates with millisecond precision
+Position = Tuple[int, str]
+
+def to_millis(moment: datetime) -> int:
+    return (moment - EPOCH) // timedelta(milliseconds=1)
+
+def from_millis(millis: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=millis)
+
+def encode_cursor(position: Position) -> str:
+    raw = json.dumps({"t": position[0], "i": position[1]}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Position:
+    """Raises ValueError for anything encode_cursor did not produce"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        position = (data["t"], data["i"])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise ValueError("invalid sync cursor")
+    if type(position[0]) is not int or type(position[1]) is not str:
+        raise ValueError("invalid sync cursor")
+    return position
+
+def tombstones_cover(position: Position) -> bool:
+    """Whether every deletion after `position` still has its tombstone"""
+    return from_millis(position[0]) >= datetime.utcnow() - timedelta(days=SYNC_TOMBSTONE_DAYS)
+
+def _after(position: Optional[Position]) -> Dict:
+    if position is None:
+        return {}
+    moment = from_millis(position[0])
+    return {"$or": [{"updatedAt": {"$gt": moment}}, {"updatedAt": moment, "id": {"$gt": position[1]}}]}
+
+async def record_deletions(db: AsyncIOMotorDatabase, user_id: str, workout_ids: Iterable[str]):
+    """Leave tombstones for deleted workouts so syncing clients drop them too"""
+    now = datetime.utcnow()
+    tombstones = [
+        {"id": workout_id, "userId": user_id, "updatedAt": now, "expiresAt": now + timedelta(days=SYNC_TOMBSTONE_DAYS)}
+        for workout_id in workout_ids
+    ]
+    if tombstones:
+        await db.workout_tombstones.insert_many(tombstones)
+
+async def changes_since(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    position: Optional[Position],
+    limit: int
+) -> Tuple[List[Dict], List[str], Position, bool]:
+    """Changed workouts, deleted ids, the next position and whether more changes remain"""
+    query = {"userId": user_id, **_after(position)}
+    order = [("updatedAt", 1), ("id", 1)]
+    workouts = {}
+    for collection in ("workouts_archive", "workouts"):
+        # A workout caught between copy and delete by the archive job is in both: either copy will do
+        async for doc in db[collection].find(query, {"_id": 0, "archiveBatch": 0}).sort(order).limit(limit + 1):
+            workouts[doc["id"]] = doc
+    tombstones = await db.workout_tombstones.find(query, {"_id": 0, "id": 1, "updatedAt": 1}) \
+        .sort(order).limit(limit + 1).to_list(limit + 1)
+
+    changes = sorted(
+        [(to_millis(doc.get("updatedAt") or EPOCH), doc["id"], doc) for doc in workouts.values()] +
+        [(to_millis(doc["updatedAt"]), doc["id"], None) for doc in tombstones],
+        key=lambda change: change[:2]
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    next_position = changes[-1][:2] if changes else position
+    if not has_more:
+        settled = (to_millis(datetime.utcnow() - timedelta(seconds=SYNC_SKEW_SECONDS)), "")
+        next_position = settled if next_position is None else min(next_position, settled)
+
+    return (
+        [doc for _, _, doc in changes if doc is not None],
+        [workout_id for _, workout_id, doc in changes if doc is None],
+        next_position,
+        has_more
+    )
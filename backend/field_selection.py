@@ -0,0 +1,77 @@
+"""
+Sparse field selection (`?fields=id,name,status`) for read endpoints.
+
+`field_selection(Model)` is a dependency that validates the requested names
+against the response model (400 on unknown ones) and yields a FieldSelection.
+The selection gives routes a Mongo projection, so only the requested fields
+are read and decoded, and renders documents through a model trimmed to those
+fields. Without `fields` the selection is empty and routes respond as before.
+"""
+from fastapi import HTTPException, Query
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, create_model
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Type, Union
+
+@lru_cache(maxsize=256)
+def trimmed_model(model: Type[BaseModel], fields: FrozenSet[str]) -> Type[BaseModel]:
+    """`model` restricted to `fields`, keeping their types and defaults"""
+    return create_model(
+        f"{model.__name__}Fields",
+        **{
+            name: (info.annotation, info)
+            for name, info in model.model_fields.items()
+            if name in fields
+        }
+    )
+
+class FieldSelection:
+    def __init__(self, model: Type[BaseModel], fields: Optional[FrozenSet[str]] = None):
+        self.model = model
+        self.fields = fields
+
+    @property
+    def selected(self) -> bool:
+        return self.fields is not None
+
+    def includes(self, *names: str) -> bool:
+        """Whether any of `names` is part of the response"""
+        return self.fields is None or any(name in self.fields for name in names)
+
+    def projection(self, always: Iterable[str] = ()) -> Optional[Dict]:
+        """Mongo projection for the selected fields (None reads whole documents)"""
+        if self.fields is None:
+            return None
+        return {"_id": 0, **{name: 1 for name in (*self.fields, *always)}}
+
+    def render(self, content: Union[Dict, BaseModel, List]) -> JSONResponse:
+        """Serialize documents or models with the trimmed model"""
+        model = trimmed_model(self.model, self.fields)
+
+        def dump(item) -> Dict:
+            if isinstance(item, BaseModel):
+                item = item.model_dump()
+            return model(**item).model_dump(mode="json")
+
+        if isinstance(content, list):
+            return JSONResponse([dump(item) for item in content])
+        return JSONResponse(dump(content))
+
+def field_selection(model: Type[BaseModel]):
+    """Dependency parsing `fields` for responses of `model`"""
+    allowed = ", ".join(model.model_fields)
+
+    def dependency(
+        fields: Optional[str] = Query(None, description=f"Campos da resposta, separados por vírgula: {allowed}")
+    ) -> FieldSelection:
+        if fields is None:
+            return FieldSelection(model)
+        names = frozenset(name.strip() for name in fields.split(",") if name.strip())
+        unknown = sorted(names - model.model_fields.keys())
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Campos inválidos: {', '.join(unknown)}")
+        if not names:
+            raise HTTPException(status_code=400, detail="Nenhum campo informado")
+        return FieldSelection(model, names)
+
+    return dependency
@@ -0,0 +1,126 @@
+"""
+Byte-bounded in-process cache of recent set history per user.
+
+Analytics endpoints read the same active users' histories over and over. The
+cache keeps each history as the compact columns of `analytics.SetHistory`
+(about 12 bytes per set) and evicts least recently used users once the total
+size exceeds HISTORY_CACHE_MAX_BYTES, so memory stays bounded however large
+individual histories are.
+
+Entries are dropped when the user completes a set in this worker, and when the
+invalidation bus reports a change to the user's workouts or set logs from any
+worker. Everything is dropped only when the bus has lost track of changes.
+"""
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+import os
+import logging
+
+import metrics
+from analytics import SetHistory
+from cache_bus import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+HISTORY_CACHE_MAX_BYTES = int(os.environ.get('HISTORY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Rough cost of the dict entry, dataclass and array headers
+ENTRY_OVERHEAD_BYTES = 512
+NAME_OVERHEAD_BYTES = 64
+
+def history_size(history: SetHistory) -> int:
+    names = sum(len(name.encode('utf-8')) + NAME_OVERHEAD_BYTES for name in history.exercises)
+    return history.nbytes + names + ENTRY_OVERHEAD_BYTES
+
+class HistoryCache:
+    def __init__(self, max_bytes: int = HISTORY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()  # user_id -> (history, size)
+        # Loads in flight; an invalidation during a load drops its token so the stale result is not stored
+        self._loading: Dict[str, object] = {}
+
+    def get(self, user_id: str) -> Optional[SetHistory]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            self._report()
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        self._report()
+        return entry[0]
+
+    async def get_or_load(self, user_id: str, loader: Callable[[], Awaitable[SetHistory]]) -> SetHistory:
+        history = self.get(user_id)
+        if history is not None:
+            return history
+
+        token = object()
+        self._loading[user_id] = token
+        try:
+            history = await loader()
+        finally:
+            current = self._loading.pop(user_id, None)
+        if current is token:
+            self.put(user_id, history)
+        elif current is not None:
+            # A newer load for the same user is still running
+            self._loading[user_id] = current
+        return history
+
+    def put(self, user_id: str, history: SetHistory):
+        size = history_size(history)
+        self._remove(user_id)
+        if size > self.max_bytes:
+            return  # Never cache a history larger than the whole budget
+        self._entries[user_id] = (history, size)
+        self.resident_bytes += size
+        while self.resident_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.resident_bytes -= evicted_size
+            metrics.increment("history_cache_evictions")
+        self._report()
+
+    def invalidate(self, user_id: str):
+        self._loading.pop(user_id, None)
+        if self._remove(user_id):
+            self._report()
+
+    def clear(self):
+        self._loading.clear()
+        self._entries.clear()
+        self.resident_bytes = 0
+        self._report()
+
+    def on_change(self, collection: str, user_id: Optional[str]):
+        """invalidation_bus subscriber: set history changes along with the workout and its set logs"""
+        if collection not in ("workouts", "set_logs"):
+            return
+        if user_id is None:
+            self.clear()
+        else:
+            self.invalidate(user_id)
+
+    def _remove(self, user_id: str) -> bool:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return False
+        self.resident_bytes -= entry[1]
+        return True
+
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _report(self):
+        metrics.set_gauge("history_cache_bytes", self.resident_bytes)
+        metrics.set_gauge("history_cache_entries", len(self._entries))
+        metrics.set_gauge("history_cache_hit_ratio", round(self.hit_ratio(), 4))
+
+    def __len__(self):
+        return len(self._entries)
+
+history_cache = HistoryCache()
+invalidation_bus.subscribe(history_cache.on_change)
@@ -0,0 +1,261 @@
+"""
+Maintenance jobs run by the in-process scheduler.
+
+These used to happen inside request handlers (or not at all). Moving them
+here keeps GET paths read-only.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from datetime import datetime, timedelta
+import os
+import logging
+
+from database import get_database, get_shard_databases, get_shard_router
+from scheduler import Scheduler
+from auth.revocation import revocation_list, REVOCATION_SYNC_SECONDS
+from leaderboard import week_key, rebuild_week
+from sharding import OVERRIDE_SYNC_SECONDS, UserDatabase
+from archive import archive_workouts
+from analytics import workout_set_logs
+from routes.workouts import PLAN_HORIZON_DAYS, extend_plan, start_of_day, stored_split
+
+logger = logging.getLogger(__name__)
+
+STREAK_GRACE_HOURS = int(os.environ.get('STREAK_GRACE_HOURS', 48))
+BULK_BATCH_SIZE = 1000
+# Completed workouts already moved to the archive (see archive.py)
+ARCHIVED_WORKOUTS = {"$ifNull": ["$archived.workouts", 0]}
+
+async def _bulk_update(collection, operations: list):
+    """Flush a list of UpdateOne operations in unordered batches"""
+    for start in range(0, len(operations), BULK_BATCH_SIZE):
+        await collection.bulk_write(operations[start:start + BULK_BATCH_SIZE], ordered=False)
+
+async def reconcile_user_rollups(db: AsyncIOMotorDatabase):
+    """Recompute users.totalWorkouts from the completed workouts on every shard, plus the archived ones"""
+    started = datetime.utcnow()
+    corrected = 0
+
+    for shard_db in get_shard_databases():
+        operations = []
+        async for row in shard_db.workouts.aggregate([
+            {"$match": {"status": "completed"}},
+            {"$group": {"_id": "$userId", "completed": {"$sum": 1}}}
+        ], allowDiskUse=True):
+            operations.append(UpdateOne(
+                {"id": row["_id"]},
+                [{"$set": {
+                    "totalWorkouts": {"$add": [row["completed"], ARCHIVED_WORKOUTS]},
+                    "rollupsReconciledAt": started,
+                    "updatedAt": started
+                }}]
+            ))
+            if len(operations) >= BULK_BATCH_SIZE:
+                await _bulk_update(db.users, operations)
+                corrected += len(operations)
+                operations = []
+        if operations:
+            await _bulk_update(db.users, operations)
+            corrected += len(operations)
+
+    # Users with a count but no completed workouts left in the hot collection
+    reset = await db.users.update_many(
+        {
+            "totalWorkouts": {"$gt": 0},
+            "$or": [{"rollupsReconciledAt": {"$lt": started}}, {"rollupsReconciledAt": {"$exists": False}}]
+        },
+        [{"$set": {"totalWorkouts": ARCHIVED_WORKOUTS, "rollupsReconciledAt": started, "updatedAt": started}}]
+    )
+    logger.info("Reconciled rollups for %s users, reset %s", corrected, reset.modified_count)
+
+async def backfill_last_workout(db: AsyncIOMotorDatabase) -> int:
+    """Set lastWorkoutAt on streak holders who completed workouts before it was recorded.
+
+    It is taken from their latest completed workout, archived ones included;
+    users without any get their registration time, so their streak expires.
+    """
+    backfilled = 0
+    while True:
+        users = await db.users.find(
+            {"streak": {"$gt": 0}, "lastWorkoutAt": {"$exists": False}}, {"_id": 0, "id": 1, "createdAt": 1}
+        ).limit(BULK_BATCH_SIZE).to_list(BULK_BATCH_SIZE)
+        if not users:
+            return backfilled
+
+        latest = {}
+        shards = get_shard_router().shards
+        for shard_name, user_ids in get_shard_router().group_by_shard(user["id"] for user in users).items():
+            shard_db = shards[shard_name].database
+            for collection in ("workouts", "workouts_archive"):
+                async for row in shard_db[collection].aggregate([
+                    {"$match": {"userId": {"$in": user_ids}, "status": "completed"}},
+                    {"$group": {"_id": "$userId", "last": {"$max": {"$ifNull": ["$completedAt", "$date"]}}}}
+                ]):
+                    latest[row["_id"]] = max(row["last"], latest.get(row["_id"], row["last"]))
+
+        now = datetime.utcnow()
+        await _bulk_update(db.users, [
+            UpdateOne(
+                {"id": user["id"], "lastWorkoutAt": {"$exists": False}},
+                {"$set": {"lastWorkoutAt": latest.get(user["id"]) or user.get("createdAt") or now, "updatedAt": now}}
+            )
+            for user in users
+        ])
+        backfilled += len(users)
+
+async def expire_streaks(db: AsyncIOMotorDatabase):
+    """Reset streaks of users who have not completed a workout within the grace period"""
+    backfilled = await backfill_last_workout(db)
+    if backfilled:
+        logger.info("Backfilled lastWorkoutAt for %s users", backfilled)
+    cutoff = datetime.utcnow() - timedelta(hours=STREAK_GRACE_HOURS)
+    result = await db.users.update_many(
+        {"streak": {"$gt": 0}, "lastWorkoutAt": {"$lt": cutoff}},
+        {"$set": {"streak": 0, "updatedAt": datetime.utcnow()}}
+    )
+    if result.modified_count:
+        logger.info("Expired %s streaks", result.modified_count)
+
+async def advance_stale_workouts(db: AsyncIOMotorDatabase):
+    """Skip unfinished workouts from previous days and activate today's (on one shard)"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow = today + timedelta(days=1)
+
+    # Users moving between shards are caught up on the next run
+    settled = {"$nin": get_shard_router().moving_users()}
+
+    skipped = await db.workouts.update_many(
+        {"status": {"$in": ["active", "pending"]}, "date": {"$lt": today}, "userId": settled},
+        {"$set": {"status": "skipped", "updatedAt": datetime.utcnow()}, "$inc": {"version": 1}}
+    )
+    activated = await db.workouts.update_many(
+        {"status": "pending", "date": {"$gte": today, "$lt": tomorrow}, "userId": settled},
+        {"$set": {"status": "active", "updatedAt": datetime.utcnow()}, "$inc": {"version": 1}}
+    )
+
+    if skipped.modified_count or activated.modified_count:
+        logger.info("Skipped %s stale workouts, activated %s", skipped.modified_count, activated.modified_count)
+
+async def advance_all_stale_workouts():
+    for shard_db in get_shard_databases():
+        await advance_stale_workouts(shard_db)
+
+async def extend_plans(shard_name: str, shard_db: AsyncIOMotorDatabase, home_db: AsyncIOMotorDatabase) -> int:
+    """Extend the plans running out on one shard, with each user's stored split"""
+    router = get_shard_router()
+    horizon = start_of_day() + timedelta(days=PLAN_HORIZON_DAYS)
+    # Workouts on this shard, users (and their planEndsAt) on home
+    db = UserDatabase(home_db, shard_db, shard_name)
+    extended = 0
+
+    async def flush(latest: dict):
+        nonlocal extended
+        users = await home_db.users.find(
+            {"id": {"$in": list(latest)}}, {"_id": 0, "id": 1, "planSplit": 1}
+        ).to_list(None)
+        for user in users:
+            if await extend_plan(db, user["id"], stored_split(user), latest[user["id"]]):
+                extended += 1
+
+    latest = {}
+    async for row in shard_db.workouts.aggregate([
+        {"$group": {"_id": "$userId", "latest": {"$max": "$date"}}},
+        {"$match": {"latest": {"$lt": horizon}}}
+    ], allowDiskUse=True):
+        # Leftovers of users moved to another shard belong to that shard's run
+        if router.shard_name(row["_id"]) != shard_name or router.is_moving(row["_id"]):
+            continue
+        latest[row["_id"]] = row["latest"]
+        if len(latest) >= BULK_BATCH_SIZE:
+            await flush(latest)
+            latest = {}
+    if latest:
+        await flush(latest)
+    return extended
+
+async def extend_all_plans():
+    """Keep every user's plan scheduled PLAN_HORIZON_DAYS ahead, on every shard"""
+    home = get_database()
+    for name, shard in get_shard_router().shards.items():
+        extended = await extend_plans(name, shard.database, home)
+        if extended:
+            logger.info("Extended %s training plans", extended)
+
+async def _log_missing_sets(shard_db: AsyncIOMotorDatabase, workouts: list) -> int:
+    logged = set(await shard_db.set_logs.distinct("workoutId", {
+        "userId": {"$in": list({workout["userId"] for workout in workouts})},
+        "workoutId": {"$in": [workout["id"] for workout in workouts]}
+    }))
+    set_logs = [log for workout in workouts if workout["id"] not in logged for log in workout_set_logs(workout)]
+    if set_logs:
+        await shard_db.set_logs.insert_many(set_logs, ordered=False)
+    return len(set_logs)
+
+async def backfill_set_logs(shard_db: AsyncIOMotorDatabase) -> int:
+    """Derive set logs for the workouts trained before sets were logged (once per shard)"""
+    if await shard_db.migrations.find_one({"_id": "set_logs_backfill"}):
+        return 0
+    # Derived logs keep old timestamps, which a shard move's final copy would miss: retried next time
+    if get_shard_router().moving_users():
+        logger.info("Set log backfill postponed while users move between shards")
+        return 0
+    created = 0
+    # Hot and archived workouts with any set done; those already logged are skipped, so a rerun resumes
+    for collection in ("workouts_archive", "workouts"):
+        batch = []
+        async for workout in shard_db[collection].find(
+            {"exercises.completedSets": {"$gt": 0}}, {"_id": 0}
+        ).batch_size(BULK_BATCH_SIZE):
+            batch.append(workout)
+            if len(batch) >= BULK_BATCH_SIZE:
+                created += await _log_missing_sets(shard_db, batch)
+                batch = []
+        if batch:
+            created += await _log_missing_sets(shard_db, batch)
+    await shard_db.migrations.insert_one({"_id": "set_logs_backfill", "completedAt": datetime.utcnow(), "setLogs": created})
+    return created
+
+async def backfill_all_set_logs():
+    for shard_db in get_shard_databases():
+        created = await backfill_set_logs(shard_db)
+        if created:
+            logger.info("Backfilled %s set logs", created)
+
+async def archive_all_workouts():
+    """Move old completed workouts to the archive on every shard"""
+    home = get_database()
+    for shard_db in get_shard_databases():
+        archived = await archive_workouts(shard_db, home)
+        if archived:
+            logger.info("Archived %s workouts", archived)
+
+async def rebuild_leaderboards(db: AsyncIOMotorDatabase):
+    """Rebuild the current and previous week's leaderboard buckets"""
+    now = datetime.utcnow()
+    for week in (week_key(now - timedelta(days=7)), week_key(now)):
+        await rebuild_week(db, week, get_shard_databases())
+
+def build_scheduler() -> Scheduler:
+    scheduler = Scheduler(get_database)
+
+    # Every worker keeps its own revocation list in sync
+    scheduler.interval(
+        "revocation_sync", REVOCATION_SYNC_SECONDS,
+        lambda: revocation_list.refresh(get_database()), leader_only=False
+    )
+    # ...and its view of users pinned to (or moving between) shards
+    scheduler.interval(
+        "shard_overrides_sync", OVERRIDE_SYNC_SECONDS,
+        lambda: get_shard_router().refresh_overrides(), leader_only=False
+    )
+
+    # Deployment-wide maintenance runs on the leader only
+    scheduler.cron("reconcile_user_rollups", "30 3 * * *", lambda: reconcile_user_rollups(get_database()), jitter=60)
+    scheduler.cron("rebuild_leaderboards", "0 4 * * *", lambda: rebuild_leaderboards(get_database()), jitter=60)
+    scheduler.interval("expire_streaks", 3600, lambda: expire_streaks(get_database()), jitter=60)
+    scheduler.interval("advance_stale_workouts", 900, advance_all_stale_workouts, jitter=30)
+    scheduler.interval("extend_plans", 6 * 3600, extend_all_plans, jitter=60)
+    scheduler.cron("archive_workouts", "0 5 * * *", archive_all_workouts, jitter=60)
+    # One-off per shard, retried daily until it has finished
+    scheduler.interval("backfill_set_logs", 24 * 3600, backfill_all_set_logs, jitter=60)
+    return scheduler
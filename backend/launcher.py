@@ -0,0 +1,261 @@
+"""
+Pre-forking production launcher.
+
+Binds the listening socket once, imports the app in the master process and
+forks one uvicorn worker per core, so module imports and static catalogs are
+shared copy-on-write. Each worker gets an even share of the MongoDB connection
+budget.
+
+Signals handled by the master:
+    SIGHUP          rolling restart, one worker at a time, each replacement
+                    must report ready before the old worker is stopped
+    SIGTERM/SIGINT  graceful shutdown of every worker
+
+With preload enabled, a rolling restart recycles workers but keeps the code
+loaded in the master; use --no-preload when restarts must pick up new code.
+
+Usage:
+    python launcher.py --workers 4 --port 8001
+"""
+import argparse
+import gc
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import logging
+
+from logging_config import setup_logging
+
+logger = logging.getLogger("launcher")
+
+DEFAULT_POOL_BUDGET = 100
+READY_TIMEOUT = 30
+GRACEFUL_TIMEOUT = 30
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fitness App API launcher")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8001)))
+    parser.add_argument(
+        "--workers", type=int,
+        default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        help="Number of worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--pool-budget", type=int,
+        default=int(os.environ.get("MONGO_POOL_BUDGET", DEFAULT_POOL_BUDGET)),
+        help="Total MongoDB connections shared by all workers"
+    )
+    parser.add_argument(
+        "--min-pool-budget", type=int,
+        default=int(os.environ.get("MONGO_MIN_POOL_BUDGET", 0)),
+        help="Total warm MongoDB connections shared by all workers"
+    )
+    parser.add_argument("--ready-timeout", type=float, default=READY_TIMEOUT)
+    parser.add_argument("--graceful-timeout", type=float, default=GRACEFUL_TIMEOUT)
+    parser.add_argument("--no-preload", dest="preload", action="store_false")
+    return parser.parse_args(argv)
+
+def load_app():
+    """Import the ASGI app"""
+    from server import app
+    return app
+
+def calibrate():
+    """Calibrate bcrypt once in the master, so workers do not (a stored deployment cost still wins)"""
+    from auth.password import calibrate_rounds
+    calibrate_rounds()
+
+class Launcher:
+    def __init__(self, args):
+        self.args = args
+        self.workers = {}  # pid -> readiness pipe fd
+        self.app = None
+        self.sock = None
+        self.stopping = False
+        self.reload_requested = False
+
+    # Worker side
+
+    def run_worker(self, ready_fd: int):
+        """Serve requests in a forked child until told to exit"""
+        import asyncio
+        import uvicorn
+
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+
+        workers = max(self.args.workers, 1)
+        os.environ["MONGO_MAX_POOL_SIZE"] = str(max(self.args.pool_budget // workers, 1))
+        os.environ["MONGO_MIN_POOL_SIZE"] = str(self.args.min_pool_budget // workers)
+
+        app = self.app if self.app is not None else load_app()
+        server = uvicorn.Server(uvicorn.Config(app, lifespan="on", log_config=None))
+
+        async def serve():
+            task = asyncio.create_task(server.serve(sockets=[self.sock]))
+            while not server.started and not task.done():
+                await asyncio.sleep(0.05)
+            if server.started:
+                os.write(ready_fd, b"1")
+            os.close(ready_fd)
+            await task
+
+        asyncio.run(serve())
+        return 0 if server.started else 1
+
+    # Master side
+
+    def spawn_worker(self) -> int:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 1
+            try:
+                code = self.run_worker(write_fd)
+            except Exception as e:
+                logger.error("Worker %s crashed: %s", os.getpid(), e)
+            finally:
+                os._exit(code)
+
+        os.close(write_fd)
+        self.workers[pid] = read_fd
+        logger.info("Spawned worker %s", pid)
+        return pid
+
+    def wait_ready(self, pid: int) -> bool:
+        """Block until the worker finishes its startup hooks or fails"""
+        fd = self.workers.get(pid)
+        if fd is None:
+            return False
+        readable, _, _ = select.select([fd], [], [], self.args.ready_timeout)
+        ready = bool(readable) and os.read(fd, 1) == b"1"
+        if ready:
+            logger.info("Worker %s ready", pid)
+        else:
+            logger.error("Worker %s did not become ready", pid)
+        return ready
+
+    def stop_worker(self, pid: int, sig=signal.SIGTERM):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def wait_exit(self, pid: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done == pid:
+                self.forget(pid)
+                return True
+            time.sleep(0.1)
+        return False
+
+    def forget(self, pid: int):
+        fd = self.workers.pop(pid, None)
+        if fd is not None:
+            os.close(fd)
+
+    def rolling_restart(self):
+        """Replace workers one at a time, keeping capacity during the restart"""
+        logger.info("Rolling restart started")
+        for old_pid in list(self.workers):
+            if self.stopping:
+                return
+            new_pid = self.spawn_worker()
+            if not self.wait_ready(new_pid):
+                logger.error("Rolling restart aborted, keeping remaining workers")
+                self.stop_worker(new_pid, signal.SIGKILL)
+                self.wait_exit(new_pid, self.args.graceful_timeout)
+                return
+            self.stop_worker(old_pid)
+            if not self.wait_exit(old_pid, self.args.graceful_timeout):
+                self.stop_worker(old_pid, signal.SIGKILL)
+                self.wait_exit(old_pid, self.args.graceful_timeout)
+        logger.info("Rolling restart finished")
+
+    def reap(self):
+        """Collect exited workers and replace the ones that died unexpectedly"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid not in self.workers:
+                continue
+            self.forget(pid)
+            if not self.stopping:
+                logger.warning("Worker %s exited with status %s, respawning", pid, status)
+                if not self.wait_ready(self.spawn_worker()):
+                    time.sleep(1)
+
+    def shutdown(self):
+        logger.info("Shutting down workers")
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+        deadline = time.monotonic() + self.args.graceful_timeout
+        for pid in list(self.workers):
+            if not self.wait_exit(pid, max(deadline - time.monotonic(), 0)):
+                self.stop_worker(pid, signal.SIGKILL)
+                self.wait_exit(pid, 5)
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def run(self) -> int:
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.args.host, self.args.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+
+        if self.args.preload:
+            self.app = load_app()
+            calibrate()
+            # Keep preloaded objects out of the GC's reach so collections in the
+            # workers do not touch (and copy) the shared pages
+            gc.collect()
+            gc.freeze()
+
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+
+        workers = max(self.args.workers, 1)
+        logger.info(
+            "Starting %s workers on %s:%s (pool %s per worker, preload=%s)",
+            workers, self.args.host, self.args.port, self.args.pool_budget // workers, self.args.preload
+        )
+        for _ in range(workers):
+            self.wait_ready(self.spawn_worker())
+
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+            self.reap()
+            time.sleep(0.5)
+
+        self.shutdown()
+        self.sock.close()
+        return 0
+
+def main(argv=None) -> int:
+    setup_logging()
+    return Launcher(parse_args(argv)).run()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+"""
+Weekly volume leaderboard.
+
+`leaderboard_weekly` holds one document per (week, user) with the training
+volume completed that week and the workouts it came from. It is maintained
+incrementally from the workout-completion path and indexed on
+(week, volume desc), so top-N is an index scan of N entries.
+
+Ranks come from `leaderboard_ranks`, a Fenwick tree (binary indexed tree) of
+user counts per volume bucket, one document per tree node and week. Buckets
+are geometric (about 0.1% wide), so a user's rank is
+1 + (users in higher buckets: O(log B) node reads)
+  + (users in their own bucket with more volume: an index count over that
+    0.1% slice). Every change of a bucket document's volume moves one user
+between buckets and updates O(log B) nodes with $inc.
+
+Workout entries make live updates idempotent (a workout is added once) and let
+the rebuild job run against live traffic: it recomputes each user's entries
+from the completed workouts, keeps live entries too recent for its snapshot,
+and replaces a document only if its `rev` is unchanged since it was read,
+retrying otherwise. Run a rebuild (e.g. after a backfill or import) with:
+
+    python leaderboard.py --week 2026-W42
+
+bench/leaderboard_ranks.py measures rank queries and live updates.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+from archive import reaches_archive
+
+logger = logging.getLogger(__name__)
+
+REBUILD_BATCH_SIZE = 1000
+# Live entries this close to (or after) the rebuild's start may be missing from its snapshot
+REBUILD_MARGIN = timedelta(minutes=10)
+REBUILD_ATTEMPTS = 5
+
+# Bucket upper bounds: 16384 geometric buckets from 1 to 1e8 of volume, plus one above
+BUCKET_BOUNDS = [1e8 ** (i / 16384) for i in range(16385)]
+TREE_SIZE = len(BUCKET_BOUNDS) + 1
+
+def week_key(moment: Optional[datetime] = None) -> str:
+    """ISO week label, e.g. '2026-W42'"""
+    year, week, _ = (moment or datetime.utcnow()).isocalendar()
+    return f"{year}-W{week:02d}"
+
+def week_bounds(week: str) -> Tuple[datetime, datetime]:
+    """Start (inclusive) and end (exclusive) of an ISO week label"""
+    year, number = week.split("-W")
+    start = datetime.fromisocalendar(int(year), int(number), 1)
+    return start, start + timedelta(days=7)
+
+def workout_volume(workout: Dict) -> float:
+    """Sets x reps x weight over the completed exercises of a workout"""
+    return sum(
+        exercise["sets"] * exercise["reps"] * exercise["weight"]
+        for exercise in workout["exercises"]
+        if exercise["completed"]
+    )
+
+def volume_bucket(volume: float) -> int:
+    """Bucket b holds volumes in [BUCKET_BOUNDS[b - 1], BUCKET_BOUNDS[b])"""
+    return bisect_right(BUCKET_BOUNDS, volume)
+
+def _tree_index(bucket: int) -> int:
+    # Highest bucket first, so "users in higher buckets" is a prefix sum
+    return TREE_SIZE - bucket
+
+def tree_updates(deltas: Dict[int, int]) -> Dict[int, int]:
+    """Fenwick node -> count change for bucket -> count changes"""
+    nodes: Dict[int, int] = {}
+    for bucket, delta in deltas.items():
+        if not delta:
+            continue
+        index = _tree_index(bucket)
+        while index <= TREE_SIZE:
+            nodes[index] = nodes.get(index, 0) + delta
+            index += index & -index
+    return {node: delta for node, delta in nodes.items() if delta}
+
+def prefix_nodes(index: int) -> List[int]:
+    nodes = []
+    while index > 0:
+        nodes.append(index)
+        index -= index & -index
+    return nodes
+
+def move_between_buckets(deltas: Dict[int, int], old_volume: Optional[float], new_volume: Optional[float]):
+    """Record one user moving from old_volume's bucket to new_volume's (None: not on the board)"""
+    if old_volume is not None:
+        bucket = volume_bucket(old_volume)
+        deltas[bucket] = deltas.get(bucket, 0) - 1
+    if new_volume is not None:
+        bucket = volume_bucket(new_volume)
+        deltas[bucket] = deltas.get(bucket, 0) + 1
+
+async def apply_bucket_moves(db: AsyncIOMotorDatabase, week: str, deltas: Dict[int, int]):
+    nodes = tree_updates(deltas)
+    if nodes:
+        await db.leaderboard_ranks.bulk_write([
+            UpdateOne({"week": week, "node": node}, {"$inc": {"count": delta}}, upsert=True)
+            for node, delta in nodes.items()
+        ], ordered=False)
+
+def _counted_volume(doc: Optional[Dict]) -> Optional[float]:
+    """The volume a bucket document is counted under in the rank tree, None if it is not counted"""
+    return doc["volume"] if doc is not None and doc.get("counted") else None
+
+async def record_workout_volume(
+    db: AsyncIOMotorDatabase, user_id: str, workout_id: str, volume: float, completed_at: datetime
+):
+    """Add a completed workout's volume to the user's bucket for that week (once per workout)"""
+    week = week_key(completed_at)
+    for attempt in range(2):
+        try:
+            before = await db.leaderboard_weekly.find_one_and_update(
+                {"week": week, "userId": user_id, "workouts.id": {"$ne": workout_id}},
+                {
+                    "$push": {"workouts": {"id": workout_id, "volume": volume, "completedAt": completed_at}},
+                    "$inc": {"volume": volume, "rev": 1},
+                    "$set": {"counted": True, "updatedAt": datetime.utcnow()}
+                },
+                upsert=True
+            )
+            break
+        except DuplicateKeyError:
+            # Either the workout is already on the board, or another update created the document first
+            if attempt:
+                return
+    deltas: Dict[int, int] = {}
+    move_between_buckets(
+        deltas, _counted_volume(before), (before["volume"] if before is not None else 0) + volume
+    )
+    await apply_bucket_moves(db, week, deltas)
+
+async def top_entries(db: AsyncIOMotorDatabase, week: str, limit: int) -> List[Dict]:
+    """Top `limit` entries of a week with competition ranking (ties share a rank)"""
+    docs = await db.leaderboard_weekly.find(
+        {"week": week},
+        {"_id": 0, "userId": 1, "volume": 1}
+    ).sort("volume", -1).limit(limit).to_list(limit)
+
+    entries = []
+    for position, doc in enumerate(docs):
+        if entries and doc["volume"] == entries[-1]["volume"]:
+            rank = entries[-1]["rank"]
+        else:
+            rank = position + 1
+        entries.append({"rank": rank, "userId": doc["userId"], "volume": doc["volume"]})
+    return entries
+
+async def user_rank(db: AsyncIOMotorDatabase, week: str, user_id: str) -> Optional[Dict]:
+    """A user's rank and volume for a week, or None when they have no entry"""
+    doc = await db.leaderboard_weekly.find_one({"week": week, "userId": user_id}, {"_id": 0, "volume": 1})
+    if not doc:
+        return None
+    bucket = volume_bucket(doc["volume"])
+
+    # Users in higher buckets: a prefix sum over O(log B) tree nodes
+    nodes = prefix_nodes(_tree_index(bucket) - 1)
+    higher = 0
+    async for node in db.leaderboard_ranks.find({"week": week, "node": {"$in": nodes}}, {"_id": 0, "count": 1}):
+        higher += node["count"]
+
+    # Users in the same bucket with more volume
+    same_bucket = {"$gt": doc["volume"]}
+    if bucket < len(BUCKET_BOUNDS):
+        same_bucket["$lt"] = BUCKET_BOUNDS[bucket]
+    ahead = await db.leaderboard_weekly.count_documents({"week": week, "volume": same_bucket})
+    return {"rank": higher + ahead + 1, "volume": doc["volume"]}
+
+def _week_pipeline(week: str) -> List[Dict]:
+    """Per-user workout entries of a week's completed workouts, sorted by user id"""
+    start, end = week_bounds(week)
+    completed_in_week = {"$match": {
+        "status": "completed",
+        "$or": [
+            {"completedAt": {"$gte": start, "$lt": end}},
+            # Workouts completed before completedAt was recorded
+            {"completedAt": {"$exists": False}, "date": {"$gte": start, "$lt": end}},
+        ]
+    }}
+    pipeline = [completed_in_week]
+    if reaches_archive(start):
+        pipeline.append({"$unionWith": {"coll": "workouts_archive", "pipeline": [completed_in_week]}})
+    return pipeline + [
+        {"$unwind": "$exercises"},
+        {"$match": {"exercises.completed": True}},
+        {"$group": {
+            "_id": {"userId": "$userId", "id": "$id"},
+            "completedAt": {"$first": {"$ifNull": ["$completedAt", "$date"]}},
+            "volume": {"$sum": {"$multiply": ["$exercises.sets", "$exercises.reps", "$exercises.weight"]}}
+        }},
+        {"$group": {
+            "_id": "$_id.userId",
+            "workouts": {"$push": {"id": "$_id.id", "volume": "$volume", "completedAt": "$completedAt"}}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+
+async def _next(iterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+async def _merge_by_user(cursors: List) -> AsyncIterator[Tuple[str, List[Dict]]]:
+    """Merge per-source (user id sorted) entry rows; a user found on two shards mid-move is combined"""
+    heads = [await _next(cursor) for cursor in cursors]
+    while any(head is not None for head in heads):
+        user_id = min(head["_id"] for head in heads if head is not None)
+        entries = {}
+        for i, head in enumerate(heads):
+            if head is not None and head["_id"] == user_id:
+                entries.update((entry["id"], entry) for entry in head["workouts"])
+                heads[i] = await _next(cursors[i])
+        yield user_id, list(entries.values())
+
+def _merged_entries(computed: List[Dict], current: Optional[Dict], recent_since: datetime) -> List[Dict]:
+    """The rebuilt entries plus live ones recent enough to be missing from the rebuild's snapshot"""
+    entries = {entry["id"]: entry for entry in computed}
+    for entry in (current or {}).get("workouts", []):
+        if entry["id"] not in entries and entry["completedAt"] >= recent_since:
+            entries[entry["id"]] = entry
+    return sorted(entries.values(), key=lambda entry: (entry["completedAt"], entry["id"]))
+
+def _same_entries(current: Optional[Dict], entries: List[Dict]) -> bool:
+    if current is None:
+        return not entries
+    return current.get("counted") and sorted((e["id"], e["volume"]) for e in current.get("workouts", [])) == \
+        sorted((e["id"], e["volume"]) for e in entries)
+
+async def _rebuild_user(
+    db: AsyncIOMotorDatabase, week: str, user_id: str, computed: List[Dict],
+    current: Optional[Dict], recent_since: datetime, rebuilt_at: datetime, deltas: Dict[int, int]
+) -> bool:
+    """Write one user's rebuilt bucket unless it changed since `current` was read; False on conflict"""
+    entries = _merged_entries(computed, current, recent_since)
+    if _same_entries(current, entries):
+        return True
+
+    if current is None:
+        volume = sum(entry["volume"] for entry in entries)
+        try:
+            await db.leaderboard_weekly.insert_one({
+                "week": week, "userId": user_id, "workouts": entries, "volume": volume,
+                "rev": 1, "counted": True, "updatedAt": rebuilt_at, "rebuiltAt": rebuilt_at
+            })
+        except DuplicateKeyError:
+            return False  # Created by a live update meanwhile
+        move_between_buckets(deltas, None, volume)
+        return True
+
+    unchanged = {"_id": current["_id"], "rev": current.get("rev", 0)} if "rev" in current else \
+        {"_id": current["_id"], "rev": {"$exists": False}}
+    if not entries:
+        result = await db.leaderboard_weekly.delete_one(unchanged)
+        if not result.deleted_count:
+            return False
+        move_between_buckets(deltas, _counted_volume(current), None)
+        return True
+
+    volume = sum(entry["volume"] for entry in entries)
+    result = await db.leaderboard_weekly.update_one(unchanged, {
+        "$set": {
+            "workouts": entries, "volume": volume, "rev": current.get("rev", 0) + 1,
+            "counted": True, "updatedAt": rebuilt_at, "rebuiltAt": rebuilt_at
+        }
+    })
+    if not result.matched_count:
+        return False
+    move_between_buckets(deltas, _counted_volume(current), volume)
+    return True
+
+async def _rebuild_batch(
+    db: AsyncIOMotorDatabase, week: str, batch: List[Tuple[str, List[Dict], Optional[Dict]]],
+    recent_since: datetime, rebuilt_at: datetime
+):
+    deltas: Dict[int, int] = {}
+    for attempt in range(REBUILD_ATTEMPTS):
+        applied = await asyncio.gather(*(
+            _rebuild_user(db, week, user_id, computed, current, recent_since, rebuilt_at, deltas)
+            for user_id, computed, current in batch
+        ))
+        conflicts = [item for item, ok in zip(batch, applied) if not ok]
+        if not conflicts:
+            break
+        # Written by a live update since it was read: read again and retry
+        fresh = {
+            doc["userId"]: doc
+            async for doc in db.leaderboard_weekly.find(
+                {"week": week, "userId": {"$in": [user_id for user_id, _, _ in conflicts]}}
+            )
+        }
+        batch = [(user_id, computed, fresh.get(user_id)) for user_id, computed, _ in conflicts]
+    else:
+        logger.warning("Leaderboard %s: gave up rebuilding %s users after conflicts", week, len(batch))
+    await apply_bucket_moves(db, week, deltas)
+
+async def rebuild_week(db: AsyncIOMotorDatabase, week: str, sources: Optional[List[AsyncIOMotorDatabase]] = None) -> int:
+    """Recompute a week's buckets in `db` from the completed workouts of `sources` (default: `db`).
+
+    Computed and current buckets are merge-joined by user id, so memory stays
+    bounded by one batch. Live updates are never overwritten (see _rebuild_user).
+    """
+    rebuilt_at = datetime.utcnow()
+    recent_since = rebuilt_at - REBUILD_MARGIN
+    pipeline = _week_pipeline(week)
+    computed_rows = _merge_by_user([
+        source.workouts.aggregate(pipeline, allowDiskUse=True) for source in sources or [db]
+    ])
+    current_docs = db.leaderboard_weekly.find({"week": week}).sort("userId", 1).batch_size(REBUILD_BATCH_SIZE)
+
+    batch = []
+    computed = await _next(computed_rows)
+    current = await _next(current_docs)
+    while computed is not None or current is not None:
+        if current is None or (computed is not None and computed[0] < current["userId"]):
+            batch.append((computed[0], computed[1], None))
+            computed = await _next(computed_rows)
+        elif computed is None or current["userId"] < computed[0]:
+            batch.append((current["userId"], [], current))
+            current = await _next(current_docs)
+        else:
+            batch.append((computed[0], computed[1], current))
+            computed = await _next(computed_rows)
+            current = await _next(current_docs)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            await _rebuild_batch(db, week, batch, recent_since, rebuilt_at)
+            batch = []
+    if batch:
+        await _rebuild_batch(db, week, batch, recent_since, rebuilt_at)
+
+    count = await db.leaderboard_weekly.count_documents({"week": week})
+    logger.info("Rebuilt leaderboard %s with %s entries", week, count)
+    return count
+
+async def _main():
+    import argparse
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from database import connect_to_mongo, close_mongo_connection, get_database, get_shard_databases, ensure_indexes
+
+    parser = argparse.ArgumentParser(description="Rebuild weekly leaderboard buckets")
+    parser.add_argument("--week", default=week_key(), help="ISO week label (default: current week)")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    await connect_to_mongo()
+    try:
+        for shard_db in get_shard_databases():
+            await ensure_indexes(shard_db)
+        await rebuild_week(get_database(), args.week, get_shard_databases())
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_main())
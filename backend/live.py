@@ -0,0 +1,203 @@
+"""
+Live workout session channel.
+
+Each WebSocket connected to /api/workouts/{id}/live is registered in the
+process-wide `hub` under its workout id. Set completions (over the socket or
+the HTTP endpoint) publish small delta events to every connection of that
+workout, and the hub drives the rest timer server-side, so clients no longer
+re-fetch the whole workout after each set.
+
+Events are queued per connection and sent by a dedicated task: a slow client
+never blocks the publisher, and one whose queue overflows is disconnected.
+
+A set may be completed on one worker while the workout's sockets are held by
+others. Every published event is therefore also appended to `live_events`, a
+capped collection on the home database that every worker tails (tailable
+cursors work on standalone servers too) and delivers to its own connections.
+Rest timers run in each worker that has connections for the workout, started
+by the `rest_started` event. bench/live_sessions.py measures how many
+sessions one worker holds.
+"""
+from fastapi import WebSocket
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+import asyncio
+import os
+import uuid
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SEND_QUEUE_SIZE = 100
+# The shared channel only has to outlast the slowest worker's tailing lag
+LIVE_EVENTS_BYTES = int(os.environ.get('LIVE_EVENTS_BYTES', 16 * 1024 * 1024))
+RELAY_RETRY_SECONDS = 1
+RELAY_SEEN_IDS = 10000
+
+class LiveConnection:
+    def __init__(self, websocket: WebSocket, user_id: str, workout_id: str):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.workout_id = workout_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.sender: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.sender = asyncio.create_task(self._send_loop())
+
+    def push(self, event: Dict) -> bool:
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _send_loop(self):
+        try:
+            while True:
+                event = await self.queue.get()
+                await self.websocket.send_json(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The receive loop notices the disconnect and unregisters us
+            pass
+
+    async def close(self):
+        if self.sender:
+            self.sender.cancel()
+            await asyncio.gather(self.sender, return_exceptions=True)
+
+class LiveHub:
+    def __init__(self):
+        self.channels: Dict[str, Set[LiveConnection]] = {}
+        self.rest_timers: Dict[str, asyncio.Task] = {}
+        # Set while this worker relays events through `live_events`
+        self.origin: Optional[str] = None
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._tail_task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+
+    def register(self, connection: LiveConnection):
+        self.channels.setdefault(connection.workout_id, set()).add(connection)
+        connection.start()
+        metrics.set_gauge("live_sessions", self.connection_count())
+
+    async def unregister(self, connection: LiveConnection):
+        channel = self.channels.get(connection.workout_id)
+        if channel is not None:
+            channel.discard(connection)
+            if not channel:
+                del self.channels[connection.workout_id]
+                timer = self.rest_timers.pop(connection.workout_id, None)
+                if timer:
+                    timer.cancel()
+        await connection.close()
+        metrics.set_gauge("live_sessions", self.connection_count())
+
+    def connection_count(self) -> int:
+        return sum(len(channel) for channel in self.channels.values())
+
+    def publish(self, workout_id: str, event: Dict):
+        """Queue an event for every connection following a workout, on every worker"""
+        self._deliver(workout_id, event)
+        if self._db is not None:
+            task = asyncio.create_task(self._broadcast(workout_id, event))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+        metrics.increment("live_events_published")
+
+    def _deliver(self, workout_id: str, event: Dict):
+        """Queue an event for this worker's connections only"""
+        for connection in list(self.channels.get(workout_id, ())):
+            if not connection.push(event):
+                metrics.increment("live_dropped_connections")
+                asyncio.create_task(connection.websocket.close(code=1013))
+
+    def start_rest(self, workout_id: str, exercise_id: str, seconds: int):
+        """Announce a rest period and schedule its end, replacing any running timer"""
+        ends_at = datetime.utcnow() + timedelta(seconds=seconds)
+        event = {
+            "type": "rest_started",
+            "exerciseId": exercise_id,
+            "restTime": seconds,
+            "endsAt": ends_at.isoformat()
+        }
+        self.publish(workout_id, event)
+        self._schedule_rest(workout_id, event)
+
+    def _schedule_rest(self, workout_id: str, event: Dict):
+        previous = self.rest_timers.pop(workout_id, None)
+        if previous:
+            previous.cancel()
+        if workout_id not in self.channels:
+            return
+        seconds = max((datetime.fromisoformat(event["endsAt"]) - datetime.utcnow()).total_seconds(), 0)
+        self.rest_timers[workout_id] = asyncio.create_task(self._finish_rest(workout_id, event["exerciseId"], seconds))
+
+    async def _finish_rest(self, workout_id: str, exercise_id: str, seconds: float):
+        await asyncio.sleep(seconds)
+        self.rest_timers.pop(workout_id, None)
+        # Every worker with connections runs its own timer
+        self._deliver(workout_id, {"type": "rest_finished", "exerciseId": exercise_id})
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        """Relay events between workers through the `live_events` capped collection"""
+        try:
+            await db.create_collection("live_events", capped=True, size=LIVE_EVENTS_BYTES)
+        except CollectionInvalid:
+            pass
+        # Set here rather than at import, so workers forked from one master differ
+        self.origin = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # A tailable cursor matching nothing dies at once: give ours a first match
+        marker = await db.live_events.insert_one({"origin": self.origin, "workoutId": None, "event": {"type": "relay_started"}})
+        self._db = db
+        self._tail_task = asyncio.create_task(self._tail(db, marker.inserted_id))
+
+    async def stop(self):
+        self._db = None
+        if self._tail_task:
+            self._tail_task.cancel()
+            await asyncio.gather(self._tail_task, *self._pending, return_exceptions=True)
+            self._tail_task = None
+
+    async def _broadcast(self, workout_id: str, event: Dict):
+        try:
+            await self._db.live_events.insert_one({"origin": self.origin, "workoutId": workout_id, "event": event})
+        except Exception as e:
+            metrics.increment("live_relay_errors")
+            logger.error("Live event relay error: %s", e)
+
+    async def _tail(self, db: AsyncIOMotorDatabase, last_id: ObjectId):
+        # ObjectIds from different processes are only ordered to the second:
+        # reopened cursors start a second early and skip what was already seen
+        seen: OrderedDict = OrderedDict()
+        while True:
+            try:
+                since = ObjectId.from_datetime(last_id.generation_time - timedelta(seconds=1))
+                cursor = db.live_events.find({"_id": {"$gte": since}}, cursor_type=CursorType.TAILABLE_AWAIT)
+                async for document in cursor:
+                    last_id = document["_id"]
+                    if last_id in seen:
+                        continue
+                    seen[last_id] = True
+                    if len(seen) > RELAY_SEEN_IDS:
+                        seen.popitem(last=False)
+                    if document["origin"] == self.origin or document["workoutId"] is None:
+                        continue
+                    self._deliver(document["workoutId"], document["event"])
+                    if document["event"].get("type") == "rest_started":
+                        self._schedule_rest(document["workoutId"], document["event"])
+                await asyncio.sleep(RELAY_RETRY_SECONDS)
+            except PyMongoError as e:
+                logger.error("Live event tailing error: %s", e)
+                await asyncio.sleep(RELAY_RETRY_SECONDS)
+
+hub = LiveHub()
@@ -0,0 +1,163 @@
+"""
+Non-blocking, structured logging.
+
+Log calls only put the record on a queue. A QueueListener thread formats it
+(one JSON object per line, or LOG_FORMAT=text for the classic line) and writes
+it to stderr, so a slow or blocked stderr never stalls the event loop.
+
+Message arguments are merged at the call site, because they may change once
+the call returns, but only for records that pass the level and sampling
+checks. Log with %-style arguments rather than f-strings:
+
+    logger.info("Moved %s users", count)
+
+LOG_SAMPLING keeps a fraction of the records below WARNING from high-volume
+loggers. For example, "live=0.1,middleware.compression=0.01" keeps 10% of the
+live logger's records and 1% of compression's. A rate applies to a logger and
+its children. Warnings and errors are never sampled.
+
+The listener thread does not survive fork(). It is stopped before a fork and
+restarted in both parent and child, so workers forked by launcher.py keep
+logging.
+
+The queue holds at most LOG_QUEUE_SIZE records. When stderr cannot keep up and
+it fills, new records are dropped and counted in log_records_dropped rather
+than blocking the caller or growing memory without limit.
+bench/logging_throughput.py measures event loop latency, direct vs queued.
+"""
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+
+import metrics
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """Logger name -> fraction of records kept, from "name=rate,name=rate" """
+    rates = {}
+    for entry in spec.split(","):
+        name, separator, rate = entry.strip().partition("=")
+        if not separator:
+            continue
+        rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of the sub-WARNING records of selected loggers"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: Dict[str, Optional[float]] = {}
+
+    def rate(self, name: str) -> Optional[float]:
+        if name not in self._resolved:
+            # The most specific configured ancestor wins
+            candidates = [prefix for prefix in self.rates if name == prefix or name.startswith(prefix + ".")]
+            self._resolved[name] = self.rates[max(candidates, key=len)] if candidates else None
+        return self._resolved[name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        if rate is None or random.random() < rate:
+            return True
+        metrics.increment("log_records_sampled_out", labels={"logger": record.name})
+        return False
+
+class DeferredFormatQueueHandler(QueueHandler):
+    """Enqueue records with their arguments merged; formatting happens on the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks reference live frames: render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment("log_records_dropped", labels={"logger": record.name})
+
+class DrainingQueueListener(QueueListener):
+    """QueueListener that waits for room for its stop sentinel in a full queue"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+_handler: Optional[DeferredFormatQueueHandler] = None
+_listener: Optional[DrainingQueueListener] = None
+
+def _output_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    return handler
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+def _start_listener():
+    if _listener is not None and _listener._thread is None:
+        _listener.start()
+
+def _restart_in_child():
+    # Records queued by other parent threads during the fork belong to the parent
+    _handler.queue = _listener.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _start_listener()
+
+def setup_logging():
+    """Route every logger through the queue (idempotent)"""
+    global _handler, _listener
+    if _handler is not None:
+        return
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler = DeferredFormatQueueHandler(log_queue)
+    _handler.addFilter(SamplingFilter(parse_sampling(os.environ.get('LOG_SAMPLING', ''))))
+    _listener = DrainingQueueListener(log_queue, _output_handler(), respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener.start()
+    os.register_at_fork(before=_stop_listener, after_in_parent=_start_listener, after_in_child=_restart_in_child)
+    # Flush what is still queued on interpreter exit
+    atexit.register(_stop_listener)
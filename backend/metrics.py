@@ -0,0 +1,71 @@
+"""
+In-process metrics registry.
+
+Counters, gauges and timers are kept per worker and exposed through
+GET /api/metrics. Labels are folded into the metric name as
+`name{key=value,...}` so the snapshot stays a flat JSON object.
+"""
+from collections import defaultdict
+from typing import Dict, Optional
+import threading
+import time
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, float] = {}
+_timers: Dict[str, Dict[str, float]] = {}
+
+def _key(name: str, labels: Optional[Dict[str, str]] = None) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f"{key}={value}" for key, value in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+def increment(name: str, value: float = 1, labels: Optional[Dict[str, str]] = None):
+    """Add to a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+def set_gauge(name: str, value: float, labels: Optional[Dict[str, str]] = None):
+    """Set a gauge to its current value"""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+def observe(name: str, seconds: float, labels: Optional[Dict[str, str]] = None):
+    """Record one duration sample"""
+    key = _key(name, labels)
+    with _lock:
+        timer = _timers.get(key)
+        if timer is None:
+            timer = _timers[key] = {"count": 0, "total": 0.0, "max": 0.0}
+        timer["count"] += 1
+        timer["total"] += seconds
+        timer["max"] = max(timer["max"], seconds)
+
+class timed:
+    """Context manager recording the duration of a block with observe()"""
+
+    def __init__(self, name: str, labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started, self.labels)
+        return False
+
+def snapshot() -> Dict:
+    """Return a copy of every metric"""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timers": {
+                key: {**timer, "avg": timer["total"] / timer["count"] if timer["count"] else 0.0}
+                for key, timer in _timers.items()
+            },
+        }
@@ -0,0 +1,153 @@
+"""
+Response compression negotiated by Accept-Encoding.
+
+Workout payloads repeat image URLs and exercise names for every exercise, so
+JSON compresses several times over. Responses are compressed with brotli when
+the client accepts it (and the optional `brotli` package is installed), else
+gzip. Small bodies, non-text content, responses that already carry a
+Content-Encoding and streamed responses (exports, anything sent in more than
+one body message) go out untouched.
+
+Levels are moderate on purpose: past gzip 5 / brotli 4 a workout list barely
+shrinks while CPU time keeps growing. Large bodies are compressed in a thread
+(zlib and brotli release the GIL) so they do not stall the event loop. Bytes
+in/out and compression CPU time are recorded per route;
+bench/compression_levels.py compares levels on representative payloads.
+"""
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Callable, Dict, Optional, Tuple
+import asyncio
+import gzip
+import os
+import time
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 5))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+# Bodies at least this large are compressed off the event loop
+THREAD_MIN_BYTES = 256 * 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+def compressor(encoding: str, level: int) -> Callable[[bytes], bytes]:
+    if encoding == "br":
+        return lambda body: brotli.compress(body, quality=level)
+    # mtime=0 keeps the output identical for identical bodies
+    return lambda body: gzip.compress(body, compresslevel=level, mtime=0)
+
+def available_encodings() -> Dict[str, int]:
+    """Supported encodings in order of preference, with their level"""
+    encodings = {"gzip": GZIP_LEVEL}
+    if brotli is not None:
+        encodings = {"br": BROTLI_QUALITY, **encodings}
+    return encodings
+
+def negotiate(accept_encoding: str, encodings: Dict[str, int]) -> Optional[str]:
+    """Pick our preferred encoding among those the client accepts with q > 0"""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return content_type.startswith("text/") or content_type.endswith("+json") or content_type in COMPRESSIBLE_TYPES
+
+def timed_compress(compress: Callable[[bytes], bytes], body: bytes) -> Tuple[bytes, float]:
+    """Compressed body and the CPU seconds it took (of this thread only)"""
+    started = time.thread_time()
+    compressed = compress(body)
+    return compressed, time.thread_time() - started
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings()
+        self.compressors = {encoding: compressor(encoding, level) for encoding, level in self.encodings.items()}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def compressing_send(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body message shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            passthrough = True  # whatever happens, later messages go straight through
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if not is_compressible(headers):
+                await send(start)
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                await send(start)
+                await send(message)
+                return
+
+            compress = self.compressors[encoding]
+            if len(body) >= THREAD_MIN_BYTES:
+                compressed, cpu_seconds = await asyncio.to_thread(timed_compress, compress, body)
+            else:
+                compressed, cpu_seconds = timed_compress(compress, body)
+
+            labels = {"route": route_label(scope), "encoding": encoding}
+            metrics.observe("compression_cpu", cpu_seconds, labels)
+            metrics.increment("compression_bytes_in", len(body), labels)
+            if len(compressed) >= len(body):
+                metrics.increment("compression_bytes_out", len(body), labels)
+                await send(start)
+                await send(message)
+                return
+            metrics.increment("compression_bytes_out", len(compressed), labels)
+
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+        await self.app(scope, receive, compressing_send)
+
+def route_label(scope: Scope) -> str:
+    """Route template rather than the raw path, so ids do not multiply the metrics"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
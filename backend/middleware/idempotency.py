@@ -0,0 +1,249 @@
+"""
+Idempotency-Key support for mutating API requests.
+
+Clients on flaky connections retry POSTs they never saw a response for. When
+such a request carries an `Idempotency-Key` header, the first response is
+stored in the TTL-indexed `idempotency_keys` collection (and a small
+in-process cache) and replayed for every retry with the same key, so the route
+handler runs once. Keys are scoped to the authenticated user; requests without
+a valid bearer token pass through untouched.
+
+A retry that arrives while the first attempt is still running gets 409; a key
+reused for a different request gets 422. Server errors (5xx) are not stored,
+so the client can retry them.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import os
+import logging
+
+import metrics
+from auth.dependencies import authenticate_token
+from database import get_database
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', 24))
+IDEMPOTENCY_CACHE_MAX_BYTES = int(os.environ.get('IDEMPOTENCY_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+# A first attempt holding a key longer than this is presumed dead and may be retried
+LOCK_SECONDS = 60
+MAX_KEY_LENGTH = 255
+# Bodies up to this size are fingerprinted in full; larger ones by prefix and length
+FINGERPRINT_BYTES = 64 * 1024
+MAX_STORED_RESPONSE_BYTES = 256 * 1024
+MUTATING_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+# Response headers worth replaying
+STORED_HEADERS = (b"content-type", b"location", b"etag")
+
+class ResponseCache:
+    """In-process LRU of stored responses, bounded by total body bytes"""
+
+    def __init__(self, max_bytes: int = IDEMPOTENCY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.resident_bytes = 0
+        self._entries: OrderedDict = OrderedDict()  # record id -> stored record
+
+    def get(self, record_id: str) -> Optional[Dict]:
+        record = self._entries.get(record_id)
+        if record is None:
+            return None
+        if record["expiresAt"] <= datetime.utcnow():
+            self._remove(record_id)
+            return None
+        self._entries.move_to_end(record_id)
+        return record
+
+    def put(self, record_id: str, record: Dict):
+        self._remove(record_id)
+        self._entries[record_id] = record
+        self.resident_bytes += len(record["body"])
+        while self.resident_bytes > self.max_bytes:
+            evicted_id = next(iter(self._entries))
+            self._remove(evicted_id)
+
+    def _remove(self, record_id: str):
+        record = self._entries.pop(record_id, None)
+        if record is not None:
+            self.resident_bytes -= len(record["body"])
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp, cache: Optional[ResponseCache] = None):
+        self.app = app
+        self.cache = cache or ResponseCache()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in MUTATING_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        key = headers.get(b"idempotency-key", b"").decode("latin-1").strip()
+        user_id = authenticated_user(headers)
+        if not key or user_id is None:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await JSONResponse({"detail": "Chave de idempotência inválida"}, status_code=400)(scope, receive, send)
+            return
+
+        messages, complete = await read_prefix(receive)
+        fingerprint = request_fingerprint(scope, messages, complete)
+        record_id = f"{user_id}:{key}"
+        receive = replay_messages(messages, receive)
+
+        record = self.cache.get(record_id)
+        if record is None:
+            record = await self.acquire(record_id, user_id, fingerprint)
+            if record is None:
+                await self.execute(scope, receive, send, record_id)
+                return
+
+        if record["fingerprint"] != fingerprint:
+            metrics.increment("idempotency_conflicts", labels={"reason": "mismatch"})
+            response = JSONResponse(
+                {"detail": "Chave de idempotência já usada em outra requisição"}, status_code=422
+            )
+        elif record["state"] != "done":
+            metrics.increment("idempotency_conflicts", labels={"reason": "in_progress"})
+            response = JSONResponse(
+                {"detail": "Requisição com esta chave ainda em andamento"},
+                status_code=409,
+                headers={"Retry-After": "1"}
+            )
+        else:
+            self.cache.put(record_id, record)
+            metrics.increment("idempotency_replays")
+            response = Response(
+                content=record["body"],
+                status_code=record["status"],
+                headers={**record["headers"], "Idempotent-Replayed": "true"}
+            )
+        await response(scope, receive, send)
+
+    async def acquire(self, record_id: str, user_id: str, fingerprint: str) -> Optional[Dict]:
+        """Claim the key for this request; returns the existing record if someone else holds it"""
+        db = get_database()
+        now = datetime.utcnow()
+        try:
+            await db.idempotency_keys.insert_one({
+                "_id": record_id,
+                "userId": user_id,
+                "fingerprint": fingerprint,
+                "state": "in_progress",
+                "lockedUntil": now + timedelta(seconds=LOCK_SECONDS),
+                "createdAt": now,
+                "expiresAt": now + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        # Take over a key whose first attempt died without finishing
+        taken = await db.idempotency_keys.find_one_and_update(
+            {"_id": record_id, "state": "in_progress", "fingerprint": fingerprint, "lockedUntil": {"$lt": now}},
+            {"$set": {"lockedUntil": now + timedelta(seconds=LOCK_SECONDS)}}
+        )
+        if taken is not None:
+            return None
+        record = await db.idempotency_keys.find_one({"_id": record_id})
+        if record is None:
+            # Expired or released in between: claim it again
+            return await self.acquire(record_id, user_id, fingerprint)
+        return record
+
+    async def execute(self, scope: Scope, receive: Receive, send: Send, record_id: str):
+        """Run the request once, passing the response through while capturing it"""
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+        size = 0
+
+        async def capture(message: Message):
+            nonlocal start, size
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if size <= MAX_STORED_RESPONSE_BYTES:
+                    chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        except BaseException:
+            await self.release(record_id)
+            raise
+
+        if start is None or start["status"] >= 500 or size > MAX_STORED_RESPONSE_BYTES:
+            await self.release(record_id)
+            return
+
+        stored_headers = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in start.get("headers", [])
+            if name.lower() in STORED_HEADERS
+        }
+        record = await get_database().idempotency_keys.find_one_and_update(
+            {"_id": record_id},
+            {"$set": {"state": "done", "status": start["status"], "headers": stored_headers, "body": b"".join(chunks)},
+             "$unset": {"lockedUntil": ""}},
+            return_document=True
+        )
+        if record is not None:
+            self.cache.put(record_id, record)
+        metrics.increment("idempotency_stored")
+
+    async def release(self, record_id: str):
+        try:
+            await get_database().idempotency_keys.delete_one({"_id": record_id, "state": "in_progress"})
+        except Exception as e:
+            logger.error("Idempotency key release error: %s", e)
+
+def authenticated_user(headers: Dict[bytes, bytes]) -> Optional[str]:
+    scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    payload = authenticate_token(token.strip())
+    return payload.get("user_id") if payload else None
+
+async def read_prefix(receive: Receive) -> Tuple[List[Message], bool]:
+    """Buffer request messages until FINGERPRINT_BYTES or the end of the body"""
+    messages = []
+    size = 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            return messages, True
+        size += len(message.get("body", b""))
+        if not message.get("more_body", False):
+            return messages, True
+        if size >= FINGERPRINT_BYTES:
+            return messages, False
+
+def request_fingerprint(scope: Scope, messages: List[Message], complete: bool) -> str:
+    digest = hashlib.sha256()
+    digest.update(scope["method"].encode())
+    digest.update(scope["path"].encode())
+    digest.update(b"?" + scope.get("query_string", b""))
+    for message in messages:
+        digest.update(message.get("body", b""))
+    if not complete:
+        # Long uploads are identified by their prefix and declared length
+        digest.update(b"#" + dict(scope.get("headers", [])).get(b"content-length", b""))
+    return digest.hexdigest()
+
+def replay_messages(messages: List[Message], receive: Receive) -> Receive:
+    """Hand buffered request messages to the app again, then continue with the live stream"""
+    pending = list(messages)
+
+    async def replay():
+        if pending:
+            return pending.pop(0)
+        return await receive()
+
+    return replay
@@ -0,0 +1,186 @@
+"""
+Token-bucket rate limiting for the credential endpoints.
+
+Login and register run bcrypt, which is deliberately expensive, so requests
+are throttled per client IP and per normalized email before they reach the
+route handler: a rejected request never touches the database or bcrypt.
+
+Buckets live in a BucketStore. The default InMemoryBucketStore is per worker
+and bounded by LRU eviction; multi-worker deployments can plug in a shared
+store implementing the same `take` coroutine.
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import Dict, Optional
+import json
+import math
+import os
+import time
+
+import metrics
+
+@dataclass(frozen=True)
+class RateLimit:
+    capacity: int
+    per_seconds: float
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / self.per_seconds
+
+class BucketStore(ABC):
+    """Storage interface for token buckets"""
+
+    @abstractmethod
+    async def take(self, key: str, limit: RateLimit, cost: float = 1) -> float:
+        """Consume `cost` tokens from the bucket at `key`.
+
+        Returns 0 when the tokens were available, otherwise the number of
+        seconds until they will be.
+        """
+
+class InMemoryBucketStore(BucketStore):
+    """Per-process bucket store with LRU eviction of idle buckets"""
+
+    def __init__(self, max_buckets: int = 100_000, idle_seconds: float = 3600):
+        self.max_buckets = max_buckets
+        self.idle_seconds = idle_seconds
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, updated_at]
+
+    async def take(self, key: str, limit: RateLimit, cost: float = 1) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            tokens = float(limit.capacity)
+        else:
+            tokens = min(float(limit.capacity), bucket[0] + (now - bucket[1]) * limit.refill_rate)
+
+        if tokens >= cost:
+            tokens -= cost
+            retry_after = 0.0
+        else:
+            retry_after = (cost - tokens) / limit.refill_rate
+
+        self._buckets[key] = [tokens, now]
+        self._evict(now)
+        return retry_after
+
+    def _evict(self, now: float):
+        """Drop least recently used buckets beyond the size cap or idle too long"""
+        buckets = self._buckets
+        while buckets:
+            oldest_key = next(iter(buckets))
+            if len(buckets) <= self.max_buckets and now - buckets[oldest_key][1] < self.idle_seconds:
+                break
+            buckets.popitem(last=False)
+        metrics.set_gauge("rate_limit_buckets", len(buckets))
+
+    def __len__(self):
+        return len(self._buckets)
+
+LOGIN_IP_LIMIT = RateLimit(int(os.environ.get('RATE_LIMIT_IP_PER_MINUTE', 30)), 60)
+LOGIN_EMAIL_LIMIT = RateLimit(int(os.environ.get('RATE_LIMIT_EMAIL_PER_MINUTE', 5)), 60)
+TRUST_PROXY_HEADERS = os.environ.get('TRUST_PROXY_HEADERS', '0') == '1'
+MAX_BODY_BYTES = 64 * 1024
+
+DEFAULT_RULES = {
+    "/api/auth/login": (LOGIN_IP_LIMIT, LOGIN_EMAIL_LIMIT),
+    "/api/auth/register": (LOGIN_IP_LIMIT, LOGIN_EMAIL_LIMIT),
+}
+
+class RateLimitMiddleware:
+    """ASGI middleware applying (ip limit, email limit) rules to POST paths"""
+
+    def __init__(self, app: ASGIApp, store: Optional[BucketStore] = None, rules: Optional[Dict] = None):
+        self.app = app
+        self.store = store or InMemoryBucketStore()
+        self.rules = rules if rules is not None else DEFAULT_RULES
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Synthetic startup requests (warmup.py) must not spend a real client's tokens
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.rules or scope.get("warmup"):
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        ip_limit, email_limit = self.rules[path]
+
+        retry_after = await self.store.take(f"ip:{path}:{client_ip(scope)}", ip_limit)
+        if retry_after:
+            await self.reject(scope, receive, send, path, "ip", retry_after)
+            return
+
+        body = await read_body(receive)
+        if body is None:
+            response = JSONResponse({"detail": "Requisição muito grande"}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        email = extract_email(body)
+        if email:
+            retry_after = await self.store.take(f"email:{path}:{email}", email_limit)
+            if retry_after:
+                await self.reject(scope, receive, send, path, "email", retry_after)
+                return
+
+        await self.app(scope, replay_body(body, receive), send)
+
+    async def reject(self, scope: Scope, receive: Receive, send: Send, path: str, key_type: str, retry_after: float):
+        metrics.increment("rate_limit_rejections", labels={"path": path, "key": key_type})
+        response = JSONResponse(
+            {"detail": "Muitas tentativas. Tente novamente em instantes."},
+            status_code=429,
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+        await response(scope, receive, send)
+
+def client_ip(scope: Scope) -> str:
+    if TRUST_PROXY_HEADERS:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+async def read_body(receive: Receive) -> Optional[bytes]:
+    """Buffer the request body, or return None when it exceeds MAX_BODY_BYTES"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+def replay_body(body: bytes, receive: Receive) -> Receive:
+    """Build a receive callable that hands the buffered body to the app again"""
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+def extract_email(body: bytes) -> Optional[str]:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    email = payload.get("email") if isinstance(payload, dict) else None
+    if not isinstance(email, str):
+        return None
+    return email.strip().lower() or None
@@ -0,0 +1,39 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+import uuid
+
+class CoachLink(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    coachId: str
+    athleteId: str
+    createdAt: datetime = Field(default_factory=datetime.utcnow)
+
+class CoachInviteResponse(BaseModel):
+    code: str
+    expiresAt: datetime
+
+class RedeemInviteRequest(BaseModel):
+    code: str = Field(..., min_length=1, max_length=32)
+
+class CoachAthlete(BaseModel):
+    id: str
+    name: str
+    avatar: Optional[str] = None
+    linkedAt: datetime
+
+class AthleteWeek(BaseModel):
+    week: str  # ISO week, AAAA-Wnn
+    volume: float
+    weight: float  # average weight of the completed exercises
+    workouts: int
+
+class AthleteProgress(BaseModel):
+    athlete: CoachAthlete
+    currentStreak: int
+    totalVolume: float
+    weeks: List[AthleteWeek]
+
+class AthleteProgressPage(BaseModel):
+    items: List[AthleteProgress]
+    nextCursor: Optional[str] = None
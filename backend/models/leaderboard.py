@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    userId: str
+    name: str
+    avatar: Optional[str] = None
+    volume: float
+
+class LeaderboardResponse(BaseModel):
+    week: str
+    entries: List[LeaderboardEntry]
+
+class MyRankResponse(BaseModel):
+    week: str
+    rank: Optional[int] = None
+    volume: float = 0.0
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
 class WeeklyProgress(BaseModel):
@@ -14,6 +14,34 @@ class ProgressStats(BaseModel):
     completedWorkouts: int
     currentStreak: int
 
+class VolumeWeek(BaseModel):
+    week: str  # ISO week, AAAA-Wnn
+    volume: float
+    rollingVolume: float  # sum of this and the 3 previous weeks
+    delta: float
+    deltaPercent: Optional[float] = None  # None when the previous week is empty
+
+class MuscleGroupLoad(BaseModel):
+    group: str
+    volume: float
+    sets: int
+    share: float  # fraction of the total volume
+
+class WeightProjection(BaseModel):
+    exercise: str
+    muscleGroup: str
+    sessions: int
+    currentWeight: float
+    slopePerWeek: float
+    projectedWeight: float
+    projectedAt: datetime
+
+class TrainingAnalytics(BaseModel):
+    totalSets: int
+    weeks: List[VolumeWeek]
+    muscleGroups: List[MuscleGroupLoad]
+    projections: List[WeightProjection]
+
 class WorkoutSession(BaseModel):
     id: str
     userId: str
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from models.user import UserResponse
+from models.workout import WorkoutResponse
+
+class SyncResponse(BaseModel):
+    workouts: List[WorkoutResponse]  # created or changed, exercises included
+    deleted: List[str]  # ids of deleted workouts
+    profile: Optional[UserResponse] = None  # only when it changed
+    cursor: str  # pass back as `since` on the next sync
+    hasMore: bool  # more changes are waiting: sync again right away
+    reset: bool = False  # the cursor expired: drop local data, this is a full sync
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 import uuid
 
@@ -20,6 +20,7 @@ class User(BaseModel):
     totalWorkouts: int = 0
     streak: int = 0
     createdAt: datetime = Field(default_factory=datetime.utcnow)
+    updatedAt: datetime = Field(default_factory=datetime.utcnow)
     
     class Config:
         json_encoders = {
@@ -37,4 +38,27 @@ class UserResponse(BaseModel):
 class AuthResponse(BaseModel):
     success: bool
     user: UserResponse
-    token: str
\ No newline at end of file
+    token: str
+    refreshToken: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refreshToken: str
+
+class LogoutRequest(BaseModel):
+    refreshToken: Optional[str] = None
+
+class TokenResponse(BaseModel):
+    success: bool
+    token: str
+    refreshToken: str
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportResponse(BaseModel):
+    success: bool
+    imported: int
+    setLogs: int = 0
+    failed: int
+    errors: List[ImportRowError] = []
\ No newline at end of file
@@ -1,8 +1,11 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, date
 import uuid
 
+# Reps of a single set; the analytics columns hold them as uint16
+MAX_REPS = 1000
+
 class Exercise(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -19,16 +22,27 @@ class Workout(BaseModel):
     userId: str
     name: str
     date: datetime = Field(default_factory=datetime.utcnow)
-    status: str = "pending"  # pending, active, completed
+    status: str = "pending"  # pending, active, completed, skipped
     progress: float = 0.0  # 0-100
     exercises: List[Exercise] = []
     createdAt: datetime = Field(default_factory=datetime.utcnow)
+    completedAt: Optional[datetime] = None
+    updatedAt: datetime = Field(default_factory=datetime.utcnow)
+    version: int = 0  # incremented by every write, for conditional updates
     
     class Config:
         json_encoders = {
             datetime: lambda v: v.isoformat()
         }
 
+class SetLog(BaseModel):
+    workoutId: str
+    exerciseId: str
+    exerciseName: str
+    weight: float = Field(..., ge=0, allow_inf_nan=False)
+    reps: int = Field(..., ge=1, le=MAX_REPS)
+    completedAt: datetime
+
 class WorkoutCreate(BaseModel):
     name: str
     exercises: List[Exercise]
@@ -40,6 +54,7 @@ class WorkoutResponse(BaseModel):
     status: str
     progress: float
     exercises: List[Exercise]
+    version: int = 0
     
     class Config:
         json_encoders = {
@@ -48,9 +63,36 @@ class WorkoutResponse(BaseModel):
 
 class CompleteSetRequest(BaseModel):
     setNumber: int
-    weight: float
-    reps: int
+    weight: float = Field(..., ge=0, allow_inf_nan=False)
+    reps: int = Field(..., ge=1, le=MAX_REPS)
+
+class LiveCompleteSet(BaseModel):
+    """`complete_set` message of a live session; weight and reps default to the plan"""
+    exerciseId: str
+    weight: Optional[float] = Field(None, ge=0, allow_inf_nan=False)
+    reps: Optional[int] = Field(None, ge=1, le=MAX_REPS)
+    version: Optional[int] = None
+    
+    class Config:
+        # JSON messages are not coerced: "10" or true is not a number of reps
+        strict = True
 
 class CompleteSetResponse(BaseModel):
     success: bool
-    exercise: dict
\ No newline at end of file
+    exercise: dict
+    version: int
+
+class PlanDay(BaseModel):
+    weekday: int = Field(..., ge=0, le=6)  # 0 = Monday
+    template: str
+
+class PlanRequest(BaseModel):
+    weeks: int = Field(4, ge=1, le=52)
+    startDate: Optional[date] = None
+    split: Optional[List[PlanDay]] = None
+
+class PlanResponse(BaseModel):
+    success: bool
+    created: int
+    startDate: datetime
+    endDate: datetime
\ No newline at end of file
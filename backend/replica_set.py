@@ -0,0 +1,104 @@
+"""
+Local three-member replica set for development and testing.
+
+Secondary reads, causal sessions and change streams only behave like
+production against a replica set. This starts three mongod processes on
+consecutive ports, initiates them as one set and prints the MONGO_URL to use:
+
+    python replica_set.py --dbpath /tmp/fitness-rs --port 27017
+
+Run the API with that MONGO_URL to exercise the analytics read preference
+(ANALYTICS_READ_PREFERENCE, ANALYTICS_MAX_STALENESS_SECONDS). Stop with Ctrl+C.
+"""
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+MEMBERS = 3
+STARTUP_TIMEOUT_SECONDS = 30
+
+def start_members(mongod: str, dbpath: str, port: int, name: str) -> list:
+    processes = []
+    for index in range(MEMBERS):
+        member_path = os.path.join(dbpath, f"member{index}")
+        os.makedirs(member_path, exist_ok=True)
+        processes.append(subprocess.Popen([
+            mongod,
+            "--replSet", name,
+            "--port", str(port + index),
+            "--bind_ip", "127.0.0.1",
+            "--dbpath", member_path,
+            "--logpath", os.path.join(member_path, "mongod.log")
+        ]))
+    return processes
+
+def wait_for_port(port: int):
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while True:
+        try:
+            MongoClient("127.0.0.1", port, directConnection=True, serverSelectionTimeoutMS=500).admin.command("ping")
+            return
+        except PyMongoError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"mongod on port {port} did not start")
+            time.sleep(0.5)
+
+def initiate(port: int, name: str):
+    """Initiate the set (first member preferred as primary) and wait for a primary"""
+    admin = MongoClient("127.0.0.1", port, directConnection=True).admin
+    config = {
+        "_id": name,
+        "members": [
+            {"_id": index, "host": f"127.0.0.1:{port + index}", "priority": 2 if index == 0 else 1}
+            for index in range(MEMBERS)
+        ]
+    }
+    try:
+        admin.command("replSetInitiate", config)
+    except PyMongoError as e:
+        if "already initialized" not in str(e):
+            raise
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while not admin.command("hello").get("isWritablePrimary"):
+        if time.monotonic() > deadline:
+            raise RuntimeError("Replica set did not elect a primary")
+        time.sleep(0.5)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local three-member MongoDB replica set")
+    parser.add_argument("--dbpath", default="/tmp/fitness-rs", help="Parent directory for member data")
+    parser.add_argument("--port", type=int, default=27017, help="Port of the first member")
+    parser.add_argument("--name", default="rs0", help="Replica set name")
+    parser.add_argument("--mongod", default="mongod", help="mongod binary")
+    args = parser.parse_args()
+
+    processes = start_members(args.mongod, args.dbpath, args.port, args.name)
+    try:
+        for index in range(MEMBERS):
+            wait_for_port(args.port + index)
+        initiate(args.port, args.name)
+
+        hosts = ",".join(f"127.0.0.1:{args.port + index}" for index in range(MEMBERS))
+        print(f"MONGO_URL=mongodb://{hosts}/?replicaSet={args.name}", flush=True)
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+        print("A member exited, stopping the replica set", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,52 @@
 from fastapi import APIRouter, HTTPException, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from models.user import UserCreate, UserLogin, AuthResponse, User, UserResponse
-from auth.password import hash_password, verify_password
-from auth.jwt_handler import create_access_token
-from database import get_database
+from models.user import (
+    UserCreate, UserLogin, AuthResponse, User, UserResponse,
+    RefreshRequest, LogoutRequest, TokenResponse
+)
+from auth.password import hash_password, verify_password, needs_rehash
+from auth.jwt_handler import (
+    create_access_token, create_refresh_token, hash_refresh_token, refresh_token_expiry
+)
+from auth.dependencies import get_current_user
+from auth.revocation import revoke_token
+from database import get_database, get_user_database
+from routes.workouts import initialize_user_workouts
+from datetime import datetime
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
+# Keep references so pending rehash tasks are not garbage collected
+_rehash_tasks = set()
+
+async def rehash_password(db: AsyncIOMotorDatabase, user_id: str, password: str, old_hash: str):
+    """Re-hash a password with the current bcrypt cost, off the event loop"""
+    try:
+        new_hash = await asyncio.to_thread(hash_password, password)
+        # Only replace the hash that was verified, never a newer one
+        await db.users.update_one(
+            {"id": user_id, "passwordHash": old_hash},
+            {"$set": {"passwordHash": new_hash}}
+        )
+    except Exception as e:
+        logger.error("Password rehash error: %s", e)
+
+async def issue_tokens(db: AsyncIOMotorDatabase, user_id: str, email: str):
+    """Create a short-lived access token and a stored, rotating refresh token"""
+    access_token = create_access_token({"user_id": user_id, "email": email})
+    refresh_token = create_refresh_token()
+    await db.refresh_tokens.insert_one({
+        "tokenHash": hash_refresh_token(refresh_token),
+        "userId": user_id,
+        "email": email,
+        "createdAt": datetime.utcnow(),
+        "expiresAt": refresh_token_expiry()
+    })
+    return access_token, refresh_token
+
 @router.post("/register", response_model=AuthResponse)
 async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Register a new user"""
@@ -18,8 +56,8 @@ async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get
         if existing_user:
             raise HTTPException(status_code=400, detail="Email já cadastrado")
         
-        # Create new user
-        hashed_password = hash_password(user_data.password)
+        # Create new user; bcrypt runs off the event loop
+        hashed_password = await asyncio.to_thread(hash_password, user_data.password)
         user = User(
             name=user_data.name,
             email=user_data.email,
@@ -34,17 +72,20 @@ async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get
         if not result.inserted_id:
             raise HTTPException(status_code=500, detail="Erro ao criar usuário")
         
-        # Create JWT token
-        token = create_access_token({"user_id": user.id, "email": user.email})
+        # Seed sample workouts
+        await initialize_user_workouts(get_user_database(user.id), user.id)
+        
+        # Create JWT tokens
+        token, refresh_token = await issue_tokens(db, user.id, user.email)
         
         # Return response
         user_response = UserResponse(**user.dict())
-        return AuthResponse(success=True, user=user_response, token=token)
+        return AuthResponse(success=True, user=user_response, token=token, refreshToken=refresh_token)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Registration error: {str(e)}")
+        logger.error("Registration error: %s", e)
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @router.post("/login", response_model=AuthResponse)
@@ -56,12 +97,20 @@ async def login(login_data: UserLogin, db: AsyncIOMotorDatabase = Depends(get_da
         if not user_doc:
             raise HTTPException(status_code=401, detail="Email ou senha incorretos")
         
-        # Verify password
-        if not verify_password(login_data.password, user_doc["passwordHash"]):
+        # Verify password, off the event loop
+        if not await asyncio.to_thread(verify_password, login_data.password, user_doc["passwordHash"]):
             raise HTTPException(status_code=401, detail="Email ou senha incorretos")
         
-        # Create JWT token
-        token = create_access_token({"user_id": user_doc["id"], "email": user_doc["email"]})
+        # Upgrade hashes made with a different cost factor in the background
+        if needs_rehash(user_doc["passwordHash"]):
+            task = asyncio.create_task(
+                rehash_password(db, user_doc["id"], login_data.password, user_doc["passwordHash"])
+            )
+            _rehash_tasks.add(task)
+            task.add_done_callback(_rehash_tasks.discard)
+        
+        # Create JWT tokens
+        token, refresh_token = await issue_tokens(db, user_doc["id"], user_doc["email"])
         
         # Prepare user response
         user_response = UserResponse(
@@ -73,10 +122,55 @@ async def login(login_data: UserLogin, db: AsyncIOMotorDatabase = Depends(get_da
             streak=user_doc.get("streak", 0)
         )
         
-        return AuthResponse(success=True, user=user_response, token=token)
+        return AuthResponse(success=True, user=user_response, token=token, refreshToken=refresh_token)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Login error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh(refresh_data: RefreshRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Exchange a refresh token for a new token pair (the old one is consumed)"""
+    try:
+        token_doc = await db.refresh_tokens.find_one_and_delete({
+            "tokenHash": hash_refresh_token(refresh_data.refreshToken),
+            "expiresAt": {"$gt": datetime.utcnow()}
+        })
+        if not token_doc:
+            raise HTTPException(
+                status_code=401,
+                detail="Sessão expirada",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+        
+        token, refresh_token = await issue_tokens(db, token_doc["userId"], token_doc["email"])
+        return TokenResponse(success=True, token=token, refreshToken=refresh_token)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Login error: {str(e)}")
+        logger.error("Refresh error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@router.post("/logout")
+async def logout(
+    logout_data: LogoutRequest,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Revoke the current access token and its refresh token"""
+    try:
+        await revoke_token(db, current_user)
+        if logout_data.refreshToken:
+            await db.refresh_tokens.delete_one({
+                "tokenHash": hash_refresh_token(logout_data.refreshToken),
+                "userId": current_user["user_id"]
+            })
+        
+        return {"success": True}
+        
+    except Exception as e:
+        logger.error("Logout error: %s", e)
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
\ No newline at end of file
@@ -0,0 +1,228 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from typing import Dict, List, Optional
+from models.coach import (
+    CoachLink, CoachInviteResponse, RedeemInviteRequest, CoachAthlete,
+    AthleteWeek, AthleteProgress, AthleteProgressPage
+)
+from auth.dependencies import get_current_user, get_user_loader, UserLoader
+from database import get_database, get_shard_router
+from leaderboard import week_key
+from datetime import datetime, timedelta
+import secrets
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/coach", tags=["coach"])
+
+INVITE_TTL_HOURS = 48
+# Unambiguous characters for codes read aloud or typed by hand
+INVITE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+INVITE_CODE_LENGTH = 8
+
+async def _links_page(db: AsyncIOMotorDatabase, coach_id: str, cursor: Optional[str], limit: int) -> List[Dict]:
+    """One page of a coach's links, ordered by athlete id"""
+    query = {"coachId": coach_id}
+    if cursor:
+        query["athleteId"] = {"$gt": cursor}
+    return await db.coach_links.find(query, {"_id": 0}).sort("athleteId", 1).limit(limit).to_list(limit)
+
+def _athlete(link: Dict, users: Dict[str, Dict]) -> CoachAthlete:
+    user = users.get(link["athleteId"], {})
+    return CoachAthlete(
+        id=link["athleteId"],
+        name=user.get("name", ""),
+        avatar=user.get("avatar"),
+        linkedAt=link["createdAt"]
+    )
+
+async def weekly_stats(athlete_ids: List[str], start: datetime) -> Dict[str, Dict[str, Dict]]:
+    """Per-athlete, per-ISO-week volume, weight and workout count: one aggregation per shard"""
+    stats: Dict[str, Dict[str, Dict]] = {athlete_id: {} for athlete_id in athlete_ids}
+    router = get_shard_router()
+    for shard_name, shard_athletes in router.group_by_shard(athlete_ids).items():
+        db = router.shards[shard_name].analytics_database
+        async for row in _weekly_stats_rows(db, shard_athletes, start):
+            stats[row["_id"]["userId"]][row["_id"]["week"]] = row
+    return stats
+
+def _weekly_stats_rows(db: AsyncIOMotorDatabase, athlete_ids: List[str], start: datetime):
+    return db.workouts.aggregate([
+        {"$match": {"userId": {"$in": athlete_ids}, "status": "completed", "date": {"$gte": start}}},
+        {"$project": {
+            "userId": 1,
+            "week": {"$dateToString": {"format": "%G-W%V", "date": "$date"}},
+            "exercises": {"$filter": {"input": "$exercises", "cond": "$$this.completed"}}
+        }},
+        {"$group": {
+            "_id": {"userId": "$userId", "week": "$week"},
+            "workouts": {"$sum": 1},
+            "volume": {"$sum": {"$sum": {"$map": {
+                "input": "$exercises",
+                "in": {"$multiply": ["$$this.sets", "$$this.reps", "$$this.weight"]}
+            }}}},
+            "weight": {"$sum": {"$sum": "$exercises.weight"}},
+            "exerciseCount": {"$sum": {"$size": "$exercises"}}
+        }}
+    ])
+
+@router.post("/invites", response_model=CoachInviteResponse)
+async def create_invite(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Create a one-time code that lets a coach follow the current user"""
+    try:
+        code = "".join(secrets.choice(INVITE_ALPHABET) for _ in range(INVITE_CODE_LENGTH))
+        expires_at = datetime.utcnow() + timedelta(hours=INVITE_TTL_HOURS)
+        await db.coach_invites.insert_one({
+            "code": code,
+            "athleteId": current_user["user_id"],
+            "expiresAt": expires_at
+        })
+        return CoachInviteResponse(code=code, expiresAt=expires_at)
+
+    except Exception as e:
+        logger.error("Create coach invite error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@router.post("/athletes", response_model=CoachAthlete)
+async def redeem_invite(
+    invite: RedeemInviteRequest,
+    loader: UserLoader = Depends(get_user_loader),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Start following an athlete using their invite code"""
+    try:
+        coach_id = loader.user_id
+        invite_doc = await db.coach_invites.find_one_and_delete({
+            "code": invite.code.strip().upper(),
+            "expiresAt": {"$gt": datetime.utcnow()}
+        })
+        if not invite_doc:
+            raise HTTPException(status_code=404, detail="Convite inválido ou expirado")
+        if invite_doc["athleteId"] == coach_id:
+            raise HTTPException(status_code=400, detail="Não é possível treinar a si mesmo")
+
+        link = CoachLink(coachId=coach_id, athleteId=invite_doc["athleteId"])
+        try:
+            await db.coach_links.insert_one(link.dict())
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Atleta já vinculado")
+
+        users = await loader.load_many([link.athleteId], ("name", "avatar"))
+        return _athlete(link.dict(), users)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Redeem coach invite error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@router.get("/athletes", response_model=List[CoachAthlete])
+async def list_athletes(
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=100),
+    loader: UserLoader = Depends(get_user_loader),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """List the athletes the current user coaches"""
+    try:
+        links = await _links_page(db, loader.user_id, cursor, limit)
+        users = await loader.load_many([link["athleteId"] for link in links], ("name", "avatar"))
+        return [_athlete(link, users) for link in links]
+
+    except Exception as e:
+        logger.error("List athletes error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@router.get("/athletes/progress", response_model=AthleteProgressPage)
+async def get_athletes_progress(
+    weeks: int = Query(7, ge=1, le=26),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(25, ge=1, le=100),
+    loader: UserLoader = Depends(get_user_loader),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Weekly progress of a page of athletes: a fixed number of queries per page, whatever its size"""
+    try:
+        links = await _links_page(db, loader.user_id, cursor, limit)
+        if not links:
+            return AthleteProgressPage(items=[])
+        athlete_ids = [link["athleteId"] for link in links]
+
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        start = today - timedelta(days=today.weekday(), weeks=weeks - 1)
+        week_labels = [week_key(start + timedelta(weeks=i)) for i in range(weeks)]
+
+        users = await loader.load_many(athlete_ids, ("name", "avatar", "streak"))
+        stats = await weekly_stats(athlete_ids, start)
+
+        items = []
+        for link in links:
+            athlete_weeks = []
+            for label in week_labels:
+                row = stats[link["athleteId"]].get(label)
+                if row is None:
+                    athlete_weeks.append(AthleteWeek(week=label, volume=0, weight=0, workouts=0))
+                    continue
+                athlete_weeks.append(AthleteWeek(
+                    week=label,
+                    volume=row["volume"],
+                    weight=row["weight"] / row["exerciseCount"] if row["exerciseCount"] > 0 else 0,
+                    workouts=row["workouts"]
+                ))
+            items.append(AthleteProgress(
+                athlete=_athlete(link, users),
+                currentStreak=users.get(link["athleteId"], {}).get("streak", 0),
+                totalVolume=sum(week.volume for week in athlete_weeks),
+                weeks=athlete_weeks
+            ))
+
+        return AthleteProgressPage(
+            items=items,
+            nextCursor=athlete_ids[-1] if len(links) == limit else None
+        )
+
+    except Exception as e:
+        logger.error("Get athletes progress error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@router.delete("/athletes/{athlete_id}")
+async def remove_athlete(
+    athlete_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Stop coaching an athlete"""
+    try:
+        result = await db.coach_links.delete_one({"coachId": current_user["user_id"], "athleteId": athlete_id})
+        if not result.deleted_count:
+            raise HTTPException(status_code=404, detail="Atleta não encontrado")
+        return {"success": True}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Remove athlete error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@router.delete("/coaches/{coach_id}")
+async def remove_coach(
+    coach_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Stop sharing progress with a coach"""
+    try:
+        result = await db.coach_links.delete_one({"coachId": coach_id, "athleteId": current_user["user_id"]})
+        if not result.deleted_count:
+            raise HTTPException(status_code=404, detail="Treinador não encontrado")
+        return {"success": True}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Remove coach error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
@@ -0,0 +1,77 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Optional
+from models.leaderboard import LeaderboardEntry, LeaderboardResponse, MyRankResponse
+from auth.dependencies import get_current_user, get_user_loader, UserLoader
+from database import get_database
+from leaderboard import week_key, week_bounds, top_entries, user_rank
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
+
+def resolve_week(week: Optional[str]) -> str:
+    """Validate an ISO week label, defaulting to the current week"""
+    if week is None:
+        return week_key()
+    try:
+        week_bounds(week)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Semana inválida (use AAAA-Wnn)")
+    return week
+
+@router.get("/weekly", response_model=LeaderboardResponse)
+async def get_weekly_leaderboard(
+    week: Optional[str] = Query(None),
+    limit: int = Query(10, ge=1, le=100),
+    loader: UserLoader = Depends(get_user_loader),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get the top users by training volume for a week"""
+    try:
+        week = resolve_week(week)
+        entries = await top_entries(db, week, limit)
+        
+        # Fetch display names for the page in one query
+        users = await loader.load_many([entry["userId"] for entry in entries], ("name", "avatar"))
+        
+        return LeaderboardResponse(
+            week=week,
+            entries=[
+                LeaderboardEntry(
+                    rank=entry["rank"],
+                    userId=entry["userId"],
+                    name=users.get(entry["userId"], {}).get("name", ""),
+                    avatar=users.get(entry["userId"], {}).get("avatar"),
+                    volume=entry["volume"]
+                )
+                for entry in entries
+            ]
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Get leaderboard error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@router.get("/weekly/me", response_model=MyRankResponse)
+async def get_my_rank(
+    week: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get the current user's rank for a week"""
+    try:
+        week = resolve_week(week)
+        rank = await user_rank(db, week, current_user["user_id"])
+        if not rank:
+            return MyRankResponse(week=week)
+        
+        return MyRankResponse(week=week, rank=rank["rank"], volume=rank["volume"])
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Get leaderboard rank error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
@@ -1,19 +1,33 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List
-from models.progress import WeeklyProgress, ProgressStats
-from auth.dependencies import get_current_user
-from database import get_database
+from models.progress import WeeklyProgress, ProgressStats, TrainingAnalytics
+from auth.dependencies import get_current_user, current_user_document, get_user_analytics_db
+from database import causal_session
+from analytics import load_set_history, compute_analytics, EPOCH, HISTORY_DAYS, MAX_WEEKS
+from history_cache import history_cache
+from field_selection import FieldSelection, field_selection
 from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/progress", tags=["progress"])
 
+# The only workout fields the progress stats read: names and image URLs are never decoded
+STATS_PROJECTION = {
+    "_id": 0,
+    "date": 1,
+    "exercises.completed": 1,
+    "exercises.sets": 1,
+    "exercises.reps": 1,
+    "exercises.weight": 1
+}
+
 @router.get("/weekly", response_model=List[WeeklyProgress])
 async def get_weekly_progress(
+    fields: FieldSelection = Depends(field_selection(WeeklyProgress)),
     current_user: dict = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_user_analytics_db)
 ):
     """Get weekly progress data"""
     try:
@@ -23,11 +37,12 @@ async def get_weekly_progress(
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(weeks=7)
         
-        workouts = await db.workouts.find({
-            "userId": user_id,
-            "status": "completed",
-            "date": {"$gte": start_date, "$lte": end_date}
-        }).to_list(1000)
+        async with causal_session(user_id, db) as session:
+            workouts = await db.workouts.find({
+                "userId": user_id,
+                "status": "completed",
+                "date": {"$gte": start_date, "$lte": end_date}
+            }, STATS_PROJECTION, session=session).to_list(1000)
         
         # Group workouts by week
         weekly_data = {}
@@ -80,36 +95,37 @@ async def get_weekly_progress(
                 workouts=3 + (week_num % 2)
             ))
         
-        return result[-7:]  # Return last 7 weeks
+        result = result[-7:]  # Return last 7 weeks
+        return fields.render(result) if fields.selected else result
         
     except Exception as e:
-        logger.error(f"Get weekly progress error: {str(e)}")
+        logger.error("Get weekly progress error: %s", e)
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @router.get("/stats", response_model=ProgressStats)
 async def get_progress_stats(
-    current_user: dict = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    fields: FieldSelection = Depends(field_selection(ProgressStats)),
+    user: dict = Depends(current_user_document("streak", "archived")),
+    db: AsyncIOMotorDatabase = Depends(get_user_analytics_db)
 ):
     """Get overall progress statistics"""
     try:
-        user_id = current_user["user_id"]
-        
-        # Get user data
-        user = await db.users.find_one({"id": user_id})
-        if not user:
-            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        user_id = user["id"]
         
-        # Get completed workouts
-        completed_workouts = await db.workouts.find({
-            "userId": user_id,
-            "status": "completed"
-        }).to_list(1000)
+        # Get completed workouts, unless only the streak was asked for
+        completed_workouts = []
+        if fields.includes("totalVolume", "avgWeight", "completedWorkouts"):
+            async with causal_session(user_id, db) as session:
+                completed_workouts = await db.workouts.find({
+                    "userId": user_id,
+                    "status": "completed"
+                }, STATS_PROJECTION, session=session).to_list(1000)
         
-        # Calculate stats
-        total_volume = 0
-        total_weight = 0
-        exercise_count = 0
+        # Calculate stats, starting from the totals of the archived workouts
+        archived = user.get("archived", {})
+        total_volume = archived.get("volume", 0)
+        total_weight = archived.get("weight", 0)
+        exercise_count = archived.get("exercises", 0)
         
         for workout in completed_workouts:
             for exercise in workout["exercises"]:
@@ -121,15 +137,43 @@ async def get_progress_stats(
         
         avg_weight = total_weight / exercise_count if exercise_count > 0 else 0
         
-        return ProgressStats(
+        stats = ProgressStats(
             totalVolume=total_volume,
             avgWeight=avg_weight,
-            completedWorkouts=len(completed_workouts),
+            completedWorkouts=archived.get("workouts", 0) + len(completed_workouts),
             currentStreak=user.get("streak", 0)
         )
+        return fields.render(stats) if fields.selected else stats
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Get progress stats error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Erro interno do servidor")
\ No newline at end of file
+        logger.error("Get progress stats error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@router.get("/analytics", response_model=TrainingAnalytics)
+async def get_training_analytics(
+    weeks: int = Query(12, ge=1, le=MAX_WEEKS),
+    horizon_weeks: int = Query(4, alias="horizonWeeks", ge=1, le=26),
+    fields: FieldSelection = Depends(field_selection(TrainingAnalytics)),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_user_analytics_db)
+):
+    """Volume trends, muscle group load and working weight projections"""
+    try:
+        user_id = current_user["user_id"]
+        
+        async def load():
+            async with causal_session(user_id, db) as session:
+                since = datetime.utcnow() - timedelta(days=HISTORY_DAYS)
+                return await load_set_history(db, user_id, since=since, session=session)
+        
+        history = await history_cache.get_or_load(user_id, load)
+        
+        today = (datetime.utcnow() - EPOCH).days
+        analytics = TrainingAnalytics(**compute_analytics(history, today, weeks, horizon_weeks))
+        return fields.render(analytics) if fields.selected else analytics
+        
+    except Exception as e:
+        logger.error("Get training analytics error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
@@ -0,0 +1,61 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Optional
+from models.sync import SyncResponse
+from models.user import UserResponse
+from models.workout import WorkoutResponse
+from auth.dependencies import current_user_document, get_user_db
+from delta_sync import changes_since, decode_cursor, encode_cursor, tombstones_cover, to_millis
+from routes.user import PROFILE_FIELDS
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+@router.get("", response_model=SyncResponse)
+async def sync(
+    since: Optional[str] = Query(None, description="Cursor returned by the previous sync; omit for a full sync"),
+    limit: int = Query(200, ge=1, le=500),
+    user_doc: dict = Depends(current_user_document(*PROFILE_FIELDS, "updatedAt")),
+    db: AsyncIOMotorDatabase = Depends(get_user_db)
+):
+    """Workouts changed or deleted since the cursor, and the profile if it changed"""
+    try:
+        position = None
+        if since:
+            try:
+                position = decode_cursor(since)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Cursor de sincronização inválido")
+        reset = position is not None and not tombstones_cover(position)
+        if reset:
+            position = None
+
+        workouts, deleted, next_position, has_more = await changes_since(db, user_doc["id"], position, limit)
+
+        profile = None
+        updated_at = user_doc.get("updatedAt")
+        if position is None or (updated_at is not None and to_millis(updated_at) > position[0]):
+            profile = UserResponse(
+                id=user_doc["id"],
+                name=user_doc["name"],
+                email=user_doc["email"],
+                avatar=user_doc.get("avatar"),
+                totalWorkouts=user_doc.get("totalWorkouts", 0),
+                streak=user_doc.get("streak", 0)
+            )
+
+        return SyncResponse(
+            workouts=[WorkoutResponse(**workout) for workout in workouts],
+            deleted=deleted,
+            profile=profile,
+            cursor=encode_cursor(next_position),
+            hasMore=has_more,
+            reset=reset
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Sync error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
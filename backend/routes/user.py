@@ -1,24 +1,417 @@
-from fastapi import APIRouter, HTTPException, Depends
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from models.user import UserResponse
-from auth.dependencies import get_current_user
-from database import get_database
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorDatabase
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from models.user import UserResponse, ImportResponse, ImportRowError
+from models.workout import Workout, SetLog
+from auth.dependencies import get_current_user, current_user_document, get_user_db
+from database import causal_session
+from archive import iter_workouts
+from analytics import workout_set_logs
+from history_cache import history_cache
+from collections import deque
+from datetime import datetime
+from typing import Optional
+import codecs
+import csv
+import io
+import json
+import zlib
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/user", tags=["user"])
 
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# One CSV row per exercise (set log) of each workout
+EXPORT_CSV_COLUMNS = [
+    "workoutId", "workoutName", "date", "status", "progress",
+    "exerciseId", "exerciseName", "sets", "reps", "weight",
+    "restTime", "completed", "completedSets", "image",
+]
+
+# Keep at most this many per-row errors in the import response
+IMPORT_MAX_REPORTED_ERRORS = 100
+# Imported history is finished: scheduled workouts come from the user's plan
+IMPORT_STATUSES = ("completed", "skipped")
+
+def _json_default(value):
+    """Serialize values the json module does not handle natively"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def _ndjson_line(record: dict) -> str:
+    return json.dumps(record, default=_json_default, ensure_ascii=False) + "\n"
+
+def _csv_rows(workout: dict):
+    """Flatten a workout document into one CSV row per exercise"""
+    base = [
+        workout.get("id"),
+        workout.get("name"),
+        _json_default(workout["date"]) if workout.get("date") else "",
+        workout.get("status"),
+        workout.get("progress", 0),
+    ]
+    exercises = workout.get("exercises") or [{}]
+    for exercise in exercises:
+        yield base + [
+            exercise.get("id", ""),
+            exercise.get("name", ""),
+            exercise.get("sets", ""),
+            exercise.get("reps", ""),
+            exercise.get("weight", ""),
+            exercise.get("restTime", ""),
+            exercise.get("completed", ""),
+            exercise.get("completedSets", ""),
+            exercise.get("image") or "",
+        ]
+
+async def _export_chunks(db: AsyncIOMotorDatabase, user_doc: dict, export_format: str, batch_size: int):
+    """Yield the user's history, archived workouts and set logs included, in text chunks of at most one cursor batch each"""
+    workouts = iter_workouts(db, {"userId": user_doc["id"]}, {"_id": 0}, batch_size)
+
+    buffer = io.StringIO()
+    if export_format == "ndjson":
+        profile = {key: value for key, value in user_doc.items() if key not in ("_id", "passwordHash")}
+        buffer.write(_ndjson_line({"type": "profile", **profile}))
+    else:
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_CSV_COLUMNS)
+
+    buffered = 0
+
+    def flush() -> str:
+        nonlocal buffered
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        buffered = 0
+        return chunk
+
+    async for workout in workouts:
+        if export_format == "ndjson":
+            buffer.write(_ndjson_line({"type": "workout", **workout}))
+        else:
+            writer.writerows(_csv_rows(workout))
+        buffered += 1
+
+        # Flush once per cursor batch so memory stays bounded by batch_size
+        if buffered >= batch_size:
+            yield flush()
+
+    # The set history behind the analytics; CSV has one row per exercise and
+    # cannot carry it, so a CSV import rebuilds it from the completed sets
+    if export_format == "ndjson":
+        set_logs = db.set_logs.find({"userId": user_doc["id"]}, {"_id": 0, "userId": 0}) \
+            .sort("completedAt", 1).batch_size(batch_size)
+        async for set_log in set_logs:
+            buffer.write(_ndjson_line({"type": "set_log", **set_log}))
+            buffered += 1
+            if buffered >= batch_size:
+                yield flush()
+
+    remaining = buffer.getvalue()
+    if remaining:
+        yield remaining
+
+async def _encode_chunks(chunks, compress: bool):
+    """Encode text chunks as UTF-8, optionally through a streaming gzip compressor"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    try:
+        async for chunk in chunks:
+            data = chunk.encode("utf-8")
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+        if compressor:
+            yield compressor.flush()
+    except Exception as e:
+        logger.error("Export stream error: %s", e)
+        raise
+
+async def _iter_lines(stream):
+    """Split a streamed request body into decoded text lines"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    async for chunk in stream:
+        text = tail + decoder.decode(chunk)
+        lines = text.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail.rstrip("\r")
+
+def _csv_exercise(record: dict) -> Optional[dict]:
+    """Build an exercise dict from a CSV row, or None for workouts without exercises"""
+    if not record.get("exerciseName"):
+        return None
+    exercise = {
+        "name": record["exerciseName"],
+        "sets": record.get("sets"),
+        "reps": record.get("reps"),
+        "weight": record.get("weight"),
+        "restTime": record.get("restTime"),
+        "completed": (record.get("completed") or "").lower() == "true",
+        "completedSets": record.get("completedSets") or 0,
+        "image": record.get("image") or None,
+    }
+    if record.get("exerciseId"):
+        exercise["id"] = record["exerciseId"]
+    return exercise
+
+class _LineFeed:
+    """Lines for the import's csv.reader, handed over a whole record at a time"""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+async def _iter_csv_rows(lines):
+    """Yield (line number, values) per CSV record, or values None for an unterminated quoted field.
+
+    One csv.reader parses the whole upload. It is only asked for a record once
+    all of its lines have arrived: a line with an odd number of quotes opens
+    (or closes) a quoted field that continues on the next line.
+    """
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    in_quotes = False
+    async for line in lines:
+        feed.lines.append(line + "\n")
+        if line.count('"') % 2:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            row = reader.line_num + 1
+            values = next(reader)
+            if any(value.strip() for value in values):
+                yield row, values
+    if feed.lines:
+        yield reader.line_num + 1, None
+
+async def _iter_import_records(lines, import_format: str):
+    """Yield (row number, type, record) triples, type "workout" or "set_log"; CSV rows are grouped by workoutId"""
+    if import_format == "ndjson":
+        row = 0
+        async for line in lines:
+            row += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield row, "workout", None
+                continue
+            if not isinstance(record, dict):
+                yield row, "workout", None
+                continue
+            record_type = record.pop("type", "workout")
+            if record_type in ("workout", "set_log"):
+                yield row, record_type, record
+        return
+
+    header = None
+    current = None
+    current_row = 0
+    async for row, values in _iter_csv_rows(lines):
+        if values is None:
+            yield row, "workout", None
+            continue
+        if header is None:
+            header = values
+            continue
+        record = dict(zip(header, values))
+        workout_id = record.get("workoutId")
+
+        if current is None or not workout_id or workout_id != current.get("id"):
+            if current is not None:
+                yield current_row, "workout", current
+            current_row = row
+            current = {
+                "name": record.get("workoutName"),
+                "date": record.get("date") or None,
+                "status": record.get("status") or "completed",
+                "progress": record.get("progress") or 0,
+                "exercises": [],
+            }
+            if workout_id:
+                current["id"] = workout_id
+
+        exercise = _csv_exercise(record)
+        if exercise:
+            current["exercises"].append(exercise)
+
+    if current is not None:
+        yield current_row, "workout", current
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors())
+
+async def import_records(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    records,
+    chunk_size: int,
+    session: Optional[AsyncIOMotorClientSession] = None
+) -> ImportResponse:
+    """Validate imported workouts and set logs and insert them in unordered chunks.
+
+    Imported workouts are new on this server: they get a fresh updatedAt (so
+    syncing clients receive them) and version. Only finished workouts
+    (IMPORT_STATUSES; completed when unset) are accepted, so an import never
+    competes with the user's plan for a day; one dated exactly on a booked day
+    fails its row, as workouts are unique by (userId, date). Their completed sets are logged
+    as derived set logs, unless the upload carries the set logs themselves
+    (NDJSON exports do, after the workouts), which then replace them. Set logs
+    are only accepted for workouts inserted by the same import.
+    """
+    imported = 0
+    imported_set_logs = 0
+    completed = 0
+    last_completed_at = None
+    failed = 0
+    errors = []
+    # Workouts inserted so far, and those whose derived set logs were already replaced
+    inserted_ids = set()
+    replaced_ids = set()
+
+    def report(row: int, message: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+            errors.append(ImportRowError(row=row, error=message))
+
+    async def flush_workouts(docs: list, rows: list):
+        """Insert one chunk; the stream is not read again until this completes"""
+        nonlocal imported, imported_set_logs, completed, last_completed_at
+        failed_indexes = set()
+        try:
+            await db.workouts.insert_many(docs, ordered=False, session=session)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                failed_indexes.add(write_error["index"])
+                report(rows[write_error["index"]], write_error.get("errmsg", "Erro ao inserir"))
+
+        set_logs = []
+        for i, doc in enumerate(docs):
+            if i in failed_indexes:
+                continue
+            imported += 1
+            inserted_ids.add(doc["id"])
+            set_logs.extend(workout_set_logs(doc))
+            if doc["status"] == "completed":
+                completed += 1
+                finished_at = doc["completedAt"] or doc["date"]
+                last_completed_at = finished_at if last_completed_at is None else max(last_completed_at, finished_at)
+        if set_logs:
+            await db.set_logs.insert_many(set_logs, ordered=False, session=session)
+            imported_set_logs += len(set_logs)
+
+    async def flush_set_logs(logs: list):
+        nonlocal imported_set_logs
+        replacing = list({log["workoutId"] for log in logs} - replaced_ids)
+        if replacing:
+            removed = await db.set_logs.delete_many(
+                {"userId": user_id, "workoutId": {"$in": replacing}, "derived": True}, session=session
+            )
+            imported_set_logs -= removed.deleted_count
+            replaced_ids.update(replacing)
+        await db.set_logs.insert_many(logs, ordered=False, session=session)
+        imported_set_logs += len(logs)
+
+    docs = []
+    rows = []
+    logs = []
+    async for row, record_type, record in records:
+        if record is None:
+            report(row, "Linha inválida")
+            continue
+
+        if record_type == "set_log":
+            try:
+                set_log = SetLog(**record)
+            except ValidationError as e:
+                report(row, _validation_message(e))
+                continue
+            # The workout may still be waiting in the current chunk
+            if docs and set_log.workoutId not in inserted_ids:
+                await flush_workouts(docs, rows)
+                docs = []
+                rows = []
+            # Logs of workouts that failed to import (already reported) are dropped
+            if set_log.workoutId in inserted_ids:
+                logs.append({"userId": user_id, **set_log.dict()})
+                if len(logs) >= chunk_size:
+                    await flush_set_logs(logs)
+                    logs = []
+            continue
+
+        try:
+            workout = Workout(**{
+                **record, "status": record.get("status") or "completed", "userId": user_id,
+                "updatedAt": datetime.utcnow(), "version": 0
+            })
+        except ValidationError as e:
+            report(row, _validation_message(e))
+            continue
+        if workout.status not in IMPORT_STATUSES:
+            report(row, f"status: apenas {' ou '.join(IMPORT_STATUSES)} podem ser importados")
+            continue
+
+        docs.append(workout.dict())
+        rows.append(row)
+        if len(docs) >= chunk_size:
+            await flush_workouts(docs, rows)
+            docs = []
+            rows = []
+
+    if docs:
+        await flush_workouts(docs, rows)
+    if logs:
+        await flush_set_logs(logs)
+
+    # Update user rollups once for the whole import. The streak is left alone:
+    # it counts consecutive live completions and is expired by the scheduler
+    if completed:
+        # Users live on the home shard: the session only applies when that is the user's shard too
+        users_session = session if session and session.client is db.users.database.client else None
+        await db.users.update_one(
+            {"id": user_id},
+            {
+                "$inc": {"totalWorkouts": completed},
+                "$max": {"lastWorkoutAt": last_completed_at},
+                "$set": {"updatedAt": datetime.utcnow()}
+            },
+            session=users_session
+        )
+
+    return ImportResponse(
+        success=failed == 0, imported=imported, setLogs=imported_set_logs, failed=failed, errors=errors
+    )
+
+PROFILE_FIELDS = ("id", "name", "email", "avatar", "totalWorkouts", "streak")
+
 @router.get("/profile", response_model=UserResponse)
 async def get_profile(
-    current_user: dict = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    user_doc: dict = Depends(current_user_document(*PROFILE_FIELDS))
 ):
     """Get user profile"""
     try:
-        user_doc = await db.users.find_one({"id": current_user["user_id"]})
-        if not user_doc:
-            raise HTTPException(status_code=404, detail="Usuário não encontrado")
-        
         return UserResponse(
             id=user_doc["id"],
             name=user_doc["name"],
@@ -31,5 +424,64 @@ async def get_profile(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Get profile error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Erro interno do servidor")
\ No newline at end of file
+        logger.error("Get profile error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@router.get("/export")
+async def export_history(
+    format: str = Query("ndjson"),
+    batch_size: int = Query(500, ge=1, le=5000),
+    compress: bool = Query(False),
+    user_doc: dict = Depends(current_user_document()),
+    db: AsyncIOMotorDatabase = Depends(get_user_db)
+):
+    """Stream the user's full workout history as NDJSON (with set logs) or CSV"""
+    try:
+        if format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail="Formato de exportação inválido")
+
+        filename = f"fitness-export-{datetime.utcnow().strftime('%Y%m%d')}.{format}"
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+
+        return StreamingResponse(
+            _encode_chunks(_export_chunks(db, user_doc, format, batch_size), compress),
+            media_type=EXPORT_FORMATS[format],
+            headers=headers
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Export error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+
+@router.post("/import", response_model=ImportResponse)
+async def import_history(
+    request: Request,
+    format: str = Query("ndjson"),
+    chunk_size: int = Query(1000, ge=1, le=10000),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_user_db)
+):
+    """Import workout history from a streamed NDJSON or CSV upload"""
+    try:
+        if format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail="Formato de importação inválido")
+
+        user_id = current_user["user_id"]
+        records = _iter_import_records(_iter_lines(request.stream()), format)
+
+        # Written in one causal session so the user's analytics reads see the import
+        async with causal_session(user_id, db) as session:
+            result = await import_records(db, user_id, records, chunk_size, session)
+        history_cache.invalidate(user_id)
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Import error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
@@ -1,15 +1,35 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response, WebSocket, WebSocketDisconnect
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List
-from models.workout import Workout, WorkoutResponse, CompleteSetRequest, CompleteSetResponse
-from auth.dependencies import get_current_user
-from database import get_database
-from datetime import datetime, timedelta
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from typing import Dict, List, Optional
+from models.workout import (
+    Workout, WorkoutResponse, CompleteSetRequest, CompleteSetResponse, LiveCompleteSet,
+    PlanRequest, PlanResponse
+)
+from auth.dependencies import get_current_user, get_user_db, authenticate_token
+from database import get_user_database, get_shard_router, causal_session
+from leaderboard import record_workout_volume, workout_volume
+from live import hub, LiveConnection
+from history_cache import history_cache
+from field_selection import FieldSelection, field_selection
+from archive import find_workouts
+from delta_sync import record_deletions
+from datetime import datetime, timedelta, date
+import asyncio
+import json
+import random
 import logging
 
+import metrics
+
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/workouts", tags=["workouts"])
 
+# Conditional workout writes retried on version conflicts
+UPDATE_ATTEMPTS = 5
+UPDATE_RETRY_BASE_SECONDS = 0.01
+
 # Sample workout templates
 SAMPLE_WORKOUTS = [
     {
@@ -80,55 +100,120 @@ SAMPLE_WORKOUTS = [
     }
 ]
 
+WORKOUT_TEMPLATES = {template["name"]: template for template in SAMPLE_WORKOUTS}
+
+# Weekday (0 = Monday) -> template name; Sunday is a rest day
+DEFAULT_SPLIT = {
+    0: "Peito e Tríceps",
+    1: "Costas e Bíceps",
+    2: "Peito e Tríceps",
+    3: "Costas e Bíceps",
+    4: "Peito e Tríceps",
+    5: "Costas e Bíceps",
+}
+DEFAULT_PLAN_WEEKS = 4
+# Plans are extended by DEFAULT_PLAN_WEEKS once fewer days than this are scheduled ahead
+PLAN_HORIZON_DAYS = 14
+MAX_RANGE_DAYS = 92
+# Subprotocol carrying the access token of live sessions
+LIVE_AUTH_PROTOCOL = "bearer"
+
+def start_of_day(moment: Optional[datetime] = None) -> datetime:
+    return (moment or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def build_plan(user_id: str, split: Dict[int, str], weeks: int, start: datetime) -> List[dict]:
+    """Materialize `weeks` weeks of scheduled workouts from a weekday -> template split"""
+    today = start_of_day()
+    workouts = []
+    for offset in range(weeks * 7):
+        day = start + timedelta(days=offset)
+        template_name = split.get(day.weekday())
+        if template_name is None:
+            continue
+        template = WORKOUT_TEMPLATES[template_name]
+        workouts.append(Workout(
+            userId=user_id,
+            name=template["name"],
+            date=day,
+            status="active" if day == today else "pending",
+            exercises=[
+                {
+                    "id": f"ex_{j}",
+                    "name": ex["name"],
+                    "sets": ex["sets"],
+                    "reps": ex["reps"],
+                    "weight": ex["weight"],
+                    "restTime": ex["restTime"],
+                    "completed": False,
+                    "completedSets": 0,
+                    "image": ex["image"]
+                }
+                for j, ex in enumerate(template["exercises"])
+            ]
+        ).dict())
+    return workouts
+
+def stored_split(user: Optional[Dict]) -> Dict[int, str]:
+    """The split a user last planned with (users.planSplit), or the default one"""
+    split = (user or {}).get("planSplit")
+    if not split:
+        return DEFAULT_SPLIT
+    return {int(weekday): template for weekday, template in split.items() if template in WORKOUT_TEMPLATES}
+
+async def record_plan_end(db: AsyncIOMotorDatabase, user_id: str, ends_at: datetime):
+    """Remember the last planned day (users.planEndsAt), so reads know when the plan runs out"""
+    await db.users.update_one({"id": user_id}, {"$max": {"planEndsAt": ends_at}})
+
+async def extend_plan(db: AsyncIOMotorDatabase, user_id: str, split: Dict[int, str], latest: Optional[datetime]) -> int:
+    """Schedule DEFAULT_PLAN_WEEKS more weeks after `latest`, the last planned day, once it is within the horizon"""
+    today = start_of_day()
+    if latest is not None and latest >= today + timedelta(days=PLAN_HORIZON_DAYS):
+        await record_plan_end(db, user_id, latest)
+        return 0
+    start = max(start_of_day(latest) + timedelta(days=1), today) if latest is not None else today
+    workouts = build_plan(user_id, split, DEFAULT_PLAN_WEEKS, start)
+    created = 0
+    if workouts:
+        # Upserts by day, so the request path and the plan job never book a day twice
+        result = await db.workouts.bulk_write([
+            UpdateOne({"userId": user_id, "date": workout["date"]}, {"$setOnInsert": workout}, upsert=True)
+            for workout in workouts
+        ], ordered=False)
+        created = result.upserted_count
+    # A split without training days still covers its weeks
+    await record_plan_end(db, user_id, workouts[-1]["date"] if workouts else start + timedelta(weeks=DEFAULT_PLAN_WEEKS, days=-1))
+    return created
+
+async def ensure_plan(db: AsyncIOMotorDatabase, user_id: str) -> int:
+    """Extend the user's plan if it is running out (or start one); returns the workouts created"""
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "planSplit": 1, "planEndsAt": 1})
+    ends_at = (user or {}).get("planEndsAt")
+    if ends_at is not None and ends_at >= start_of_day() + timedelta(days=PLAN_HORIZON_DAYS):
+        return 0
+    latest = await db.workouts.find_one({"userId": user_id}, {"_id": 0, "date": 1}, sort=[("date", -1)])
+    return await extend_plan(db, user_id, stored_split(user), latest["date"] if latest else None)
+
 async def initialize_user_workouts(db: AsyncIOMotorDatabase, user_id: str):
-    """Initialize sample workouts for new user"""
+    """Initialize a default training plan for new user"""
     try:
-        # Check if user already has workouts
-        existing_workouts = await db.workouts.count_documents({"userId": user_id})
-        if existing_workouts > 0:
-            return
-        
-        # Create sample workouts
-        for i, template in enumerate(SAMPLE_WORKOUTS):
-            workout = Workout(
-                userId=user_id,
-                name=template["name"],
-                date=datetime.utcnow() + timedelta(days=i),
-                status="active" if i == 0 else "pending",
-                exercises=[
-                    {
-                        "id": f"ex_{j}",
-                        "name": ex["name"],
-                        "sets": ex["sets"],
-                        "reps": ex["reps"],
-                        "weight": ex["weight"],
-                        "restTime": ex["restTime"],
-                        "completed": False,
-                        "completedSets": 0,
-                        "image": ex["image"]
-                    }
-                    for j, ex in enumerate(template["exercises"])
-                ]
-            )
-            await db.workouts.insert_one(workout.dict())
-            
+        await ensure_plan(db, user_id)
     except Exception as e:
-        logger.error(f"Error initializing workouts: {str(e)}")
+        logger.error("Error initializing workouts: %s", e)
 
 @router.get("/", response_model=List[WorkoutResponse])
 async def get_workouts(
+    fields: FieldSelection = Depends(field_selection(WorkoutResponse)),
     current_user: dict = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_user_db)
 ):
-    """Get all workouts for current user"""
+    """Get the current user's workouts (archived ones are only returned by date range or export)"""
     try:
         user_id = current_user["user_id"]
         
-        # Initialize workouts if user has none
-        await initialize_user_workouts(db, user_id)
-        
         # Get workouts
-        workouts = await db.workouts.find({"userId": user_id}).sort("date", 1).to_list(100)
+        workouts = await db.workouts.find({"userId": user_id}, fields.projection()).sort("date", 1).to_list(100)
+        if fields.selected:
+            return fields.render(workouts)
         
         return [
             WorkoutResponse(
@@ -137,48 +222,45 @@ async def get_workouts(
                 date=workout["date"],
                 status=workout["status"],
                 progress=workout["progress"],
-                exercises=workout["exercises"]
+                exercises=workout["exercises"],
+                version=workout.get("version", 0)
             )
             for workout in workouts
         ]
         
     except Exception as e:
-        logger.error(f"Get workouts error: {str(e)}")
+        logger.error("Get workouts error: %s", e)
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @router.get("/today", response_model=WorkoutResponse)
 async def get_today_workout(
+    fields: FieldSelection = Depends(field_selection(WorkoutResponse)),
     current_user: dict = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_user_db)
 ):
     """Get today's workout"""
     try:
         user_id = current_user["user_id"]
         
-        # Initialize workouts if user has none
-        await initialize_user_workouts(db, user_id)
-        
-        # Find active workout
-        workout = await db.workouts.find_one({
-            "userId": user_id,
-            "status": "active"
-        })
-        
-        if not workout:
-            # If no active workout, make the first pending workout active
-            workout = await db.workouts.find_one({
-                "userId": user_id,
-                "status": "pending"
-            })
-            if workout:
-                await db.workouts.update_one(
-                    {"id": workout["id"]},
-                    {"$set": {"status": "active"}}
-                )
-                workout["status"] = "active"
+        # Point query on the (userId, date) index
+        today = start_of_day()
+        workout = await db.workouts.find_one(
+            {"userId": user_id, "date": {"$gte": today, "$lt": today + timedelta(days=1)}},
+            fields.projection(),
+            sort=[("date", 1)]
+        )
+        if not workout and await ensure_plan(db, user_id):
+            # The plan had run out (users.planEndsAt; the plan job catches up with everyone else)
+            workout = await db.workouts.find_one(
+                {"userId": user_id, "date": {"$gte": today, "$lt": today + timedelta(days=1)}},
+                fields.projection(),
+                sort=[("date", 1)]
+            )
         
         if not workout:
             raise HTTPException(status_code=404, detail="Nenhum treino encontrado para hoje")
+        if fields.selected:
+            return fields.render(workout)
         
         return WorkoutResponse(
             id=workout["id"],
@@ -186,31 +268,156 @@ async def get_today_workout(
             date=workout["date"],
             status=workout["status"],
             progress=workout["progress"],
-            exercises=workout["exercises"]
+            exercises=workout["exercises"],
+            version=workout.get("version", 0)
         )
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Get today workout error: {str(e)}")
+        logger.error("Get today workout error: %s", e)
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
-@router.post("/{workout_id}/exercises/{exercise_id}/complete-set", response_model=CompleteSetResponse)
-async def complete_set(
-    workout_id: str,
-    exercise_id: str,
-    set_data: CompleteSetRequest,
+@router.get("/upcoming", response_model=List[WorkoutResponse])
+async def get_upcoming_workouts(
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    fields: FieldSelection = Depends(field_selection(WorkoutResponse)),
     current_user: dict = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    db: AsyncIOMotorDatabase = Depends(get_user_db)
 ):
-    """Complete a set for an exercise"""
+    """Get scheduled workouts in a date range (default: the next 7 days)"""
+    try:
+        range_start = datetime.combine(start, datetime.min.time()) if start else start_of_day()
+        range_end = datetime.combine(end, datetime.min.time()) + timedelta(days=1) if end else range_start + timedelta(days=7)
+        
+        if range_end <= range_start:
+            raise HTTPException(status_code=400, detail="Intervalo de datas inválido")
+        if range_end - range_start > timedelta(days=MAX_RANGE_DAYS):
+            raise HTTPException(status_code=400, detail=f"Intervalo máximo de {MAX_RANGE_DAYS} dias")
+        
+        # Ranges reaching back past the archive cutoff read the archive as well
+        workouts = await find_workouts(
+            db,
+            {"userId": current_user["user_id"], "date": {"$gte": range_start, "$lt": range_end}},
+            range_start,
+            fields.projection(always=("date",)),
+            MAX_RANGE_DAYS * 3
+        )
+        if fields.selected:
+            return fields.render(workouts)
+        
+        return [
+            WorkoutResponse(
+                id=workout["id"],
+                name=workout["name"],
+                date=workout["date"],
+                status=workout["status"],
+                progress=workout["progress"],
+                exercises=workout["exercises"],
+                version=workout.get("version", 0)
+            )
+            for workout in workouts
+        ]
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Get upcoming workouts error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+@router.post("/plan", response_model=PlanResponse)
+async def generate_plan(
+    plan: PlanRequest,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_user_db)
+):
+    """Generate a training plan, replacing pending workouts in its date range (days already trained or skipped are kept)"""
     try:
         user_id = current_user["user_id"]
         
+        if plan.split is None:
+            split = DEFAULT_SPLIT
+        else:
+            unknown = [day.template for day in plan.split if day.template not in WORKOUT_TEMPLATES]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Treino desconhecido: {unknown[0]}")
+            split = {day.weekday: day.template for day in plan.split}
+        
+        start = datetime.combine(plan.startDate, datetime.min.time()) if plan.startDate else start_of_day()
+        end = start + timedelta(weeks=plan.weeks)
+        workouts = build_plan(user_id, split, plan.weeks, start)
+        
+        replaced_query = {"userId": user_id, "status": "pending", "date": {"$gte": start, "$lt": end}}
+        replaced = await db.workouts.distinct("id", replaced_query)
+        if replaced:
+            await db.workouts.delete_many({**replaced_query, "id": {"$in": replaced}})
+            # Ids that became active meanwhile were not deleted
+            kept = set(await db.workouts.distinct("id", {"userId": user_id, "id": {"$in": replaced}}))
+            await record_deletions(db, user_id, [workout_id for workout_id in replaced if workout_id not in kept])
+        created = 0
+        if workouts:
+            # Upserts by day, like extend_plan: active, completed and skipped days stay as they are
+            result = await db.workouts.bulk_write([
+                UpdateOne({"userId": user_id, "date": workout["date"]}, {"$setOnInsert": workout}, upsert=True)
+                for workout in workouts
+            ], ordered=False)
+            created = result.upserted_count
+        # Later extensions of the plan follow this split
+        user_update = {"$set": {"planSplit": {str(weekday): template for weekday, template in split.items()}, "updatedAt": datetime.utcnow()}}
+        if workouts:
+            user_update["$max"] = {"planEndsAt": workouts[-1]["date"]}
+        await db.users.update_one({"id": user_id}, user_update)
+        
+        
+        return PlanResponse(success=True, created=created, startDate=start, endDate=end)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Generate plan error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+def version_filter(version: int) -> Dict:
+    """Match a workout still at `version` (documents written before versioning count as 0)"""
+    return {"version": {"$in": [version, None]}} if version == 0 else {"version": version}
+
+def parse_if_match(value: Optional[str]) -> Optional[int]:
+    """Workout version from an If-Match header (`"3"`, `W/"3"` or `3`); None when absent"""
+    if value is None or value.strip() == "*":
+        return None
+    tag = value.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cabeçalho If-Match inválido")
+
+async def apply_set_completion(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    workout_id: str,
+    exercise_id: str,
+    weight: Optional[float] = None,
+    reps: Optional[int] = None,
+    expected_version: Optional[int] = None
+) -> Dict:
+    """Record one completed set and update workout progress, status and user stats.
+
+    `weight` and `reps` are what was actually lifted; they default to the plan.
+    The workout is written only if its version is unchanged since it was read;
+    on conflict the read-modify-write is retried, unless the caller asked for a
+    specific `expected_version`, which fails with 412 instead.
+    """
+    for attempt in range(UPDATE_ATTEMPTS):
         # Find workout
         workout = await db.workouts.find_one({"id": workout_id, "userId": user_id})
         if not workout:
             raise HTTPException(status_code=404, detail="Treino não encontrado")
+        version = workout.get("version", 0)
+        if expected_version is not None and version != expected_version:
+            raise HTTPException(status_code=412, detail="Treino alterado em outro dispositivo")
         
         # Find exercise
         exercise_index = None
@@ -224,6 +431,7 @@ async def complete_set(
         
         # Update exercise
         exercise = workout["exercises"][exercise_index]
+        set_counted = exercise["completedSets"] < exercise["sets"]
         exercise["completedSets"] = min(exercise["completedSets"] + 1, exercise["sets"])
         
         if exercise["completedSets"] >= exercise["sets"]:
@@ -235,37 +443,184 @@ async def complete_set(
         
         # Update workout status
         status = workout["status"]
-        if progress >= 100:
-            status = "completed"
-            # Update user stats
-            await db.users.update_one(
-                {"id": user_id},
-                {"$inc": {"totalWorkouts": 1, "streak": 1}}
+        updates = {
+            "exercises": workout["exercises"],
+            "progress": progress,
+            "status": status,
+            "updatedAt": datetime.utcnow()
+        }
+        if progress >= 100 and status != "completed":
+            completed_at = datetime.utcnow()
+            updates["status"] = "completed"
+            updates["completedAt"] = completed_at
+        
+        # Writes share a causal session so the user's next analytics read sees them
+        async with causal_session(user_id, db) as session:
+            # Save changes, unless another device wrote the workout since we read it
+            result = await db.workouts.update_one(
+                {"id": workout_id, "userId": user_id, **version_filter(version)},
+                {"$set": updates, "$inc": {"version": 1}},
+                session=session
             )
+            if not result.matched_count:
+                metrics.increment("workout_version_conflicts")
+                if expected_version is not None:
+                    raise HTTPException(status_code=412, detail="Treino alterado em outro dispositivo")
+                # Full jitter keeps devices that collided from colliding again
+                await asyncio.sleep(random.uniform(0, UPDATE_RETRY_BASE_SECONDS * 2 ** attempt))
+                continue
+            
+            # Only the write that moved the status may count the workout
+            if updates["status"] != status:
+                # Update user stats
+                # users lives on the home shard, outside this shard's session
+                await db.users.update_one(
+                    {"id": user_id},
+                    {"$inc": {"totalWorkouts": 1, "streak": 1}, "$set": {"lastWorkoutAt": completed_at, "updatedAt": completed_at}}
+                )
+                await record_workout_volume(db, user_id, workout_id, workout_volume(workout), completed_at)
+            
+            # Set history for analytics
+            if set_counted:
+                await db.set_logs.insert_one({
+                    "userId": user_id,
+                    "workoutId": workout_id,
+                    "exerciseId": exercise_id,
+                    "exerciseName": exercise["name"],
+                    "weight": float(exercise["weight"] if weight is None else weight),
+                    "reps": int(exercise["reps"] if reps is None else reps),
+                    "completedAt": updates["updatedAt"]
+                }, session=session)
+        history_cache.invalidate(user_id)
         
-        # Save changes
-        await db.workouts.update_one(
-            {"id": workout_id},
-            {
-                "$set": {
-                    "exercises": workout["exercises"],
-                    "progress": progress,
-                    "status": status
-                }
-            }
+        return {"exercise": exercise, "progress": progress, "status": updates["status"], "version": version + 1}
+    
+    raise HTTPException(status_code=409, detail="Treino alterado simultaneamente, tente novamente")
+
+def publish_set_completion(workout_id: str, result: Dict):
+    """Push a set-completion delta (and the following rest period) to live sessions"""
+    exercise = result["exercise"]
+    hub.publish(workout_id, {
+        "type": "set_completed",
+        "exerciseId": exercise["id"],
+        "completedSets": exercise["completedSets"],
+        "totalSets": exercise["sets"],
+        "completed": exercise["completed"],
+        "progress": result["progress"],
+        "status": result["status"],
+        "version": result["version"]
+    })
+    if result["status"] != "completed" and exercise.get("restTime"):
+        hub.start_rest(workout_id, exercise["id"], exercise["restTime"])
+
+@router.post("/{workout_id}/exercises/{exercise_id}/complete-set", response_model=CompleteSetResponse)
+async def complete_set(
+    workout_id: str,
+    exercise_id: str,
+    set_data: CompleteSetRequest,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_user_db)
+):
+    """Complete a set for an exercise; with If-Match, only if the workout is still at that version"""
+    try:
+        result = await apply_set_completion(
+            db, current_user["user_id"], workout_id, exercise_id, set_data.weight, set_data.reps,
+            expected_version=parse_if_match(if_match)
         )
+        publish_set_completion(workout_id, result)
         
+        exercise = result["exercise"]
+        response.headers["ETag"] = f'"{result["version"]}"'
         return CompleteSetResponse(
             success=True,
             exercise={
                 "id": exercise_id,
                 "completedSets": exercise["completedSets"],
                 "totalSets": exercise["sets"]
-            }
+            },
+            version=result["version"]
         )
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Complete set error: {str(e)}")
-        raise HTTPException(status_code=500, detail="Erro interno do servidor")
\ No newline at end of file
+        logger.error("Complete set error: %s", e)
+        raise HTTPException(status_code=500, detail="Erro interno do servidor")
+
+def subprotocol_token(websocket: WebSocket) -> Optional[str]:
+    """Access token from a `Sec-WebSocket-Protocol: bearer, <token>` offer"""
+    protocols = [protocol.strip() for protocol in websocket.headers.get("sec-websocket-protocol", "").split(",")]
+    if len(protocols) == 2 and protocols[0] == LIVE_AUTH_PROTOCOL and protocols[1]:
+        return protocols[1]
+    return None
+
+@router.websocket("/{workout_id}/live")
+async def live_session(
+    websocket: WebSocket,
+    workout_id: str
+):
+    """Live session channel: pushes set and rest-timer events, accepts set completions.
+
+    The access token is checked once, at connect. Browsers cannot set headers
+    on WebSocket requests, and a query parameter would end up in access logs,
+    so it is offered as a subprotocol: `new WebSocket(url, ["bearer", token])`.
+    """
+    token = subprotocol_token(websocket)
+    payload = authenticate_token(token) if token else None
+    if payload is None:
+        await websocket.close(code=4401)
+        return
+    user_id = payload["user_id"]
+    
+    workout = await get_user_database(user_id).workouts.find_one({"id": workout_id, "userId": user_id}, {"_id": 0})
+    if not workout:
+        await websocket.close(code=4404)
+        return
+    
+    await websocket.accept(subprotocol=LIVE_AUTH_PROTOCOL)
+    connection = LiveConnection(websocket, user_id, workout_id)
+    hub.register(connection)
+    connection.push({
+        "type": "snapshot",
+        "workout": WorkoutResponse(**workout).model_dump(mode="json")
+    })
+    
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                message = None
+            message_type = message.get("type") if isinstance(message, dict) else None
+            
+            if message_type == "complete_set":
+                try:
+                    completion = LiveCompleteSet.model_validate(message)
+                except ValidationError:
+                    connection.push({"type": "error", "detail": "Mensagem inválida"})
+                    continue
+                if get_shard_router().is_locked(user_id):
+                    connection.push({"type": "error", "detail": "Dados em migração, tente novamente em instantes"})
+                    continue
+                try:
+                    # Resolved per message: the user's shard may change during a long session
+                    result = await apply_set_completion(
+                        get_user_database(user_id), user_id, workout_id, completion.exerciseId,
+                        completion.weight, completion.reps, expected_version=completion.version
+                    )
+                    publish_set_completion(workout_id, result)
+                except HTTPException as e:
+                    connection.push({"type": "error", "detail": e.detail})
+            elif message_type == "ping":
+                connection.push({"type": "pong"})
+            else:
+                connection.push({"type": "error", "detail": "Mensagem inválida"})
+                
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error("Live session error: %s", e)
+    finally:
+        await hub.unregister(connection)
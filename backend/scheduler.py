@@ -0,0 +1,210 @@
+"""
+In-process asyncio job scheduler.
+
+Jobs run inside each API worker, off the request path. A job is either an
+interval job (every N seconds) or a cron job (five-field expression, UTC).
+Jobs marked leader_only run on a single worker across the deployment: workers
+compete for a lease document in `scheduler_leases`, renewed while held and
+taken over once it expires.
+
+Every run is timed into the metrics registry under scheduler_job_seconds.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = float(os.environ.get('SCHEDULER_LEASE_SECONDS', 30))
+LEASE_ID = "scheduler"
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week"""
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression: {expression}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(value, low, high) for value, (low, high) in zip(fields, self.RANGES)
+        )
+        self.days_restricted = fields[2] != "*"
+        self.weekdays_restricted = fields[4] != "*"
+
+    @staticmethod
+    def _parse(value: str, low: int, high: int) -> Set[int]:
+        allowed = set()
+        for part in value.split(","):
+            part, _, step = part.partition("/")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(bound) for bound in part.split("-"))
+            else:
+                start = end = int(part)
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron field out of range: {value}")
+            allowed.update(range(start, end + 1, int(step) if step else 1))
+        return allowed
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        # cron counts Sunday as 0, Python's weekday() counts Monday as 0
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day or weekday
+        return day and weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after `moment`"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never matches: {self.expression}")
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], Awaitable[None]]
+    interval: Optional[float] = None
+    cron: Optional[CronSchedule] = None
+    jitter: float = 0.0
+    leader_only: bool = True
+    next_run: float = 0.0  # time.time() timestamp
+    running: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def schedule_next(self, now: float, first: bool = False):
+        if self.cron is not None:
+            moment = datetime.utcfromtimestamp(now)
+            self.next_run = (self.cron.next_after(moment) - datetime(1970, 1, 1)).total_seconds()
+        elif first:
+            self.next_run = now
+        else:
+            self.next_run = now + self.interval
+        self.next_run += random.uniform(0, self.jitter) if self.jitter else 0
+
+class Scheduler:
+    def __init__(self, get_db: Callable[[], AsyncIOMotorDatabase], lease_seconds: float = LEASE_SECONDS):
+        self.get_db = get_db
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: Dict[str, Job] = {}
+        self.is_leader = False
+        self._lease_checked = 0.0
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def interval(self, name: str, seconds: float, func, jitter: float = 0.0, leader_only: bool = True):
+        """Run `func` every `seconds` (first run right after start, plus jitter)"""
+        self.jobs[name] = Job(name=name, func=func, interval=seconds, jitter=jitter, leader_only=leader_only)
+
+    def cron(self, name: str, expression: str, func, jitter: float = 0.0, leader_only: bool = True):
+        """Run `func` on a cron expression evaluated in UTC"""
+        self.jobs[name] = Job(
+            name=name, func=func, cron=CronSchedule(expression), jitter=jitter, leader_only=leader_only
+        )
+
+    async def start(self):
+        now = time.time()
+        for job in self.jobs.values():
+            job.schedule_next(now, first=True)
+        self._loop_task = asyncio.create_task(self._run())
+        logger.info("Scheduler started with %s jobs (%s)", len(self.jobs), self.owner)
+
+    async def stop(self):
+        if self._loop_task:
+            self._loop_task.cancel()
+        running = [job.running for job in self.jobs.values() if job.running and not job.running.done()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        if self.is_leader:
+            try:
+                await self.get_db().scheduler_leases.delete_one({"_id": LEASE_ID, "owner": self.owner})
+            except Exception as e:
+                logger.error("Scheduler lease release error: %s", e)
+        self.is_leader = False
+
+    async def _refresh_lease(self):
+        """Acquire or renew the leader lease; losing the race just means follower"""
+        now = datetime.utcnow()
+        try:
+            lease = await self.get_db().scheduler_leases.find_one_and_update(
+                {"_id": LEASE_ID, "$or": [{"owner": self.owner}, {"expiresAt": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expiresAt": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            leader = lease is not None and lease["owner"] == self.owner
+        except DuplicateKeyError:
+            leader = False
+        except Exception as e:
+            logger.error("Scheduler lease error: %s", e)
+            leader = False
+
+        if leader != self.is_leader:
+            logger.info("Scheduler %s is %s the leader", self.owner, "now" if leader else "no longer")
+        self.is_leader = leader
+        metrics.set_gauge("scheduler_is_leader", 1 if leader else 0)
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            if any(job.leader_only for job in self.jobs.values()) and now - self._lease_checked >= self.lease_seconds / 3:
+                self._lease_checked = now
+                await self._refresh_lease()
+
+            for job in self.jobs.values():
+                if job.next_run > now:
+                    continue
+                job.schedule_next(now)
+                if job.leader_only and not self.is_leader:
+                    continue
+                if job.running and not job.running.done():
+                    metrics.increment("scheduler_job_skipped", labels={"job": job.name})
+                    continue
+                job.running = asyncio.create_task(self._run_job(job))
+
+            next_run = min((job.next_run for job in self.jobs.values()), default=now + self.lease_seconds)
+            sleep_for = min(next_run - time.time(), self.lease_seconds / 3)
+            await asyncio.sleep(max(sleep_for, 0.05))
+
+    async def _run_job(self, job: Job):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            await job.func()
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status = "error"
+            logger.error("Scheduled job '%s' failed: %s", job.name, e)
+        finally:
+            metrics.observe("scheduler_job_seconds", time.perf_counter() - started, labels={"job": job.name})
+            metrics.increment("scheduler_job_runs", labels={"job": job.name, "status": status})
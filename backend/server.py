@@ -1,7 +1,9 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from pathlib import Path
+from typing import Optional
+import hmac
 import os
 import logging
 
@@ -10,19 +12,44 @@ from routes.auth import router as auth_router
 from routes.user import router as user_router
 from routes.workouts import router as workouts_router
 from routes.progress import router as progress_router
+from routes.leaderboard import router as leaderboard_router
+from routes.coach import router as coach_router
+from routes.sync import router as sync_router
 
 # Import database
-from database import connect_to_mongo, close_mongo_connection
+from database import connect_to_mongo, close_mongo_connection, get_database
+from auth.password import ensure_calibrated
+from warmup import run_warmup
+from middleware.rate_limit import RateLimitMiddleware
+from middleware.idempotency import IdempotencyMiddleware
+from middleware.compression import CompressionMiddleware
+from jobs import build_scheduler
+from cache_bus import invalidation_bus
+from live import hub
+from logging_config import setup_logging
+import metrics
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Bearer token of metrics scrapers; /api/metrics does not exist without one
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 # Create the main app
 app = FastAPI(title="Fitness App API", version="1.0.0")
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Replay stored responses for retried requests carrying an Idempotency-Key
+app.add_middleware(IdempotencyMiddleware)
+
+# Throttle credential endpoints before they reach bcrypt or the database
+app.add_middleware(RateLimitMiddleware)
+
+# Compress responses on the way out (replayed idempotent responses included)
+app.add_middleware(CompressionMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -32,11 +59,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging: records are formatted and written off the event loop
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Health check endpoint
@@ -44,27 +68,50 @@ logger = logging.getLogger(__name__)
 async def root():
     return {"message": "Fitness App API is running", "status": "healthy"}
 
+# Per-worker metrics: operational data about users and clients, for scrapers only
+@api_router.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Não autorizado", headers={"WWW-Authenticate": "Bearer"})
+    return metrics.snapshot()
+
 # Include route routers
 api_router.include_router(auth_router)
 api_router.include_router(user_router)
 api_router.include_router(workouts_router)
 api_router.include_router(progress_router)
+api_router.include_router(leaderboard_router)
+api_router.include_router(coach_router)
+api_router.include_router(sync_router)
 
 # Include the main router in the app
 app.include_router(api_router)
 
+scheduler = build_scheduler()
+
 @app.on_event("startup")
 async def startup_db_client():
     """Connect to database on startup"""
     await connect_to_mongo()
+    await ensure_calibrated(get_database())
+    await run_warmup(app)
+    await scheduler.start()
+    await invalidation_bus.start()
+    await hub.start(get_database())
     logger.info("Fitness App API started successfully")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """Close database connection on shutdown"""
+    await scheduler.stop()
+    await invalidation_bus.stop()
+    await hub.stop()
     await close_mongo_connection()
     logger.info("Fitness App API shutdown complete")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001, log_config=None)
\ No newline at end of file
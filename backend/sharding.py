@@ -0,0 +1,351 @@
+"""
+User-id sharded storage.
+
+MONGO_SHARDS lists several MongoDB deployments ("name=uri,name=uri"); without
+it the single MONGO_URL is the only shard. Each shard has its own Motor client
+and pool (MONGO_MAX_POOL_SIZE is per shard client).
+
+User-owned, high-volume collections (SHARDED_COLLECTIONS) live on the shard a
+user id maps to on a consistent hash ring, so adding a shard only moves about
+1/N of the users. Everything else (users, tokens, leaderboard, coach links,
+scheduler and bus state) lives on the first, "home" shard, which keeps login
+by email and cross-user lookups single-database.
+
+Users can be pinned to another shard through `shard_overrides` on the home
+shard; the rebalancer uses this to move users online. To add a shard, pin
+everyone where they are (with the old MONGO_SHARDS), deploy the new list, then
+rebalance:
+
+    python sharding.py pin                  # pin users to their current shard
+    python sharding.py plan                 # pinned users not on their ring shard
+    python sharding.py rebalance            # move them and drop their pins
+    python sharding.py move <user_id> <shard>
+
+Workers apply the overrides changed since their last sync every
+SHARD_OVERRIDE_SYNC_SECONDS, and reload them all every
+SHARD_OVERRIDE_RECONCILE_SECONDS. Dropped overrides are kept as `dropped`
+tombstones (removed by a TTL index) so that incremental syncs see them.
+
+While a user is being moved their writes are refused with 503 for the few
+seconds of the final copy, and the maintenance jobs leave them alone
+(`moving_users`) from the start of the copy. Two local mongod processes are enough to try it:
+
+    mongod --dbpath /tmp/shard0 --port 27017
+    mongod --dbpath /tmp/shard1 --port 27018
+    MONGO_SHARDS="shard0=mongodb://127.0.0.1:27017,shard1=mongodb://127.0.0.1:27018"
+"""
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ReplaceOne
+from bisect import bisect
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import hashlib
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SHARDED_COLLECTIONS = ("workouts", "workouts_archive", "workout_tombstones", "set_logs")
+RING_VNODES = 128
+OVERRIDE_SYNC_SECONDS = float(os.environ.get('SHARD_OVERRIDE_SYNC_SECONDS', 2))
+OVERRIDE_RECONCILE_SECONDS = float(os.environ.get('SHARD_OVERRIDE_RECONCILE_SECONDS', 300))
+# Incremental syncs re-read this far back, for changes stamped by a clock behind ours
+OVERRIDE_SYNC_OVERLAP = timedelta(seconds=30)
+DROPPED_OVERRIDE_TTL = timedelta(days=1)
+# Override states during which a user's documents are being copied to another shard
+MOVING_STATES = ("copying", "locked")
+MOVE_BATCH_SIZE = 1000
+
+def configured_shards() -> List[Tuple[str, str]]:
+    """(name, uri) pairs from MONGO_SHARDS, or the single MONGO_URL"""
+    spec = os.environ.get('MONGO_SHARDS', '').strip()
+    if not spec:
+        return [("default", os.environ.get('MONGO_URL'))]
+    shards = []
+    for entry in spec.split(","):
+        name, separator, uri = entry.strip().partition("=")
+        if not separator or not name or not uri:
+            raise ValueError(f"Invalid MONGO_SHARDS entry: {entry}")
+        shards.append((name, uri))
+    if len({name for name, _ in shards}) != len(shards):
+        raise ValueError("Duplicate shard name in MONGO_SHARDS")
+    return shards
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, names: Iterable[str], vnodes: int = RING_VNODES):
+        points = sorted((_hash(f"{name}#{i}"), name) for name in names for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def lookup(self, key: str) -> str:
+        index = bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._names[index]
+
+@dataclass
+class Shard:
+    name: str
+    url: str
+    client: AsyncIOMotorClient
+    database: AsyncIOMotorDatabase
+    analytics_database: AsyncIOMotorDatabase
+
+class UserDatabase:
+    """
+    Database handle scoped to one user: sharded collections resolve to the
+    user's shard, all others to the home shard. `client` is the shard's client,
+    so sessions started from it are valid on the sharded collections.
+    """
+
+    def __init__(self, home: AsyncIOMotorDatabase, shard: AsyncIOMotorDatabase, shard_name: str):
+        self.home = home
+        self.shard = shard
+        self.shard_name = shard_name
+        self.client = shard.client
+        self.name = shard.name
+
+    def __getitem__(self, name: str):
+        return (self.shard if name in SHARDED_COLLECTIONS else self.home)[name]
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+class ShardRouter:
+    def __init__(self, shards: List[Tuple[str, str]]):
+        self.specs = shards
+        self.shards: Dict[str, Shard] = {}
+        self.ring = HashRing(name for name, _ in shards)
+        # user_id -> {"shard": name, "state": "active" | "copying" | "locked", "movingTo": name}
+        self.overrides: Dict[str, Dict] = {}
+        # Local time the last sync started at, and the monotonic time of the last full reload
+        self._synced_at: Optional[datetime] = None
+        self._reconciled_at = 0.0
+
+    async def connect(self, db_name: str, max_pool_size: int, min_pool_size: int, analytics_read_preference):
+        for name, url in self.specs:
+            client = AsyncIOMotorClient(url, maxPoolSize=max_pool_size, minPoolSize=min(min_pool_size, max_pool_size))
+            database = client[db_name]
+            self.shards[name] = Shard(
+                name=name,
+                url=url,
+                client=client,
+                database=database,
+                analytics_database=database.with_options(read_preference=analytics_read_preference)
+            )
+        await asyncio.gather(*(shard.database.command("ping") for shard in self.shards.values()))
+        await self.refresh_overrides()
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.client.close()
+
+    @property
+    def home(self) -> Shard:
+        return self.shards[self.specs[0][0]]
+
+    def ring_shard(self, user_id: str) -> str:
+        return self.ring.lookup(user_id)
+
+    def shard_name(self, user_id: str) -> str:
+        override = self.overrides.get(user_id)
+        return override["shard"] if override else self.ring_shard(user_id)
+
+    def is_locked(self, user_id: str) -> bool:
+        override = self.overrides.get(user_id)
+        return override is not None and override.get("state") == "locked"
+
+    def is_moving(self, user_id: str) -> bool:
+        override = self.overrides.get(user_id)
+        return override is not None and override.get("state") in MOVING_STATES
+
+    def moving_users(self) -> List[str]:
+        """Users whose documents are being copied to another shard, for jobs to skip"""
+        return [user_id for user_id, override in self.overrides.items() if override.get("state") in MOVING_STATES]
+
+    def user_database(self, user_id: str, analytics: bool = False) -> UserDatabase:
+        home = self.home
+        shard = self.shards[self.shard_name(user_id)]
+        if analytics:
+            return UserDatabase(home.analytics_database, shard.analytics_database, shard.name)
+        return UserDatabase(home.database, shard.database, shard.name)
+
+    def group_by_shard(self, user_ids: Iterable[str]) -> Dict[str, List[str]]:
+        groups: Dict[str, List[str]] = {}
+        for user_id in user_ids:
+            groups.setdefault(self.shard_name(user_id), []).append(user_id)
+        return groups
+
+    async def refresh_overrides(self):
+        """Apply the overrides changed since the last sync, or reload them all every OVERRIDE_RECONCILE_SECONDS"""
+        started = datetime.utcnow()
+        if self._synced_at is None or time.monotonic() - self._reconciled_at >= OVERRIDE_RECONCILE_SECONDS:
+            self.overrides = {
+                doc["_id"]: doc
+                async for doc in self.home.database.shard_overrides.find({"state": {"$ne": "dropped"}})
+            }
+            self._reconciled_at = time.monotonic()
+        else:
+            async for doc in self.home.database.shard_overrides.find(
+                {"updatedAt": {"$gte": self._synced_at - OVERRIDE_SYNC_OVERLAP}}
+            ):
+                if doc.get("state") == "dropped":
+                    self.overrides.pop(doc["_id"], None)
+                else:
+                    self.overrides[doc["_id"]] = doc
+        self._synced_at = started
+
+    async def _set_override(self, user_id: str, **fields):
+        fields["updatedAt"] = datetime.utcnow()
+        await self.home.database.shard_overrides.update_one(
+            {"_id": user_id}, {"$set": fields, "$unset": {"expiresAt": ""}}, upsert=True
+        )
+        self.overrides[user_id] = {"_id": user_id, **self.overrides.get(user_id, {}), **fields}
+
+    async def _drop_override(self, user_id: str):
+        """Tombstone the override, so that incremental syncs drop it too"""
+        now = datetime.utcnow()
+        await self.home.database.shard_overrides.update_one(
+            {"_id": user_id},
+            {"$set": {"state": "dropped", "updatedAt": now, "expiresAt": now + DROPPED_OVERRIDE_TTL}}
+        )
+        self.overrides.pop(user_id, None)
+
+    async def _copy(self, source: AsyncIOMotorDatabase, target: AsyncIOMotorDatabase, user_id: str, query: Dict) -> int:
+        copied = 0
+        for collection in SHARDED_COLLECTIONS:
+            operations = []
+            async for doc in source[collection].find({"userId": user_id, **query}):
+                operations.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+                if len(operations) >= MOVE_BATCH_SIZE:
+                    await target[collection].bulk_write(operations, ordered=False)
+                    copied += len(operations)
+                    operations = []
+            if operations:
+                await target[collection].bulk_write(operations, ordered=False)
+                copied += len(operations)
+        return copied
+
+    async def _drop_extra(self, source: AsyncIOMotorDatabase, target: AsyncIOMotorDatabase, user_id: str):
+        """Delete documents from the target that were deleted from the source during the copy"""
+        for collection in SHARDED_COLLECTIONS:
+            kept = set(await source[collection].distinct("_id", {"userId": user_id}))
+            copied = set(await target[collection].distinct("_id", {"userId": user_id}))
+            if copied - kept:
+                await target[collection].delete_many({"_id": {"$in": list(copied - kept)}})
+
+    async def move_user(self, user_id: str, target_name: str):
+        """Move a user's sharded documents to another shard while the API keeps serving them"""
+        source_name = self.shard_name(user_id)
+        if target_name not in self.shards:
+            raise ValueError(f"Unknown shard: {target_name}")
+        if source_name == target_name:
+            return
+        source = self.shards[source_name].database
+        target = self.shards[target_name].database
+        # Workers must observe each override change before the next step relies on it
+        settle = OVERRIDE_SYNC_SECONDS * 2
+
+        # 1. Bulk copy while the user keeps reading and writing on the source. The
+        # jobs skip the user from now on: their writes (archiving, backfills) keep
+        # old timestamps the final copy would miss
+        await self._set_override(user_id, shard=source_name, state="copying", movingTo=target_name)
+        await asyncio.sleep(settle)
+        copy_started = datetime.utcnow()
+        copied = await self._copy(source, target, user_id, {})
+
+        # 2. Refuse writes, then copy what changed during the bulk copy
+        await self._set_override(user_id, shard=source_name, state="locked", movingTo=target_name)
+        await asyncio.sleep(settle)
+        copied += await self._copy(source, target, user_id, {
+            "$or": [{"updatedAt": {"$gte": copy_started}}, {"completedAt": {"$gte": copy_started}}]
+        })
+        await self._drop_extra(source, target, user_id)
+
+        # 3. Switch, then remove the source copy once no worker routes there
+        if self.ring_shard(user_id) == target_name:
+            await self._drop_override(user_id)
+        else:
+            await self._set_override(user_id, shard=target_name, state="active", movingTo=None)
+        await asyncio.sleep(settle)
+        for collection in SHARDED_COLLECTIONS:
+            await source[collection].delete_many({"userId": user_id})
+        logger.info("Moved user %s from %s to %s (%s documents copied)", user_id, source_name, target_name, copied)
+
+    async def pin_all(self) -> int:
+        """Pin every user without an override to the shard they are routed to now"""
+        operations = []
+        pinned_at = datetime.utcnow()
+        async for user in self.home.database.users.find({}, {"_id": 0, "id": 1}):
+            if user["id"] not in self.overrides:
+                operations.append(ReplaceOne(
+                    {"_id": user["id"]},
+                    {"shard": self.ring_shard(user["id"]), "state": "active", "updatedAt": pinned_at},
+                    upsert=True
+                ))
+        for start in range(0, len(operations), MOVE_BATCH_SIZE):
+            await self.home.database.shard_overrides.bulk_write(operations[start:start + MOVE_BATCH_SIZE], ordered=False)
+        await self.refresh_overrides()
+        return len(operations)
+
+    def misplaced_users(self) -> List[Tuple[str, str, str]]:
+        """(user_id, current shard, ring shard) for pinned users"""
+        return [
+            (user_id, override["shard"], self.ring_shard(user_id))
+            for user_id, override in self.overrides.items()
+        ]
+
+    async def rebalance(self) -> int:
+        """Move pinned users to their ring shard and drop the pins"""
+        moved = 0
+        for user_id, current, wanted in self.misplaced_users():
+            if current == wanted:
+                await self._drop_override(user_id)
+            else:
+                await self.move_user(user_id, wanted)
+                moved += 1
+        return moved
+
+async def _main():
+    import argparse
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from database import connect_to_mongo, close_mongo_connection, get_shard_router
+
+    parser = argparse.ArgumentParser(description="Inspect and rebalance user shards")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("pin", help="Pin every user to the shard they are on now")
+    commands.add_parser("plan", help="List pinned users and their ring shard")
+    commands.add_parser("rebalance", help="Move pinned users to their ring shard")
+    move = commands.add_parser("move", help="Move one user to a shard")
+    move.add_argument("user_id")
+    move.add_argument("shard")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    await connect_to_mongo()
+    try:
+        router = get_shard_router()
+        if args.command == "pin":
+            logger.info("Pinned %s users", await router.pin_all())
+        elif args.command == "plan":
+            for user_id, current, wanted in router.misplaced_users():
+                print(f"{user_id}\t{current} -> {wanted}")
+        elif args.command == "rebalance":
+            logger.info("Moved %s users", await router.rebalance())
+        else:
+            await router.move_user(args.user_id, args.shard)
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_main())
@@ -0,0 +1,104 @@
+"""
+Shared fixtures.
+
+Every test runs against two in-memory shards (mongomock-motor) installed in
+`database`, so routes, jobs and middlewares use them unchanged. Async tests
+are marked `anyio` and run on asyncio. No MongoDB server is needed:
+
+    pip install -r requirements-dev.txt
+    python -m pytest
+"""
+import os
+
+# Read at import: the cheapest bcrypt cost keeps tests fast
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-of-at-least-32-bytes")
+
+from mongomock.database import Database
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import OperationFailure
+import httpx
+import pytest
+
+import database
+import sharding
+from auth.jwt_handler import create_access_token
+from sharding import Shard, ShardRouter
+
+SHARD_NAMES = ("home", "east")
+
+class NullSession:
+    """Stands in for a client session: mongomock has none, and ignores falsy ones"""
+    operation_time = None
+    cluster_time = None
+
+    def __bool__(self):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def advance_operation_time(self, operation_time):
+        pass
+
+    def advance_cluster_time(self, cluster_time):
+        pass
+
+async def start_null_session(self, **kwargs):
+    return NullSession()
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def router(monkeypatch) -> ShardRouter:
+    router = ShardRouter([(name, f"mongodb://{name}") for name in SHARD_NAMES])
+    for name in SHARD_NAMES:
+        client = AsyncMongoMockClient()
+        shard_db = client["fitness_test"]
+        router.shards[name] = Shard(name=name, url="", client=client, database=shard_db, analytics_database=shard_db)
+    monkeypatch.setattr(database, "shard_router", router)
+    monkeypatch.setattr(database, "client", router.home.client)
+    monkeypatch.setattr(database, "database", router.home.database)
+    monkeypatch.setattr(database, "analytics_database", router.home.analytics_database)
+    monkeypatch.setattr(AsyncMongoMockClient, "start_session", start_null_session, raising=False)
+    # Shard moves wait for other workers to see each override change
+    monkeypatch.setattr(sharding, "OVERRIDE_SYNC_SECONDS", 0)
+    return router
+
+@pytest.fixture
+def db(router):
+    """The home shard's database"""
+    return router.home.database
+
+@pytest.fixture
+async def indexed(router, monkeypatch):
+    """Run ensure_indexes on every shard; mongomock has no collMod, so it fails like an old server"""
+    def command(self, command, *args, **kwargs):
+        raise OperationFailure(f"{command} is not supported", 115)
+    monkeypatch.setattr(Database, "command", command)
+    for shard in router.shards.values():
+        await database.ensure_indexes(shard.database)
+    return router
+
+def user_on(router: ShardRouter, shard_name: str, prefix: str = "user") -> str:
+    """A user id the hash ring places on `shard_name`"""
+    return next(
+        f"{prefix}-{number}" for number in range(10_000)
+        if router.ring_shard(f"{prefix}-{number}") == shard_name
+    )
+
+def auth_headers(user_id: str) -> dict:
+    token = create_access_token({"user_id": user_id, "email": f"{user_id}@example.com"})
+    return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture
+async def client(router):
+    """HTTP client for the full application (middlewares included), without startup events"""
+    from server import app
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from mongomock.aggregate import _Parser
+import numpy as np
+import pytest
+
+from analytics import (
+    EPOCH, SetHistory, compute_analytics, load_set_history, muscle_group_load, weekly_volume, weight_projections
+)
+from conftest import auth_headers, user_on
+from database import get_user_database
+from leaderboard import week_key
+from routes.workouts import DEFAULT_SPLIT, build_plan, start_of_day
+
+# A Wednesday
+TODAY = (datetime(2026, 10, 14) - EPOCH).days
+
+@pytest.fixture
+def to_long_dates(monkeypatch):
+    """$toLong of a date is its epoch milliseconds, as on the server; mongomock only converts numbers"""
+    convert = _Parser._handle_type_convertion_operator
+
+    def handle(self, operator, values):
+        if operator == "$toLong":
+            try:
+                parsed = self.parse(values)
+            except KeyError:
+                return None
+            if isinstance(parsed, datetime):
+                return (parsed - EPOCH) // timedelta(milliseconds=1)
+        return convert(self, operator, values)
+    monkeypatch.setattr(_Parser, "_handle_type_convertion_operator", handle)
+
+@pytest.fixture
+def history() -> SetHistory:
+    """Bench press last week and today, curls today"""
+    return SetHistory(
+        exercises=["Supino Reto", "Rosca Direta"],
+        exercise=np.array([0, 0, 1], dtype=np.uint16),
+        day=np.array([TODAY - 7, TODAY, TODAY], dtype=np.int32),
+        weight=np.array([90, 100, 20], dtype=np.float32),
+        reps=np.array([10, 10, 10], dtype=np.uint16)
+    )
+
+def test_weekly_volume_with_rolling_sums_and_deltas(history):
+    volume = weekly_volume(history, TODAY, weeks=3)
+
+    assert volume["volume"].tolist() == [0, 900, 1200]
+    assert volume["rolling"].tolist() == [0, 900, 2100]
+    assert volume["delta"].tolist() == [0, 900, 300]
+    assert np.isnan(volume["delta_percent"][:2]).all()
+    assert volume["delta_percent"][2] == pytest.approx(100 / 3)
+
+def test_muscle_group_load_covers_the_last_four_weeks(history):
+    load = muscle_group_load(history, TODAY)
+    assert load["groups"] == ["Bíceps", "Peito"]
+    assert load["volume"].tolist() == [200, 1900]
+    assert load["sets"].tolist() == [1, 2]
+    assert muscle_group_load(history, TODAY + 28)["volume"].tolist() == [0, 0]
+
+def test_projections_follow_the_top_weight_of_each_session(history):
+    # A lighter back-off set today does not pull the trend down
+    history.exercise = np.append(history.exercise, np.uint16(0))
+    history.day = np.append(history.day, np.int32(TODAY))
+    history.weight = np.append(history.weight, np.float32(60))
+    history.reps = np.append(history.reps, np.uint16(12))
+
+    projections = weight_projections(history, horizon_days=14)
+
+    assert projections["sessions"].tolist() == [2, 1]
+    assert projections["slope_per_week"][0] == pytest.approx(10)
+    assert projections["projected"].tolist() == pytest.approx([120, 20])
+    assert projections["projected_day"].tolist() == [TODAY + 14] * 2
+
+def test_analytics_response_labels_weeks_and_shares(history):
+    analytics = compute_analytics(history, TODAY, weeks=2, horizon_weeks=2)
+
+    assert analytics["totalSets"] == 3
+    assert [week["week"] for week in analytics["weeks"]] == [week_key(datetime(2026, 10, 7)), week_key(datetime(2026, 10, 14))]
+    assert analytics["weeks"][1]["deltaPercent"] == pytest.approx(100 / 3)
+    assert [group["share"] for group in analytics["muscleGroups"]] == pytest.approx([200 / 2100, 1900 / 2100])
+    bench = analytics["projections"][0]
+    assert (bench["exercise"], bench["muscleGroup"], bench["projectedWeight"]) == ("Supino Reto", "Peito", 120)
+    assert bench["projectedAt"] == datetime(2026, 10, 28)
+
+@pytest.mark.anyio
+async def test_loader_skips_sets_that_do_not_fit_the_columns(router, to_long_dates, caplog):
+    user_id = user_on(router, "east", "loader")
+    user_db = get_user_database(user_id)
+    now = datetime.utcnow().replace(microsecond=0)
+    good = {"userId": user_id, "exerciseName": "Supino Reto", "weight": 80.0, "reps": 8, "completedAt": now}
+    await user_db.set_logs.insert_many([
+        dict(good),
+        {**good, "completedAt": now - timedelta(days=7)},
+        {**good, "reps": 70_000},
+        {**good, "reps": 0},
+        {**good, "weight": -5.0},
+        {**good, "weight": None},
+        {**good, "exerciseName": "Rosca Direta", "reps": -1},
+        {key: value for key, value in good.items() if key != "completedAt"},
+        {**good, "userId": "someone-else"},
+    ])
+
+    history = await load_set_history(user_db, user_id)
+
+    assert history.exercises == ["Supino Reto"]
+    assert len(history) == 2
+    assert sorted(history.day.tolist()) == [(now - EPOCH).days - 7, (now - EPOCH).days]
+    assert history.reps.tolist() == [8, 8] and history.weight.tolist() == [80, 80]
+    assert "Skipped 6 invalid set logs" in caplog.text
+    assert len(await load_set_history(user_db, "nobody")) == 0
+
+async def start_workout(user_id: str) -> dict:
+    workout = build_plan(user_id, {start_of_day().weekday(): DEFAULT_SPLIT[0]}, 1, start_of_day())[0]
+    await get_user_database(user_id).workouts.insert_one(dict(workout))
+    return workout
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("lifted", [{"weight": 60, "reps": 70_000}, {"weight": 60, "reps": 0}, {"weight": -1, "reps": 10}])
+async def test_set_completion_rejects_reps_and_weight_out_of_range(router, client, lifted):
+    user_id = user_on(router, "east", "bounds")
+    workout = await start_workout(user_id)
+
+    response = await client.post(
+        f"/api/workouts/{workout['id']}/exercises/ex_0/complete-set",
+        json={"setNumber": 1, **lifted}, headers=auth_headers(user_id)
+    )
+
+    assert response.status_code == 422
+    assert await get_user_database(user_id).set_logs.count_documents({}) == 0
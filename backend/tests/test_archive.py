@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+import pytest
+
+import archive
+from archive import archive_workouts, find_workouts, iter_workouts
+
+pytestmark = pytest.mark.anyio
+
+USERS = ("ana", "bia")
+
+@pytest.fixture(autouse=True)
+def no_pause(monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_BATCH_PAUSE_SECONDS", 0)
+
+def completed_workout(user_id: str, number: int, days_ago: int) -> dict:
+    date = datetime.utcnow() - timedelta(days=days_ago)
+    return {
+        "id": f"{user_id}-{number}", "userId": user_id, "name": "Treino A", "status": "completed",
+        "date": date, "completedAt": date, "updatedAt": date, "version": 3,
+        "exercises": [{"id": "ex_0", "sets": 3, "reps": 10, "weight": 50.0, "completed": True}]
+    }
+
+@pytest.fixture
+async def old_workouts(db):
+    await db.users.insert_many([{"id": user_id, "totalWorkouts": 3} for user_id in USERS])
+    workouts = [completed_workout(user_id, number, 30 + number) for user_id in USERS for number in range(3)]
+    await db.workouts.insert_many([dict(workout) for workout in workouts])
+    # Recent ones stay hot
+    await db.workouts.insert_one(completed_workout("ana", 99, 1))
+    return workouts
+
+async def archived_totals(db, user_id: str) -> dict:
+    return (await db.users.find_one({"id": user_id}))["archived"]
+
+async def test_moves_old_workouts_and_folds_them_once(db, old_workouts, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_BATCH_SIZE", 4)
+    cutoff = datetime.utcnow() - timedelta(days=7)
+
+    assert await archive_workouts(db, db, cutoff) == 6
+    assert await archive_workouts(db, db, cutoff) == 0
+
+    assert await db.workouts.count_documents({}) == 1
+    assert await db.workouts_archive.count_documents({"archiveBatch": {"$exists": True}}) == 0
+    assert await db.workouts_archive.count_documents({}) == 6
+    for user_id in USERS:
+        assert await archived_totals(db, user_id) == {"workouts": 3, "volume": 4500.0, "weight": 150.0, "exercises": 3}
+
+async def test_interrupted_batch_is_resumed_without_folding_twice(db, old_workouts):
+    # The previous run copied and folded the batch, then died before deleting
+    await db.workouts.update_many({"date": {"$lt": datetime.utcnow() - timedelta(days=7)}}, {"$set": {"archiveBatch": "batch-1"}})
+    copied = await db.workouts.find({"id": {"$in": ["ana-0", "ana-1"]}}).to_list(None)
+    await db.workouts_archive.insert_many([{k: v for k, v in workout.items() if k != "archiveBatch"} for workout in copied])
+    await db.users.update_many({}, {
+        "$set": {"archived": {"workouts": 3, "volume": 4500.0, "weight": 150.0, "exercises": 3}},
+        "$push": {"archiveBatches": "batch-1"}
+    })
+
+    assert await archive_workouts(db, db, datetime.utcnow() - timedelta(days=7)) == 6
+
+    assert await db.workouts_archive.count_documents({}) == 6
+    for user_id in USERS:
+        assert (await archived_totals(db, user_id))["workouts"] == 3
+
+async def test_workout_written_during_the_batch_is_archived_in_its_latest_version(db, old_workouts, monkeypatch):
+    users = db.users
+    fold = type(users).bulk_write
+    written = False
+
+    async def fold_then_complete_a_set(self, *args, **kwargs):
+        nonlocal written
+        result = await fold(self, *args, **kwargs)
+        if not written:
+            written = True
+            await db.workouts.update_one({"id": "ana-0"}, {"$set": {"name": "Treino B"}, "$inc": {"version": 1}})
+        return result
+    monkeypatch.setattr(type(users), "bulk_write", fold_then_complete_a_set)
+
+    assert await archive_workouts(db, db, datetime.utcnow() - timedelta(days=7)) == 6
+
+    archived = await db.workouts_archive.find_one({"id": "ana-0"})
+    assert archived["name"] == "Treino B" and "archiveBatch" not in archived
+    assert (await archived_totals(db, "ana"))["workouts"] == 3
+
+async def test_reads_merge_both_tiers_by_date(db, old_workouts):
+    await archive_workouts(db, db, datetime.utcnow() - timedelta(days=7))
+    await db.workouts.insert_one(completed_workout("ana", 98, 40))
+
+    merged = [workout["id"] async for workout in iter_workouts(db, {"userId": "ana"}, batch_size=2)]
+    assert merged == ["ana-98", "ana-2", "ana-1", "ana-0", "ana-99"]
+
+    assert [workout["id"] for workout in await find_workouts(db, {"userId": "ana"}, None, limit=3)] == merged[:3]
+    # A recent start only reads the hot tier
+    recent = await find_workouts(db, {"userId": "ana"}, datetime.utcnow() - timedelta(days=7))
+    assert [workout["id"] for workout in recent] == ["ana-98", "ana-99"]
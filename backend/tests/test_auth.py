@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+import pytest
+
+from auth.dependencies import authenticate_token
+from auth.revocation import RevocationList, revocation_list
+from database import get_user_database
+
+pytestmark = pytest.mark.anyio
+
+async def register(client, email: str) -> dict:
+    response = await client.post("/api/auth/register", json={"name": "Ana Souza", "email": email, "password": "segredo123"})
+    assert response.status_code == 200
+    return response.json()
+
+async def test_register_seeds_a_plan_and_login_works(client):
+    session = await register(client, "seed@example.com")
+    user_id = session["user"]["id"]
+
+    assert await get_user_database(user_id).workouts.count_documents({"userId": user_id}) > 0
+    response = await client.post("/api/auth/login", json={"email": "seed@example.com", "password": "segredo123"})
+    assert response.status_code == 200
+    response = await client.post("/api/auth/login", json={"email": "seed@example.com", "password": "errada"})
+    assert response.status_code == 401
+
+async def test_refresh_tokens_rotate_and_are_single_use(client):
+    session = await register(client, "rotate@example.com")
+
+    rotated = await client.post("/api/auth/refresh", json={"refreshToken": session["refreshToken"]})
+    assert rotated.status_code == 200
+    assert rotated.json()["refreshToken"] != session["refreshToken"]
+
+    # The consumed token cannot be replayed; its successor works once
+    replayed = await client.post("/api/auth/refresh", json={"refreshToken": session["refreshToken"]})
+    assert replayed.status_code == 401
+    again = await client.post("/api/auth/refresh", json={"refreshToken": rotated.json()["refreshToken"]})
+    assert again.status_code == 200
+
+async def test_expired_refresh_token_is_refused(client, db):
+    session = await register(client, "expired@example.com")
+    await db.refresh_tokens.update_many({}, {"$set": {"expiresAt": datetime.utcnow() - timedelta(seconds=1)}})
+
+    response = await client.post("/api/auth/refresh", json={"refreshToken": session["refreshToken"]})
+    assert response.status_code == 401
+
+async def test_logout_revokes_access_and_refresh_tokens(client, db):
+    session = await register(client, "logout@example.com")
+    headers = {"Authorization": f"Bearer {session['token']}"}
+
+    response = await client.post("/api/auth/logout", json={"refreshToken": session["refreshToken"]}, headers=headers)
+    assert response.status_code == 200
+
+    assert (await client.get("/api/user/profile", headers=headers)).status_code == 401
+    response = await client.post("/api/auth/refresh", json={"refreshToken": session["refreshToken"]})
+    assert response.status_code == 401
+
+    # Other workers learn about the revocation from the database
+    other_worker = RevocationList()
+    await other_worker.refresh(db)
+    assert other_worker.is_revoked(authenticate_token.__globals__["verify_token"](session["token"])["jti"])
+
+def test_revocations_expire_with_the_token():
+    revocations = RevocationList()
+    revocations.add("live", datetime.utcnow() + timedelta(minutes=5))
+    revocations.add("gone", datetime.utcnow() - timedelta(seconds=1))
+
+    assert revocations.is_revoked("live")
+    assert not revocations.is_revoked("gone")
+    assert not revocations.is_revoked("never")
+    revocations._prune()
+    assert len(revocations) == 1
+
+async def test_incremental_refresh_only_reads_recent_revocations(db):
+    revocations = RevocationList()
+    await revocations.refresh(db)
+    await db.revoked_tokens.insert_one({
+        "jti": "late", "expiresAt": datetime.utcnow() + timedelta(minutes=5), "revokedAt": datetime.utcnow()
+    })
+
+    await revocations.refresh(db)
+
+    assert revocations.is_revoked("late")
+    assert not revocation_list.is_revoked("late")
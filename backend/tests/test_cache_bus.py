@@ -0,0 +1,123 @@
+from pymongo.errors import OperationFailure
+import asyncio
+import pytest
+
+import cache_bus
+from cache_bus import CANNOT_RESUME, UNKNOWN_FIELD, InvalidationBus
+
+pytestmark = pytest.mark.anyio
+
+class FakeStream:
+    """A change stream replaying scripted events, then failing with `error`"""
+
+    def __init__(self, events: list, error: OperationFailure):
+        self.events = list(events)
+        self.error = error
+        self.alive = True
+        self.resume_token = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def try_next(self):
+        if not self.events:
+            raise self.error
+        token, change = self.events.pop(0)
+        self.resume_token = token
+        return change
+
+class Blocked:
+    """A stream that never opens, once the script has run out"""
+
+    async def __aenter__(self):
+        await asyncio.Event().wait()
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+class FakeDatabase:
+    """Opens one scripted stream per watch call; an OperationFailure entry fails the open itself"""
+
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.watches = []
+        self.exhausted = asyncio.Event()
+
+    def watch(self, pipeline, **options):
+        self.watches.append(options)
+        if not self.streams:
+            self.exhausted.set()
+            return Blocked()
+        stream = self.streams.pop(0)
+        if isinstance(stream, OperationFailure):
+            raise stream
+        return stream
+
+def change(collection: str, operation: str, document=None, before=None) -> dict:
+    event = {"ns": {"coll": collection}, "operationType": operation}
+    if document is not None:
+        event["fullDocument"] = document
+    if before is not None:
+        event["fullDocumentBeforeChange"] = before
+    return event
+
+async def follow(bus: InvalidationBus, db: FakeDatabase):
+    """Run the bus on `db` until every scripted stream has been consumed"""
+    task = asyncio.create_task(bus._run(db))
+    await asyncio.wait_for(db.exhausted.wait(), 5)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+@pytest.fixture
+def bus(monkeypatch):
+    monkeypatch.setattr(cache_bus, "RETRY_SECONDS", 0)
+    bus = InvalidationBus(lambda: [])
+    bus.received = []
+    bus.subscribe(lambda collection, user_id: bus.received.append((collection, user_id)))
+    return bus
+
+async def test_stream_resumes_after_the_last_token(bus):
+    db = FakeDatabase(
+        FakeStream([("t1", change("workouts", "update", {"userId": "ana"})), ("t2", None)], OperationFailure("stepdown", 11602)),
+        FakeStream([("t3", change("users", "insert", {"id": "bia"}))], OperationFailure("stepdown", 11602)),
+    )
+
+    await follow(bus, db)
+
+    assert [watch["resume_after"] for watch in db.watches] == [None, "t2", "t3"]
+    assert bus.received == [("workouts", "ana"), ("users", "bia")]
+
+async def test_lost_history_restarts_from_now_and_flushes_everything(bus):
+    db = FakeDatabase(
+        FakeStream([("t1", change("workouts", "update", {"userId": "ana"}))], OperationFailure("history lost", CANNOT_RESUME[2])),
+    )
+
+    await follow(bus, db)
+
+    assert db.watches[-1]["resume_after"] is None
+    assert bus.received == [("workouts", "ana"), ("users", None), ("workouts", None), ("set_logs", None)]
+
+async def test_deletes_are_attributed_by_pre_image_or_skipped(bus):
+    db = FakeDatabase(FakeStream([
+        ("t1", change("set_logs", "delete", before={"userId": "ana"})),
+        ("t2", change("workouts", "delete")),
+    ], OperationFailure("stepdown", 11602)))
+
+    await follow(bus, db)
+
+    assert db.watches[0]["full_document_before_change"] == "whenAvailable"
+    assert bus.received == [("set_logs", "ana")]
+
+async def test_servers_without_pre_images_are_watched_without_them(bus):
+    db = FakeDatabase(OperationFailure("unknown option", UNKNOWN_FIELD))
+
+    await follow(bus, db)
+
+    assert not bus.pre_images
+    assert "full_document_before_change" not in db.watches[-1]
+    # Nothing was lost: no flush
+    assert bus.received == []
+
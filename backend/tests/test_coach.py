@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+import pytest
+
+from conftest import auth_headers, user_on
+from database import get_user_database
+from leaderboard import week_key
+
+pytestmark = pytest.mark.anyio
+
+def trained(user_id: str, workout_id: str, when: datetime, weight: float) -> dict:
+    return {
+        "id": workout_id, "userId": user_id, "name": "Treino A", "status": "completed", "date": when, "completedAt": when,
+        "exercises": [
+            {"id": "ex_0", "name": "Supino Reto", "sets": 3, "reps": 10, "weight": weight, "completed": True},
+            {"id": "ex_1", "name": "Crucifixo", "sets": 3, "reps": 12, "weight": 99.0, "completed": False},
+        ]
+    }
+
+async def invite(client, athlete_id: str) -> str:
+    response = await client.post("/api/coach/invites", headers=auth_headers(athlete_id))
+    assert response.status_code == 200
+    return response.json()["code"]
+
+@pytest.fixture
+async def coached(indexed, db, client):
+    """A coach following one athlete on each shard (ids in link order)"""
+    coach = user_on(indexed, "home", "coach")
+    athletes = sorted([user_on(indexed, "home", "athlete"), user_on(indexed, "east", "athlete")])
+    await db.users.insert_many([
+        {"id": user_id, "email": f"{user_id}@example.com", "name": user_id.title(), "streak": number}
+        for number, user_id in enumerate([coach, *athletes])
+    ])
+    for athlete_id in athletes:
+        code = await invite(client, athlete_id)
+        response = await client.post("/api/coach/athletes", json={"code": code.lower()}, headers=auth_headers(coach))
+        assert response.status_code == 200
+        assert response.json()["name"] == athlete_id.title()
+    return coach, athletes
+
+async def test_invites_are_single_use_and_links_unique(coached, client):
+    coach, (athlete, _) = coached
+    code = await invite(client, athlete)
+
+    own = await client.post("/api/coach/athletes", json={"code": code}, headers=auth_headers(athlete))
+    assert own.status_code == 400
+    # Refused redemptions spend the code too
+    again = await client.post("/api/coach/athletes", json={"code": code}, headers=auth_headers(coach))
+    assert again.status_code == 404
+
+    duplicate = await client.post("/api/coach/athletes", json={"code": await invite(client, athlete)}, headers=auth_headers(coach))
+    assert duplicate.status_code == 409
+
+async def test_athletes_are_paged_by_id(coached, client):
+    coach, athletes = coached
+
+    first = await client.get("/api/coach/athletes", params={"limit": 1}, headers=auth_headers(coach))
+    second = await client.get("/api/coach/athletes", params={"limit": 1, "cursor": athletes[0]}, headers=auth_headers(coach))
+
+    assert [athlete["id"] for athlete in first.json()] == athletes[:1]
+    assert [athlete["id"] for athlete in second.json()] == athletes[1:]
+    assert (await client.get("/api/coach/athletes", headers=auth_headers(athletes[0]))).json() == []
+
+async def test_links_are_removed_from_either_side(coached, client):
+    coach, (first, second) = coached
+
+    assert (await client.delete(f"/api/coach/athletes/{first}", headers=auth_headers(coach))).status_code == 200
+    assert (await client.delete(f"/api/coach/athletes/{first}", headers=auth_headers(coach))).status_code == 404
+    assert (await client.delete(f"/api/coach/coaches/{coach}", headers=auth_headers(second))).status_code == 200
+
+    assert (await client.get("/api/coach/athletes", headers=auth_headers(coach))).json() == []
+
+async def test_progress_page_is_a_fixed_number_of_queries(coached, client, monkeypatch):
+    coach, athletes = coached
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    last_week = today - timedelta(weeks=1)
+    for athlete_id in athletes:
+        await get_user_database(athlete_id).workouts.insert_many([
+            trained(athlete_id, f"{athlete_id}-1", today, 60.0),
+            trained(athlete_id, f"{athlete_id}-2", last_week, 40.0),
+            trained(athlete_id, f"{athlete_id}-old", today - timedelta(weeks=10), 20.0),
+        ])
+    aggregations = []
+    finds = []
+    collection = type(get_user_database(coach).workouts)
+    aggregate, find = collection.aggregate, collection.find
+
+    def counting_aggregate(self, pipeline, *args, **kwargs):
+        aggregations.append(self.name)
+        return aggregate(self, pipeline, *args, **kwargs)
+
+    def counting_find(self, *args, **kwargs):
+        finds.append(self.name)
+        return find(self, *args, **kwargs)
+    monkeypatch.setattr(collection, "aggregate", counting_aggregate)
+    monkeypatch.setattr(collection, "find", counting_find)
+
+    response = await client.get("/api/coach/athletes/progress", params={"weeks": 3}, headers=auth_headers(coach))
+
+    assert response.status_code == 200
+    page = response.json()
+    assert page["nextCursor"] is None
+    assert [item["athlete"]["id"] for item in page["items"]] == athletes
+    # One page of links, one batch of users, one aggregation per shard
+    assert sorted(finds) == ["coach_links", "users"]
+    assert aggregations == ["workouts", "workouts"]
+    for number, item in enumerate(page["items"], start=1):
+        assert item["currentStreak"] == number
+        weeks = item["weeks"]
+        assert [week["week"] for week in weeks] == [
+            week_key(today - timedelta(days=today.weekday(), weeks=2 - i)) for i in range(3)
+        ]
+        # Only completed exercises count; the week without training is zero-filled.
+        # (volume is not asserted: mongomock cannot $sum a $map)
+        assert [(week["workouts"], week["weight"]) for week in weeks] == [(0, 0), (1, 40), (1, 60)]
+
+async def test_progress_pages_continue_from_the_cursor(coached, client):
+    coach, athletes = coached
+
+    first = (await client.get("/api/coach/athletes/progress", params={"limit": 1}, headers=auth_headers(coach))).json()
+    second = (await client.get(
+        "/api/coach/athletes/progress", params={"limit": 1, "cursor": first["nextCursor"]}, headers=auth_headers(coach)
+    )).json()
+
+    assert first["nextCursor"] == athletes[0]
+    assert [item["athlete"]["id"] for item in second["items"]] == athletes[1:]
+    assert (await client.get("/api/coach/athletes/progress", headers=auth_headers(athletes[0]))).json() == {"items": [], "nextCursor": None}
@@ -0,0 +1,121 @@
+from fastapi import FastAPI
+from starlette.responses import Response, StreamingResponse
+import gzip
+import httpx
+import json
+import os
+import pytest
+
+import metrics
+from middleware import compression
+from middleware.compression import CompressionMiddleware, negotiate
+
+BOTH = {"br": 4, "gzip": 5}
+GZIP_ONLY = {"gzip": 5}
+
+@pytest.mark.parametrize("accept_encoding, encodings, expected", [
+    ("gzip", GZIP_ONLY, "gzip"),
+    ("GZIP ; q=0.5", GZIP_ONLY, "gzip"),
+    ("gzip, br", BOTH, "br"),  # our preference wins, not the client's order
+    ("br;q=0, gzip", BOTH, "gzip"),
+    ("gzip;q=0", GZIP_ONLY, None),
+    ("gzip;q=oops", GZIP_ONLY, None),
+    ("*", BOTH, "br"),
+    ("*;q=0, gzip", BOTH, "gzip"),
+    ("*, br;q=0", BOTH, "gzip"),
+    ("deflate, identity, zstd", BOTH, None),
+    ("", BOTH, None),
+    (" , ;q=1", BOTH, None),
+])
+def test_negotiate(accept_encoding, encodings, expected):
+    assert negotiate(accept_encoding, encodings) == expected
+
+def workouts_json(count: int = 50) -> bytes:
+    return json.dumps([
+        {"id": i, "name": "Peito e Tríceps", "image": "https://images.example.com/supino-reto.jpg"} for i in range(count)
+    ]).encode()
+
+async def stream():
+    for _ in range(3):
+        yield workouts_json()
+
+ROUTES = {
+    "/json": lambda: Response(workouts_json(), media_type="application/json"),
+    "/small": lambda: Response(b'{"ok":true}', media_type="application/json"),
+    "/png": lambda: Response(workouts_json(), media_type="image/png"),
+    "/encoded": lambda: Response(gzip.compress(workouts_json()), headers={"Content-Encoding": "gzip"}, media_type="application/json"),
+    "/stream": lambda: StreamingResponse(stream(), media_type="application/json"),
+    "/random": lambda: Response(os.urandom(4096), media_type="text/plain"),
+}
+
+@pytest.fixture
+async def client():
+    app = FastAPI()
+    for path, endpoint in ROUTES.items():
+        app.get(path)(endpoint)
+    middleware = CompressionMiddleware(app)
+    middleware.encodings = GZIP_ONLY
+    middleware.compressors = {"gzip": compression.compressor("gzip", 5)}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url="http://test") as client:
+        yield client
+
+def counter(name: str, route: str) -> float:
+    return metrics.snapshot()["counters"].get(f"{name}{{encoding=gzip,route={route}}}", 0)
+
+@pytest.mark.anyio
+async def test_large_json_is_compressed(client):
+    bytes_in = counter("compression_bytes_in", "/json")
+
+    response = await client.get("/json", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.content == workouts_json()
+    assert int(response.headers["Content-Length"]) == response.num_bytes_downloaded < len(workouts_json())
+    assert counter("compression_bytes_in", "/json") - bytes_in == len(workouts_json())
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path, accept_encoding, varies", [
+    ("/json", "identity", False),
+    ("/small", "gzip", True),
+    ("/png", "gzip", False),
+    ("/encoded", "gzip", False),
+    ("/stream", "gzip", True),
+])
+async def test_passthrough(client, path, accept_encoding, varies):
+    response = await client.get(path, headers={"Accept-Encoding": accept_encoding})
+
+    assert response.status_code == 200
+    if path == "/encoded":
+        assert response.headers["Content-Encoding"] == "gzip"  # the app's own, left as it was
+        assert response.content == workouts_json()
+    else:
+        assert "Content-Encoding" not in response.headers
+    assert ("Vary" in response.headers) == varies
+    if path == "/stream":
+        assert response.content == workouts_json() * 3
+
+@pytest.mark.anyio
+async def test_bodies_that_grow_are_sent_as_they_were(client):
+    before_in, before_out = counter("compression_bytes_in", "/random"), counter("compression_bytes_out", "/random")
+
+    response = await client.get("/random", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in response.headers
+    assert len(response.content) == int(response.headers["Content-Length"]) == 4096
+    assert counter("compression_bytes_in", "/random") - before_in == 4096
+    assert counter("compression_bytes_out", "/random") - before_out == 4096
+
+@pytest.mark.anyio
+async def test_large_bodies_are_compressed_off_the_event_loop(client, monkeypatch):
+    threaded = []
+    to_thread = compression.asyncio.to_thread
+
+    async def recording_to_thread(function, *args):
+        threaded.append(function)
+        return await to_thread(function, *args)
+    monkeypatch.setattr(compression.asyncio, "to_thread", recording_to_thread)
+    monkeypatch.setattr(compression, "THREAD_MIN_BYTES", 2048)
+
+    assert (await client.get("/json", headers={"Accept-Encoding": "gzip"})).headers["Content-Encoding"] == "gzip"
+    assert threaded == [compression.timed_compress]
@@ -0,0 +1,92 @@
+from fastapi import HTTPException
+import asyncio
+import pytest
+
+import metrics
+from conftest import auth_headers, user_on
+from database import get_user_database
+from routes.workouts import DEFAULT_SPLIT, apply_set_completion, build_plan, parse_if_match, start_of_day
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def workout(router):
+    """An active workout of a user on the east shard, with the user document"""
+    user_id = user_on(router, "east")
+    user_db = get_user_database(user_id)
+    await user_db.users.insert_one({"id": user_id, "name": "Ana", "email": "ana@example.com", "totalWorkouts": 0, "streak": 0})
+    doc = build_plan(user_id, {start_of_day().weekday(): DEFAULT_SPLIT[0]}, 1, start_of_day())[0]
+    await user_db.workouts.insert_one(dict(doc))
+    return user_db, user_id, doc
+
+async def complete_workout(user_db, user_id, doc):
+    for exercise in doc["exercises"]:
+        for _ in range(exercise["sets"]):
+            await apply_set_completion(user_db, user_id, doc["id"], exercise["id"])
+
+def test_parse_if_match():
+    assert parse_if_match(None) is None
+    assert parse_if_match("*") is None
+    assert parse_if_match('"3"') == parse_if_match('W/"3"') == parse_if_match("3") == 3
+    with pytest.raises(HTTPException):
+        parse_if_match('"three"')
+
+async def test_stale_expected_version_fails_with_412(workout):
+    user_db, user_id, doc = workout
+    await apply_set_completion(user_db, user_id, doc["id"], "ex_0")
+
+    with pytest.raises(HTTPException) as error:
+        await apply_set_completion(user_db, user_id, doc["id"], "ex_0", expected_version=0)
+    assert error.value.status_code == 412
+
+    result = await apply_set_completion(user_db, user_id, doc["id"], "ex_0", expected_version=1)
+    assert result["version"] == 2
+
+async def test_concurrent_completions_are_all_applied(workout, monkeypatch):
+    user_db, user_id, doc = workout
+    monkeypatch.setattr("routes.workouts.UPDATE_RETRY_BASE_SECONDS", 0.001)
+    # mongomock answers without yielding: let every device read before any writes, as a real server would
+    collection_type = type(user_db.workouts)
+    find_one = collection_type.find_one
+
+    async def yielding_find_one(self, *args, **kwargs):
+        document = await find_one(self, *args, **kwargs)
+        await asyncio.sleep(0)
+        return document
+    monkeypatch.setattr(collection_type, "find_one", yielding_find_one)
+    conflicts_before = metrics.snapshot()["counters"].get("workout_version_conflicts", 0)
+    sets = doc["exercises"][0]["sets"]
+
+    await asyncio.gather(*(apply_set_completion(user_db, user_id, doc["id"], "ex_0") for _ in range(sets)))
+
+    stored = await user_db.workouts.find_one({"id": doc["id"]})
+    assert stored["exercises"][0]["completedSets"] == sets
+    assert stored["exercises"][0]["completed"]
+    assert stored["version"] == sets
+    assert await user_db.set_logs.count_documents({"workoutId": doc["id"]}) == sets
+    # Every device read version 0: all but one had to retry
+    assert metrics.snapshot()["counters"].get("workout_version_conflicts", 0) >= conflicts_before + sets - 1
+
+async def test_completing_a_workout_counts_it_once(workout):
+    user_db, user_id, doc = workout
+    await complete_workout(user_db, user_id, doc)
+    # Extra sets beyond the plan change nothing
+    await apply_set_completion(user_db, user_id, doc["id"], "ex_0")
+
+    user = await user_db.users.find_one({"id": user_id})
+    assert (user["totalWorkouts"], user["streak"]) == (1, 1)
+    assert user["lastWorkoutAt"] is not None
+    assert (await user_db.workouts.find_one({"id": doc["id"]}))["status"] == "completed"
+    assert await user_db.leaderboard_weekly.count_documents({"userId": user_id}) == 1
+
+async def test_if_match_over_http(workout, client):
+    user_db, user_id, doc = workout
+    url = f"/api/workouts/{doc['id']}/exercises/ex_0/complete-set"
+
+    response = await client.post(url, json={"setNumber": 1, "weight": 80, "reps": 10}, headers={**auth_headers(user_id), "If-Match": '"0"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"1"'
+
+    response = await client.post(url, json={"setNumber": 1, "weight": 80, "reps": 10}, headers={**auth_headers(user_id), "If-Match": '"0"'})
+    assert response.status_code == 412
+
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+import pytest
+
+from conftest import auth_headers, user_on
+from database import get_user_database
+from delta_sync import SYNC_TOMBSTONE_DAYS, changes_since, decode_cursor, encode_cursor, to_millis
+from routes.workouts import DEFAULT_SPLIT, build_plan, start_of_day
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def user(router):
+    user_id = user_on(router, "east", "sync")
+    await get_user_database(user_id).users.insert_one({
+        "id": user_id, "name": "Ana", "email": "ana@example.com", "totalWorkouts": 0, "streak": 0,
+        "updatedAt": datetime.utcnow() - timedelta(days=1)
+    })
+    return user_id
+
+def workouts_at(user_id: str, count: int, updated_at: datetime) -> list:
+    workouts = build_plan(user_id, DEFAULT_SPLIT, 2, start_of_day())[:count]
+    for workout in workouts:
+        workout["updatedAt"] = updated_at
+    return workouts
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor((1234, "abc"))) == (1234, "abc")
+    for cursor in ("", "not-base64!", encode_cursor((1.5, "abc")), "eyJ0IjoxfQ"):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+async def test_invalid_cursor_is_rejected(client, user):
+    response = await client.get("/api/sync", params={"since": "garbage"}, headers=auth_headers(user))
+    assert response.status_code == 400
+
+async def test_pages_through_workouts_with_equal_timestamps(user):
+    user_db = get_user_database(user)
+    workouts = workouts_at(user, 5, datetime.utcnow() - timedelta(minutes=1))
+    await user_db.workouts.insert_many([dict(workout) for workout in workouts])
+
+    seen, position, pages = [], None, 0
+    while True:
+        changed, deleted, position, has_more = await changes_since(user_db, user, position, 2)
+        seen += [workout["id"] for workout in changed]
+        pages += 1
+        if not has_more:
+            break
+
+    assert pages == 3
+    assert sorted(seen) == sorted(workout["id"] for workout in workouts)
+    # Nothing new: the next sync is empty
+    assert (await changes_since(user_db, user, position, 2))[0] == []
+
+async def test_recent_changes_are_delivered_again_within_the_skew(user):
+    user_db = get_user_database(user)
+    await user_db.workouts.insert_many([dict(workout) for workout in workouts_at(user, 1, datetime.utcnow())])
+
+    changed, _, position, _ = await changes_since(user_db, user, None, 10)
+    assert len(changed) == 1
+    assert len((await changes_since(user_db, user, position, 10))[0]) == 1
+
+async def test_replaced_plan_workouts_are_reported_deleted(client, user):
+    headers = auth_headers(user)
+    assert (await client.post("/api/workouts/plan", json={"weeks": 1}, headers=headers)).status_code == 200
+    first = (await client.get("/api/sync", headers=headers)).json()
+    # Only pending workouts are replaced; today's active one is kept
+    original_ids = {workout["id"] for workout in first["workouts"] if workout["status"] == "pending"}
+    assert first["profile"]["id"] == user
+
+    assert (await client.post("/api/workouts/plan", json={"weeks": 1}, headers=headers)).status_code == 200
+    second = (await client.get("/api/sync", params={"since": first["cursor"]}, headers=headers)).json()
+
+    assert original_ids and set(second["deleted"]) == original_ids
+    assert {workout["id"] for workout in second["workouts"]}.isdisjoint(original_ids)
+    assert not second["reset"]
+
+async def test_cursor_older_than_tombstones_resets(client, user):
+    user_db = get_user_database(user)
+    await user_db.workouts.insert_many([dict(workout) for workout in workouts_at(user, 2, datetime.utcnow() - timedelta(days=60))])
+    expired = encode_cursor((to_millis(datetime.utcnow() - timedelta(days=SYNC_TOMBSTONE_DAYS + 1)), ""))
+
+    response = (await client.get("/api/sync", params={"since": expired}, headers=auth_headers(user))).json()
+
+    assert response["reset"]
+    assert len(response["workouts"]) == 2
+    assert response["profile"] is not None
+
+async def test_full_sync_includes_archived_and_legacy_workouts(user):
+    user_db = get_user_database(user)
+    archived, both, legacy = workouts_at(user, 3, datetime.utcnow() - timedelta(days=40))
+    archived["archiveBatch"] = "batch-1"
+    del legacy["updatedAt"]
+    await user_db.workouts_archive.insert_many([dict(archived), dict(both)])
+    # Caught between the archive job's copy and delete
+    await user_db.workouts.insert_many([dict(both), dict(legacy)])
+
+    changed, deleted, _, has_more = await changes_since(user_db, user, None, 10)
+
+    assert sorted(workout["id"] for workout in changed) == sorted([archived["id"], both["id"], legacy["id"]])
+    assert all("archiveBatch" not in workout for workout in changed)
+    assert changed[0]["id"] == legacy["id"]
+    assert deleted == [] and not has_more
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+import csv
+import io
+import json
+import pytest
+
+from conftest import auth_headers, user_on
+from database import get_user_database
+
+pytestmark = pytest.mark.anyio
+
+def completed(user_id: str, workout_id: str, date: datetime) -> dict:
+    return {
+        "id": workout_id, "userId": user_id, "name": "Treino A", "status": "completed", "progress": 100,
+        "date": date, "completedAt": date,
+        "exercises": [
+            {"id": "ex_0", "name": "Supino\nreto", "sets": 3, "reps": 10, "weight": 60.0, "restTime": 90,
+             "completed": True, "completedSets": 3},
+            {"id": "ex_1", "name": "Remada", "sets": 3, "reps": 12, "weight": 40.0, "restTime": 60,
+             "completed": True, "completedSets": 3},
+        ]
+    }
+
+@pytest.fixture
+async def history(router):
+    """A user on the east shard with one archived and two hot workouts, and their set logs"""
+    user_id = user_on(router, "east", "exporter")
+    user_db = get_user_database(user_id)
+    await user_db.users.insert_one({"id": user_id, "name": "Ana", "email": "ana@example.com", "passwordHash": "secret"})
+    now = datetime.utcnow()
+    await user_db.workouts_archive.insert_one(completed(user_id, "w-old", now - timedelta(days=400)))
+    await user_db.workouts.insert_many([completed(user_id, "w-2", now), completed(user_id, "w-1", now - timedelta(days=2))])
+    await user_db.set_logs.insert_many([
+        {"userId": user_id, "workoutId": "w-1", "exerciseId": "ex_0", "exerciseName": "Supino\nreto",
+         "weight": 62.5, "reps": 8, "completedAt": now - timedelta(days=2, minutes=-number)}
+        for number in range(3)
+    ])
+    return user_id
+
+async def test_ndjson_export_streams_profile_history_and_set_logs(client, history):
+    response = await client.get("/api/user/export", params={"batch_size": 2}, headers=auth_headers(history))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert records[0]["type"] == "profile" and "passwordHash" not in records[0]
+    # Archived history first, then by date
+    assert [record["id"] for record in records if record["type"] == "workout"] == ["w-old", "w-1", "w-2"]
+    set_logs = [record for record in records if record["type"] == "set_log"]
+    assert len(set_logs) == 3 and all("userId" not in record for record in set_logs)
+    assert set_logs[0]["completedAt"] < set_logs[-1]["completedAt"]
+
+async def test_csv_export_has_one_row_per_exercise(client, history):
+    response = await client.get("/api/user/export", params={"format": "csv", "compress": True}, headers=auth_headers(history))
+
+    assert response.headers["content-encoding"] == "gzip"
+    # httpx decodes the body; the raw stream is gzip
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 6
+    assert rows[0]["workoutId"] == "w-old" and rows[0]["exerciseName"] == "Supino\nreto"
+
+async def test_unknown_format_is_rejected(client, history):
+    response = await client.get("/api/user/export", params={"format": "xml"}, headers=auth_headers(history))
+    assert response.status_code == 400
@@ -0,0 +1,79 @@
+from datetime import timedelta
+import pytest
+
+from conftest import auth_headers, user_on
+from database import get_user_database
+from field_selection import FieldSelection
+from models.workout import WorkoutResponse
+from routes.workouts import DEFAULT_SPLIT, build_plan, start_of_day
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def planned(router):
+    """A user with a week of workouts from today"""
+    user_id = user_on(router, "east", "fields")
+    await get_user_database(user_id).workouts.insert_many(
+        build_plan(user_id, {weekday: DEFAULT_SPLIT[0] for weekday in range(7)}, 1, start_of_day())
+    )
+    return user_id
+
+@pytest.mark.parametrize("fields, detail", [
+    ("id,bogus,_id", "Campos inválidos: _id, bogus"),
+    ("", "Nenhum campo informado"),
+    (" , ,", "Nenhum campo informado"),
+])
+async def test_invalid_selections_are_rejected(client, planned, fields, detail):
+    for path in ("/api/workouts/", "/api/workouts/today", "/api/workouts/upcoming"):
+        response = await client.get(path, params={"fields": fields}, headers=auth_headers(planned))
+        assert response.status_code == 400
+        assert response.json()["detail"] == detail
+
+def test_projection_reads_only_the_selected_fields():
+    assert FieldSelection(WorkoutResponse).projection() is None
+    selection = FieldSelection(WorkoutResponse, frozenset({"id", "status"}))
+    assert selection.projection() == {"_id": 0, "id": 1, "status": 1}
+    assert selection.projection(always=("date",)) == {"_id": 0, "id": 1, "status": 1, "date": 1}
+    assert selection.includes("status", "progress") and not selection.includes("exercises")
+
+async def test_routes_read_and_render_only_the_selected_fields(client, planned, monkeypatch):
+    projections = []
+    collection = type(get_user_database(planned).workouts)
+    find, find_one = collection.find, collection.find_one
+
+    def recording_find(self, filter=None, projection=None, *args, **kwargs):
+        projections.append(projection)
+        return find(self, filter, projection, *args, **kwargs)
+
+    def recording_find_one(self, filter=None, projection=None, *args, **kwargs):
+        projections.append(projection)
+        return find_one(self, filter, projection, *args, **kwargs)
+    monkeypatch.setattr(collection, "find", recording_find)
+    monkeypatch.setattr(collection, "find_one", recording_find_one)
+    headers = auth_headers(planned)
+
+    workouts = await client.get("/api/workouts/", params={"fields": "id, status"}, headers=headers)
+    today = await client.get("/api/workouts/today", params={"fields": "name,date"}, headers=headers)
+    upcoming = await client.get("/api/workouts/upcoming", params={"fields": "id,version"}, headers=headers)
+
+    assert [response.status_code for response in (workouts, today, upcoming)] == [200, 200, 200]
+    assert len(workouts.json()) == 7
+    assert all(workout.keys() == {"id", "status"} for workout in workouts.json())
+    assert workouts.json()[0]["status"] == "active"
+    assert today.json() == {"name": DEFAULT_SPLIT[0], "date": start_of_day().isoformat()}
+    assert [workout.keys() for workout in upcoming.json()] == [{"id", "version"}] * 7
+    assert projections == [
+        {"_id": 0, "id": 1, "status": 1},
+        {"_id": 0, "name": 1, "date": 1},
+        {"_id": 0, "id": 1, "version": 1, "date": 1},
+    ]
+
+async def test_without_fields_the_full_model_is_returned(client, planned):
+    response = await client.get(
+        "/api/workouts/upcoming",
+        params={"from": str((start_of_day() + timedelta(days=1)).date())},
+        headers=auth_headers(planned)
+    )
+    assert response.status_code == 200
+    assert all(workout.keys() == WorkoutResponse.model_fields.keys() for workout in response.json())
+    assert len(response.json()) == 6
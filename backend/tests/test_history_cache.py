@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+
+from analytics import synthetic_history
+from history_cache import HistoryCache, history_size
+
+def history(sets: int):
+    return synthetic_history(sets, exercises=2, days=30)
+
+def test_bus_invalidates_one_user_or_everyone():
+    cache = HistoryCache()
+    for user_id in ("ana", "bia"):
+        cache.put(user_id, history(10))
+
+    cache.on_change("users", "ana")
+    assert cache.get("ana") is not None
+    cache.on_change("set_logs", "ana")
+    assert cache.get("ana") is None and cache.get("bia") is not None
+    cache.on_change("workouts", None)
+    assert len(cache) == 0 and cache.resident_bytes == 0
+
+@pytest.mark.anyio
+async def test_invalidation_during_a_load_is_not_overwritten():
+    cache = HistoryCache()
+    loading = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_loader():
+        loading.set()
+        await release.wait()
+        return history(10)
+
+    load = asyncio.create_task(cache.get_or_load("ana", slow_loader))
+    await loading.wait()
+    cache.on_change("set_logs", "ana")
+    release.set()
+
+    assert len(await load) == 10
+    assert cache.get("ana") is None
+    # A load that nothing interrupted is kept
+    await cache.get_or_load("ana", slow_loader)
+    assert cache.get("ana") is not None
+
+def test_least_recently_used_histories_are_evicted_by_size():
+    size = history_size(history(100))
+    cache = HistoryCache(max_bytes=size * 2)
+    cache.put("ana", history(100))
+    cache.put("bia", history(100))
+    cache.get("ana")
+
+    cache.put("caio", history(100))
+
+    assert cache.get("bia") is None
+    assert cache.get("ana") is not None and cache.get("caio") is not None
+    assert cache.resident_bytes == size * 2
+    # Larger than the whole budget: never cached
+    cache.put("duda", history(1000))
+    assert cache.get("duda") is None
+
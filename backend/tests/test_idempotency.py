@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+import asyncio
+import httpx
+import pytest
+
+from conftest import auth_headers
+from middleware.idempotency import IdempotencyMiddleware, request_fingerprint
+
+pytestmark = pytest.mark.anyio
+
+class Handler:
+    """Counts executions; can fail once or hold requests until released"""
+
+    def __init__(self):
+        self.calls = 0
+        self.fail_next = False
+        self.release = None
+
+    async def endpoint(self, request):
+        self.calls += 1
+        body = await request.json()
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail_next:
+            self.fail_next = False
+            return JSONResponse({"detail": "boom"}, status_code=500)
+        return JSONResponse({"call": self.calls, "echo": body}, status_code=201)
+
+@pytest.fixture
+def handler():
+    return Handler()
+
+@pytest.fixture
+async def http(router, handler):
+    app = IdempotencyMiddleware(Starlette(routes=[Route("/items", handler.endpoint, methods=["POST"])]))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+def headers(key: str, user_id: str = "user-1") -> dict:
+    return {**auth_headers(user_id), "Idempotency-Key": key}
+
+async def test_retry_replays_the_stored_response(http, handler):
+    first = await http.post("/items", json={"n": 1}, headers=headers("k1"))
+    retry = await http.post("/items", json={"n": 1}, headers=headers("k1"))
+
+    assert handler.calls == 1
+    assert retry.status_code == first.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+async def test_keys_are_scoped_to_the_user(http, handler):
+    await http.post("/items", json={"n": 1}, headers=headers("k1", "user-1"))
+    await http.post("/items", json={"n": 1}, headers=headers("k1", "user-2"))
+
+    assert handler.calls == 2
+
+async def test_key_reused_for_another_request_is_rejected(http, handler):
+    await http.post("/items", json={"n": 1}, headers=headers("k1"))
+    response = await http.post("/items", json={"n": 2}, headers=headers("k1"))
+
+    assert response.status_code == 422
+    assert handler.calls == 1
+
+async def test_concurrent_retry_gets_409_while_the_first_attempt_runs(http, handler):
+    handler.release = asyncio.Event()
+    first = asyncio.create_task(http.post("/items", json={"n": 1}, headers=headers("k1")))
+    while handler.calls == 0:
+        await asyncio.sleep(0.001)
+
+    retry = await http.post("/items", json={"n": 1}, headers=headers("k1"))
+    handler.release.set()
+
+    assert retry.status_code == 409
+    assert retry.headers["Retry-After"] == "1"
+    assert (await first).status_code == 201
+    assert handler.calls == 1
+
+async def test_server_errors_are_not_stored(http, handler, db):
+    handler.fail_next = True
+    failed = await http.post("/items", json={"n": 1}, headers=headers("k1"))
+    retried = await http.post("/items", json={"n": 1}, headers=headers("k1"))
+
+    assert failed.status_code == 500
+    assert retried.status_code == 201
+    assert handler.calls == 2
+    assert (await db.idempotency_keys.find_one({"_id": "user-1:k1"}))["state"] == "done"
+
+async def test_abandoned_attempt_is_taken_over_after_its_lock(http, handler, db):
+    scope = {"method": "POST", "path": "/items", "query_string": b""}
+    body = b'{"n":1}'
+    await db.idempotency_keys.insert_one({
+        "_id": "user-1:k1",
+        "userId": "user-1",
+        "fingerprint": request_fingerprint(scope, [{"type": "http.request", "body": body}], True),
+        "state": "in_progress",
+        "lockedUntil": datetime.utcnow() - timedelta(seconds=1),
+        "expiresAt": datetime.utcnow() + timedelta(hours=1)
+    })
+
+    response = await http.post("/items", content=body, headers={**headers("k1"), "Content-Type": "application/json"})
+
+    assert response.status_code == 201
+    assert handler.calls == 1
+
+async def test_requests_without_key_or_user_pass_through(http, handler):
+    await http.post("/items", json={"n": 1})
+    await http.post("/items", json={"n": 1}, headers={"Idempotency-Key": "k1"})
+    await http.post("/items", json={"n": 1}, headers=auth_headers("user-1"))
+
+    assert handler.calls == 3
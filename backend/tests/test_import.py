@@ -0,0 +1,124 @@
+from mongomock.collection import Collection
+import json
+import mongomock
+import pytest
+
+from conftest import auth_headers, user_on
+from database import get_user_database
+from routes.user import _iter_import_records, _iter_lines, import_records
+
+pytestmark = pytest.mark.anyio
+
+CSV_UPLOAD = (
+    "workoutId,workoutName,date,status,progress,exerciseId,exerciseName,sets,reps,weight,restTime,completed,completedSets,image\n"
+    'w-1,Treino A,2024-03-04T10:00:00,completed,100,ex_0,"Supino\nreto",3,10,60,90,true,3,\n'
+    "w-1,Treino A,2024-03-04T10:00:00,completed,100,ex_1,Remada,3,12,40,60,true,2,\n"
+    "w-2,Treino B,2024-03-06T10:00:00,completed,100,ex_0,Agachamento,4,8,80,120,true,4,\n"
+    "w-3,Treino C,2024-03-08T10:00:00,skipped,0,ex_0,Terra,3,5,100,120,false,0,\n"
+)
+
+@pytest.fixture
+async def user(indexed):
+    user_id = user_on(indexed, "east", "importer")
+    await get_user_database(user_id).users.insert_one({
+        "id": user_id, "name": "Ana", "email": "ana@example.com", "totalWorkouts": 1, "streak": 0
+    })
+    return user_id
+
+async def chunks(body: bytes):
+    yield body
+
+async def upload(client, user_id: str, body: str, format: str = "csv") -> dict:
+    response = await client.post(
+        "/api/user/import", params={"format": format, "chunk_size": 2}, content=body.encode(), headers=auth_headers(user_id)
+    )
+    assert response.status_code == 200
+    return response.json()
+
+async def test_csv_import_logs_completed_sets_and_updates_rollups(client, user):
+    result = await upload(client, user, CSV_UPLOAD)
+
+    assert result == {"success": True, "imported": 3, "setLogs": 9, "failed": 0, "errors": []}
+    user_db = get_user_database(user)
+    first = await user_db.workouts.find_one({"id": "w-1"})
+    assert first["exercises"][0]["name"] == "Supino\nreto"
+    assert await user_db.set_logs.count_documents({"userId": user, "workoutId": "w-1"}) == 5
+    profile = await user_db.users.find_one({"id": user})
+    assert profile["totalWorkouts"] == 3
+    assert profile["lastWorkoutAt"].isoformat() == "2024-03-06T10:00:00"
+
+async def test_reimport_reports_duplicates_without_logging_sets_again(client, user):
+    await upload(client, user, CSV_UPLOAD)
+
+    result = await upload(client, user, CSV_UPLOAD)
+
+    assert result["imported"] == 0 and result["failed"] == 3 and result["setLogs"] == 0
+    assert [error["row"] for error in result["errors"]] == [2, 5, 6]
+    assert await get_user_database(user).set_logs.count_documents({"userId": user}) == 9
+    assert (await get_user_database(user).users.find_one({"id": user}))["totalWorkouts"] == 3
+
+async def test_invalid_rows_are_reported(client, user):
+    body = CSV_UPLOAD.splitlines()[0] + "\nw-9,,2024-03-04,completed,100,ex_0,Supino,três,10,60,90,true,3,\n"
+
+    result = await upload(client, user, body)
+
+    assert not result["success"] and result["failed"] == 1 and result["errors"][0]["row"] == 2
+
+async def test_ndjson_export_round_trips_set_logs(client, user, indexed):
+    await upload(client, user, CSV_UPLOAD)
+    # The real sets differ from the plan: an export carries them
+    await get_user_database(user).set_logs.update_many({"workoutId": "w-2"}, {"$set": {"weight": 82.5, "derived": False}})
+
+    response = await client.get("/api/user/export", params={"format": "ndjson", "batch_size": 2}, headers=auth_headers(user))
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["type"] for record in records[:4]] == ["profile", "workout", "workout", "workout"]
+    assert sum(record["type"] == "set_log" for record in records) == 9
+    assert "passwordHash" not in records[0]
+
+    # Imported by another user on the other shard: their logs replace the derived ones
+    other = user_on(indexed, "home", "restore")
+    result = await upload(client, other, response.text, format="ndjson")
+
+    assert result["imported"] == 3 and result["setLogs"] == 9
+    weights = await get_user_database(other).set_logs.distinct("weight", {"userId": other, "workoutId": "w-2"})
+    assert weights == [82.5]
+
+async def test_only_finished_workouts_are_imported(client, user):
+    body = "\n".join(json.dumps(record) for record in (
+        {"type": "workout", "name": "Treino A", "date": "2024-03-04T10:00:00", "status": "active", "exercises": []},
+        {"type": "workout", "name": "Treino B", "date": "2024-03-05T10:00:00", "status": "skipped", "exercises": []},
+        {"type": "workout", "name": "Treino C", "date": "2024-03-06T10:00:00", "exercises": []},
+    ))
+
+    result = await upload(client, user, body, format="ndjson")
+
+    assert result["imported"] == 2 and [error["row"] for error in result["errors"]] == [1]
+    statuses = await get_user_database(user).workouts.distinct("status", {"userId": user})
+    assert sorted(statuses) == ["completed", "skipped"]
+
+class ClientSession:
+    """Stands in for a real session of `client`: mongomock refuses sessions, so they are recorded instead"""
+
+    def __init__(self, client):
+        self.client = client
+
+@pytest.mark.parametrize("shard_name", ["home", "east"])
+async def test_rollups_join_the_import_session_on_its_own_client(indexed, monkeypatch, shard_name):
+    user_id = user_on(indexed, shard_name, "session")
+    user_db = get_user_database(user_id)
+    await user_db.users.insert_one({"id": user_id, "email": f"{user_id}@example.com", "totalWorkouts": 0})
+    sessions = {}
+    update_one = Collection.update_one
+
+    def record_session(self, *args, session=None, **kwargs):
+        sessions[self.name] = session
+        return update_one(self, *args, **kwargs)
+    monkeypatch.setattr(Collection, "update_one", record_session)
+    monkeypatch.setattr(mongomock.collection, "raise_not_implemented", lambda *args: None)
+    session = ClientSession(user_db.client)
+
+    records = _iter_import_records(_iter_lines(chunks(CSV_UPLOAD.encode())), "csv")
+    await import_records(user_db, user_id, records, 2, session)
+
+    assert (await user_db.users.find_one({"id": user_id}))["totalWorkouts"] == 2
+    assert sessions["users"] is (session if shard_name == "home" else None)
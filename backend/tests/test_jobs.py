@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+import pytest
+
+import jobs
+from conftest import user_on
+from database import get_user_database
+
+pytestmark = pytest.mark.anyio
+
+def completed(user_id: str, workout_id: str, when: datetime, completed_sets: int = 0) -> dict:
+    return {
+        "id": workout_id, "userId": user_id, "name": "Treino A", "status": "completed", "date": when, "completedAt": when,
+        "exercises": [{"id": "ex_0", "name": "Supino", "sets": 3, "reps": 10, "weight": 60.0, "completed": True,
+                       "completedSets": completed_sets}]
+    }
+
+async def test_streaks_are_backfilled_then_expired(router, db):
+    # MongoDB keeps milliseconds
+    now = datetime.utcnow().replace(microsecond=0)
+    lapsed, active, fresh = (user_on(router, "east", prefix) for prefix in ("lapsed", "active", "fresh"))
+    await db.users.insert_many([
+        {"id": lapsed, "streak": 3, "createdAt": now - timedelta(days=90)},
+        {"id": active, "streak": 2, "createdAt": now - timedelta(days=90)},
+        {"id": fresh, "streak": 1, "createdAt": now},
+        {"id": "idle", "streak": 0},
+    ])
+    east = router.shards["east"].database
+    await east.workouts.insert_one(completed(lapsed, "w-1", now - timedelta(days=5)))
+    await east.workouts_archive.insert_one(completed(active, "w-2", now - timedelta(days=400)))
+    await east.workouts.insert_one(completed(active, "w-3", now - timedelta(hours=1)))
+
+    await jobs.expire_streaks(db)
+
+    users = {user["id"]: user async for user in db.users.find()}
+    assert users[lapsed]["streak"] == 0
+    assert users[active]["streak"] == 2 and users[active]["lastWorkoutAt"] == now - timedelta(hours=1)
+    assert users[fresh]["streak"] == 1 and users[fresh]["lastWorkoutAt"] == now
+    assert "lastWorkoutAt" not in users["idle"]
+
+async def test_rollups_are_recounted_from_every_shard(router, db):
+    counted, moved_out = user_on(router, "east", "counted"), user_on(router, "home", "emptied")
+    await db.users.insert_many([
+        {"id": counted, "totalWorkouts": 40, "archived": {"workouts": 5}},
+        {"id": moved_out, "totalWorkouts": 7, "archived": {"workouts": 2}},
+    ])
+    now = datetime.utcnow()
+    east = router.shards["east"].database
+    await east.workouts.insert_many([completed(counted, f"w-{number}", now) for number in range(3)])
+    await east.workouts.insert_one({**completed(counted, "w-pending", now), "status": "pending"})
+
+    await jobs.reconcile_user_rollups(db)
+
+    users = {user["id"]: user async for user in db.users.find()}
+    assert users[counted]["totalWorkouts"] == 8
+    assert users[moved_out]["totalWorkouts"] == 2
+
+async def test_set_logs_are_backfilled_once_per_shard(router):
+    user_id = user_on(router, "east", "lifter")
+    east = get_user_database(user_id)
+    now = datetime.utcnow()
+    await east.workouts_archive.insert_one(completed(user_id, "old", now - timedelta(days=400), completed_sets=3))
+    await east.workouts.insert_many([
+        completed(user_id, "recent", now, completed_sets=2),
+        completed(user_id, "logged", now, completed_sets=3),
+        completed(user_id, "skipped", now),
+    ])
+    await east.set_logs.insert_one({"userId": user_id, "workoutId": "logged", "exerciseId": "ex_0", "completedAt": now})
+
+    await jobs.backfill_all_set_logs()
+
+    assert await east.set_logs.count_documents({"workoutId": "old"}) == 3
+    assert await east.set_logs.count_documents({"workoutId": "recent", "derived": True}) == 2
+    assert await east.set_logs.count_documents({"workoutId": "logged"}) == 1
+    assert (await router.shards["east"].database.migrations.find_one({"_id": "set_logs_backfill"}))["setLogs"] == 5
+    await east.workouts.insert_one(completed(user_id, "later", now, completed_sets=1))
+    assert await jobs.backfill_set_logs(router.shards["east"].database) == 0
@@ -0,0 +1,109 @@
+import os
+import signal
+import time
+import pytest
+import uvicorn
+
+from launcher import Launcher, parse_args
+
+class FakeWorkers(Launcher):
+    """Forks real children that report ready (or not) without serving anything"""
+
+    def __init__(self, argv=(), ready=True):
+        super().__init__(parse_args(["--ready-timeout", "2", "--graceful-timeout", "2", *argv]))
+        self.ready = ready
+
+    def run_worker(self, ready_fd: int):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if self.ready:
+            os.write(ready_fd, b"1")
+        os.close(ready_fd)
+        while True:
+            time.sleep(1)
+
+@pytest.fixture
+def launcher():
+    launcher = FakeWorkers()
+    yield launcher
+    launcher.stopping = True
+    launcher.shutdown()
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return os.waitpid(pid, os.WNOHANG) == (0, 0)
+    except (ProcessLookupError, ChildProcessError):
+        return False
+
+def test_pool_budget_is_split_between_workers(monkeypatch):
+    class Server:
+        def __init__(self, config):
+            self.started = False
+
+        async def serve(self, sockets):
+            self.started = True
+
+    monkeypatch.setattr(uvicorn, "Server", Server)
+    # Runs in this process: keep pytest's signal handlers and environment
+    monkeypatch.setattr(signal, "signal", lambda *args: None)
+    monkeypatch.delenv("MONGO_MAX_POOL_SIZE", raising=False)
+    monkeypatch.delenv("MONGO_MIN_POOL_SIZE", raising=False)
+    launcher = Launcher(parse_args(["--workers", "3", "--pool-budget", "100", "--min-pool-budget", "10"]))
+    launcher.app = object()
+    read_fd, write_fd = os.pipe()
+
+    assert launcher.run_worker(write_fd) == 0
+
+    assert os.read(read_fd, 1) == b"1"
+    os.close(read_fd)
+    assert os.environ["MONGO_MAX_POOL_SIZE"] == "33"
+    assert os.environ["MONGO_MIN_POOL_SIZE"] == "3"
+
+def test_worker_readiness_and_graceful_exit(launcher):
+    pid = launcher.spawn_worker()
+
+    assert launcher.wait_ready(pid)
+    launcher.stop_worker(pid)
+    assert launcher.wait_exit(pid, 2)
+    assert launcher.workers == {}
+
+def test_worker_that_never_starts_is_not_ready():
+    launcher = FakeWorkers(["--ready-timeout", "0.2"], ready=False)
+    pid = launcher.spawn_worker()
+    try:
+        assert not launcher.wait_ready(pid)
+    finally:
+        launcher.stop_worker(pid, signal.SIGKILL)
+        launcher.wait_exit(pid, 2)
+
+def test_rolling_restart_replaces_every_worker(launcher):
+    old = [launcher.spawn_worker() for _ in range(2)]
+    for pid in old:
+        launcher.wait_ready(pid)
+
+    launcher.rolling_restart()
+
+    assert len(launcher.workers) == 2 and set(launcher.workers).isdisjoint(old)
+    assert not any(alive(pid) for pid in old)
+
+def test_rolling_restart_stops_at_a_broken_replacement(launcher):
+    old = [launcher.spawn_worker() for _ in range(2)]
+    for pid in old:
+        launcher.wait_ready(pid)
+    launcher.ready = False
+    launcher.args.ready_timeout = 0.2
+
+    launcher.rolling_restart()
+
+    assert sorted(launcher.workers) == sorted(old)
+    assert all(alive(pid) for pid in old)
+
+def test_dead_workers_are_replaced(launcher):
+    pid = launcher.spawn_worker()
+    launcher.wait_ready(pid)
+    os.kill(pid, signal.SIGKILL)
+    time.sleep(0.2)
+
+    launcher.reap()
+
+    assert len(launcher.workers) == 1 and pid not in launcher.workers
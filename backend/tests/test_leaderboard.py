@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+import random
+import pytest
+
+import leaderboard
+from leaderboard import rebuild_week, record_workout_volume, top_entries, user_rank, week_key, workout_volume
+
+pytestmark = pytest.mark.anyio
+
+USERS = [f"user-{number:02d}" for number in range(40)]
+
+async def brute_force_rank(db, week: str, user_id: str) -> int:
+    doc = await db.leaderboard_weekly.find_one({"week": week, "userId": user_id})
+    return await db.leaderboard_weekly.count_documents({"week": week, "volume": {"$gt": doc["volume"]}}) + 1
+
+@pytest.fixture
+async def board(indexed):
+    """Completed workouts of USERS spread over both shards, most of them recorded live"""
+    home, east = (shard.database for shard in indexed.shards.values())
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    for number, user_id in enumerate(USERS):
+        for workout_number in range(rng.randint(1, 3)):
+            workout = {
+                "id": f"{user_id}-{workout_number}", "userId": user_id, "status": "completed",
+                "date": now - timedelta(days=workout_number), "completedAt": now,
+                "exercises": [{"sets": 3, "reps": 10, "weight": rng.choice([20, 40.5, 60, 80]), "completed": True}]
+            }
+            await (home, east)[number % 2].workouts.insert_one(workout)
+            if rng.random() < 0.7:
+                await record_workout_volume(home, user_id, workout["id"], workout_volume(workout), now)
+    return home, east, week_key(now)
+
+async def computed_volume(shards, user_id: str) -> float:
+    volume = 0.0
+    for shard in shards:
+        volume += sum([workout_volume(workout) async for workout in shard.workouts.find({"userId": user_id})])
+    return volume
+
+async def test_rebuild_matches_the_workouts_and_ranks_match_a_full_count(board):
+    home, east, week = board
+    await home.leaderboard_weekly.insert_one({"week": week, "userId": "gone", "volume": 1e6})
+
+    assert await rebuild_week(home, week, [home, east]) == len(USERS)
+
+    for user_id in USERS:
+        doc = await home.leaderboard_weekly.find_one({"week": week, "userId": user_id})
+        assert doc["volume"] == pytest.approx(await computed_volume([home, east], user_id))
+        assert (await user_rank(home, week, user_id))["rank"] == await brute_force_rank(home, week, user_id)
+    top = await top_entries(home, week, 10)
+    for entry in top:
+        assert entry["rank"] == await brute_force_rank(home, week, entry["userId"])
+
+async def test_live_updates_during_a_rebuild_are_kept(board, monkeypatch):
+    home, east, week = board
+    rebuild_batch = leaderboard._rebuild_batch
+    conflicted = None
+
+    async def batch_with_live_writes(db, week_, batch, *args):
+        nonlocal conflicted
+        # A workout completed after the rebuild's snapshot, and a concurrent write to a bucket already read
+        await record_workout_volume(db, "user-02", "late", 777, datetime.utcnow())
+        conflicted = next(user_id for user_id, _, current in batch if current is not None and user_id != "user-02")
+        await db.leaderboard_weekly.update_one({"week": week_, "userId": conflicted}, {"$inc": {"rev": 1}})
+        await rebuild_batch(db, week_, batch, *args)
+    monkeypatch.setattr(leaderboard, "_rebuild_batch", batch_with_live_writes)
+
+    await rebuild_week(home, week, [home, east])
+
+    late = await home.leaderboard_weekly.find_one({"week": week, "userId": "user-02"})
+    assert any(entry["id"] == "late" for entry in late["workouts"])
+    assert late["volume"] == pytest.approx(await computed_volume([home, east], "user-02") + 777)
+    retried = await home.leaderboard_weekly.find_one({"week": week, "userId": conflicted})
+    assert retried["volume"] == pytest.approx(await computed_volume([home, east], conflicted))
+    for user_id in USERS:
+        assert (await user_rank(home, week, user_id))["rank"] == await brute_force_rank(home, week, user_id)
+
+async def test_a_workout_is_counted_once(indexed):
+    db = indexed.home.database
+    now = datetime.utcnow()
+    for _ in range(2):
+        await record_workout_volume(db, "ana", "workout-1", 500, now)
+
+    doc = await db.leaderboard_weekly.find_one({"userId": "ana"})
+    assert doc["volume"] == 500 and len(doc["workouts"]) == 1
+    assert await user_rank(db, week_key(now), "ana") == {"rank": 1, "volume": 500}
@@ -0,0 +1,112 @@
+from mongomock_motor import AsyncMongoMockDatabase
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+import asyncio
+import pytest
+
+import live
+from conftest import auth_headers, user_on
+from database import get_user_database
+from live import LiveConnection, LiveHub
+from routes.workouts import DEFAULT_SPLIT, build_plan, start_of_day
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, event):
+        self.sent.append(event)
+
+    async def close(self, code: int = 1000):
+        pass
+
+@pytest.fixture
+def relay_db(db, monkeypatch):
+    """The home database, with capped collections created as plain ones (mongomock has none)"""
+    create_collection = AsyncMongoMockDatabase.create_collection
+
+    async def uncapped(self, name, **options):
+        return await create_collection(self, name)
+    monkeypatch.setattr(AsyncMongoMockDatabase, "create_collection", uncapped)
+    monkeypatch.setattr(live, "RELAY_RETRY_SECONDS", 0.01)
+    return db
+
+async def until(condition, timeout: float = 2):
+    async def wait():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(wait(), timeout)
+
+@pytest.mark.anyio
+async def test_events_reach_connections_on_other_workers_once(relay_db):
+    publisher, follower = LiveHub(), LiveHub()
+    await publisher.start(relay_db)
+    await follower.start(relay_db)
+    local, remote = FakeWebSocket(), FakeWebSocket()
+    publisher.register(LiveConnection(local, "ana", "w-1"))
+    follower.register(LiveConnection(remote, "ana", "w-1"))
+    try:
+        publisher.publish("w-1", {"type": "set_completed", "exerciseId": "ex_0"})
+        publisher.start_rest("w-1", "ex_0", 0)
+
+        await until(lambda: len(remote.sent) == 3 and len(local.sent) == 3)
+        # Reopened cursors go back a second: nothing is delivered twice
+        await asyncio.sleep(0.1)
+        assert [event["type"] for event in remote.sent] == ["set_completed", "rest_started", "rest_finished"]
+        assert [event["type"] for event in local.sent] == ["set_completed", "rest_started", "rest_finished"]
+        assert await relay_db.live_events.count_documents({"workoutId": "w-1"}) == 2
+    finally:
+        for hub in (publisher, follower):
+            for channel in list(hub.channels.values()):
+                for connection in list(channel):
+                    await hub.unregister(connection)
+            await hub.stop()
+
+@pytest.fixture
+def live_workout(router):
+    user_id = user_on(router, "east", "live")
+    workout = build_plan(user_id, {start_of_day().weekday(): DEFAULT_SPLIT[0]}, 1, start_of_day())[0]
+    asyncio.run(get_user_database(user_id).workouts.insert_one(dict(workout)))
+    return user_id, workout
+
+def test_live_session_authenticates_with_the_subprotocol(live_workout):
+    from server import app
+    user_id, workout = live_workout
+    token = auth_headers(user_id)["Authorization"].split()[1]
+    client = TestClient(app)
+
+    with client.websocket_connect(f"/api/workouts/{workout['id']}/live", subprotocols=["bearer", token]) as websocket:
+        assert websocket.accepted_subprotocol == "bearer"
+        assert websocket.receive_json()["type"] == "snapshot"
+        websocket.send_json({"type": "complete_set", "exerciseId": "ex_0"})
+        assert websocket.receive_json()["type"] == "set_completed"
+
+    for url, protocols in (
+        (f"/api/workouts/{workout['id']}/live?token={token}", []),
+        (f"/api/workouts/{workout['id']}/live", ["bearer", "forged"]),
+    ):
+        with pytest.raises(WebSocketDisconnect) as closed:
+            with client.websocket_connect(url, subprotocols=protocols):
+                pass
+        assert closed.value.code == 4401
+
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/api/workouts/missing/live", subprotocols=["bearer", token]):
+            pass
+    assert closed.value.code == 4404
+
+def test_live_set_completions_are_validated_like_the_http_endpoint(live_workout):
+    from server import app
+    user_id, workout = live_workout
+    token = auth_headers(user_id)["Authorization"].split()[1]
+
+    with TestClient(app).websocket_connect(f"/api/workouts/{workout['id']}/live", subprotocols=["bearer", token]) as websocket:
+        assert websocket.receive_json()["type"] == "snapshot"
+        for invalid in ({"reps": 70_000}, {"reps": 0}, {"weight": -1}, {"reps": "10"}, {"version": True}, {"exerciseId": 0}):
+            websocket.send_json({"type": "complete_set", "exerciseId": "ex_0", **invalid})
+            assert websocket.receive_json() == {"type": "error", "detail": "Mensagem inválida"}
+        websocket.send_json({"type": "complete_set", "exerciseId": "ex_0", "weight": 62.5, "reps": 8})
+        assert websocket.receive_json()["type"] == "set_completed"
+
+    set_log = asyncio.run(get_user_database(user_id).set_logs.find_one({"workoutId": workout["id"]}))
+    assert (set_log["weight"], set_log["reps"]) == (62.5, 8)
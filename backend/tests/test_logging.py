@@ -0,0 +1,87 @@
+import io
+import json
+import logging
+import pytest
+import queue
+
+import metrics
+from logging_config import (
+    DeferredFormatQueueHandler, DrainingQueueListener, JsonFormatter, SamplingFilter, parse_sampling
+)
+
+@pytest.fixture
+def pipeline():
+    """A queued JSON pipeline like setup_logging's, on its own logger; yields a factory"""
+    loggers = []
+
+    def build(rates=None, size=100, name=None):
+        output = io.StringIO()
+        handler = logging.StreamHandler(output)
+        handler.setFormatter(JsonFormatter())
+        log_queue = queue.Queue(size)
+        queued = DeferredFormatQueueHandler(log_queue)
+        queued.addFilter(SamplingFilter(rates or {}))
+        logger = logging.getLogger(name or f"tests.logging.{len(loggers)}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(queued)
+        loggers.append((logger, queued))
+
+        def lines():
+            # Stopping drains the queue into the output
+            listener = DrainingQueueListener(log_queue, handler)
+            listener.start()
+            listener.stop()
+            return [json.loads(line) for line in output.getvalue().splitlines()]
+        return logger, lines
+    yield build
+    for logger, queued in loggers:
+        logger.removeHandler(queued)
+
+def counter(name: str, logger: str) -> float:
+    return metrics.snapshot()["counters"].get(f"{name}{{logger={logger}}}", 0)
+
+def test_records_are_json_with_arguments_merged_at_the_call_site(pipeline):
+    logger, lines = pipeline()
+    names = ["Ana"]
+
+    logger.info("Moved %s to %s", names, "east", extra={"route": "/api/workouts/"})
+    names.append("Bia")
+    try:
+        raise ValueError("falhou")
+    except ValueError:
+        logger.exception("Backfill failed")
+
+    moved, failed = lines()
+    assert moved["message"] == "Moved ['Ana'] to east"
+    assert moved["level"] == "INFO" and moved["logger"] == logger.name
+    assert moved["route"] == "/api/workouts/"
+    assert moved["time"].endswith("+00:00")
+    assert failed["level"] == "ERROR" and "ValueError: falhou" in failed["exception"]
+
+def test_sampling_applies_to_loggers_and_their_children_below_warning(pipeline):
+    assert parse_sampling(" tests.live=0.1, bad, compression=3") == {"tests.live": 0.1, "compression": 1.0}
+    rates = {"tests.live": 0.0, "tests.live.sessions": 1.0}
+    logger, lines = pipeline(rates, name="tests.live")
+    child = logging.getLogger("tests.live.updates")
+    sampled_out = counter("log_records_sampled_out", "tests.live.updates")
+
+    for number in range(5):
+        child.info("update %s", number)
+    child.warning("slow update")
+
+    assert [line["message"] for line in lines()] == ["slow update"]
+    assert counter("log_records_sampled_out", "tests.live.updates") - sampled_out == 5
+    sampling = SamplingFilter(rates)
+    assert sampling.rate("tests.live.sessions.ws") == 1.0 and sampling.rate("tests.livestream") is None
+
+def test_a_full_queue_drops_and_counts_records(pipeline):
+    logger, lines = pipeline(size=3)
+    dropped = counter("log_records_dropped", logger.name)
+
+    for number in range(5):
+        logger.info("set %s", number)
+
+    assert counter("log_records_dropped", logger.name) - dropped == 2
+    # The listener still stops cleanly with the queue full
+    assert [line["message"] for line in lines()] == ["set 0", "set 1", "set 2"]
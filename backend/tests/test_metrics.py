@@ -0,0 +1,20 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+async def test_metrics_do_not_exist_without_a_scraper_token(client, monkeypatch):
+    monkeypatch.setattr(server, "METRICS_TOKEN", None)
+    assert (await client.get("/api/metrics")).status_code == 404
+
+async def test_metrics_require_the_scraper_token(client, monkeypatch):
+    monkeypatch.setattr(server, "METRICS_TOKEN", "scraper-secret")
+
+    assert (await client.get("/api/metrics")).status_code == 401
+    response = await client.get("/api/metrics", headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401 and response.headers["WWW-Authenticate"] == "Bearer"
+
+    response = await client.get("/api/metrics", headers={"Authorization": "Bearer scraper-secret"})
+    assert response.status_code == 200
+    assert "counters" in response.json()
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import pytest
+
+from auth import password
+from auth.password import calibrate_rounds, ensure_calibrated, hash_password, hash_rounds, needs_rehash
+import routes.auth
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def unpinned(monkeypatch):
+    """A process without BCRYPT_ROUNDS, whose hashing costs 5ms at the minimum cost"""
+    monkeypatch.setattr(password, "_pinned", False)
+    monkeypatch.setattr(password, "_calibrated", False)
+    monkeypatch.setattr(password, "_rounds", password._rounds)
+    monkeypatch.setattr(password, "_time_hash", lambda rounds: 5.0 * 2 ** (rounds - password.BCRYPT_MIN_ROUNDS))
+
+def test_calibration_picks_the_cost_closest_to_the_target(unpinned):
+    assert calibrate_rounds(100) == 14  # 80ms, where 15 would take 160ms
+    assert calibrate_rounds(1) == password.BCRYPT_MIN_ROUNDS
+    assert calibrate_rounds(1e9) == password.BCRYPT_MAX_ROUNDS
+
+def test_hashes_made_at_another_cost_need_rehashing(monkeypatch):
+    monkeypatch.setattr(password, "_rounds", 4)
+    hashed = hash_password("segredo123")
+
+    assert hash_rounds(hashed) == 4 and not needs_rehash(hashed)
+    monkeypatch.setattr(password, "_rounds", 5)
+    assert needs_rehash(hashed)
+    assert not needs_rehash("not-a-bcrypt-hash")
+
+async def test_the_first_worker_stores_the_cost_and_the_others_adopt_it(unpinned, db, monkeypatch):
+    await ensure_calibrated(db)
+    assert password.current_rounds() == 14
+    assert (await db.app_settings.find_one({"_id": password.ROUNDS_SETTING}))["rounds"] == 14
+
+    # Another machine, twice as fast, calibrates differently but uses the stored cost
+    monkeypatch.setattr(password, "_calibrated", False)
+    monkeypatch.setattr(password, "_time_hash", lambda rounds: 2.5 * 2 ** (rounds - password.BCRYPT_MIN_ROUNDS))
+    await ensure_calibrated(db)
+    assert password.current_rounds() == 14
+
+async def test_a_pinned_cost_is_not_stored(db):
+    await ensure_calibrated(db)
+
+    assert password.current_rounds() == 4
+    assert await db.app_settings.count_documents({}) == 0
+
+async def test_bcrypt_runs_off_the_event_loop_and_logins_rehash(client, db, monkeypatch):
+    threads = []
+    for name in ("hash_password", "verify_password"):
+        function = getattr(routes.auth, name)
+
+        def in_thread(*args, function=function):
+            threads.append(threading.get_ident())
+            return function(*args)
+        monkeypatch.setattr(routes.auth, name, in_thread)
+    credentials = {"email": "rehash@example.com", "password": "segredo123"}
+    assert (await client.post("/api/auth/register", json={"name": "Ana Souza", **credentials})).status_code == 200
+
+    monkeypatch.setattr(password, "_rounds", 5)
+    assert (await client.post("/api/auth/login", json=credentials)).status_code == 200
+    await asyncio.gather(*routes.auth._rehash_tasks)
+
+    assert threads and threading.get_ident() not in threads
+    assert hash_rounds((await db.users.find_one({"email": credentials["email"]}))["passwordHash"]) == 5
@@ -0,0 +1,120 @@
+from datetime import timedelta
+from pymongo.errors import DuplicateKeyError
+import pytest
+
+import jobs
+from conftest import auth_headers, user_on
+from database import ensure_workout_day_index, get_user_database
+from routes.workouts import DEFAULT_SPLIT, PLAN_HORIZON_DAYS, build_plan, ensure_plan, start_of_day
+
+pytestmark = pytest.mark.anyio
+
+async def test_plan_is_extended_once_it_runs_out(router):
+    user_id = user_on(router, "home")
+    user_db = get_user_database(user_id)
+    await user_db.users.insert_one({"id": user_id, "planSplit": {"0": "Costas e Bíceps"}})
+    await user_db.workouts.insert_many(build_plan(user_id, DEFAULT_SPLIT, 4, start_of_day() - timedelta(days=21)))
+
+    created = await ensure_plan(user_db, user_id)
+
+    assert created == 4  # four more Mondays, with the stored split
+    added = await user_db.workouts.find({"userId": user_id, "name": "Costas e Bíceps", "date": {"$gte": start_of_day() + timedelta(days=7)}}).to_list(None)
+    assert {workout["date"].weekday() for workout in added} == {0}
+    # Far enough ahead now: nothing more to do, however often it is asked
+    assert await ensure_plan(user_db, user_id) == 0
+    latest = await user_db.workouts.find_one({"userId": user_id}, sort=[("date", -1)])
+    assert latest["date"] >= start_of_day() + timedelta(days=PLAN_HORIZON_DAYS)
+    user = await user_db.users.find_one({"id": user_id})
+    assert user["planEndsAt"] == latest["date"]
+
+async def test_today_seeds_a_user_whose_plan_ran_out(router, client):
+    user_id = user_on(router, "home")
+    user_db = get_user_database(user_id)
+    await user_db.users.insert_one({"id": user_id, "planSplit": {str(day): DEFAULT_SPLIT[0] for day in range(7)}})
+    await user_db.workouts.insert_many(build_plan(user_id, DEFAULT_SPLIT, 1, start_of_day() - timedelta(days=30)))
+
+    response = await client.get("/api/workouts/today", headers=auth_headers(user_id))
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "active"
+
+async def test_today_leaves_a_plan_that_still_runs_alone(router, client):
+    user_id = user_on(router, "home")
+    user_db = get_user_database(user_id)
+    # A rest day: nothing today, but the plan goes on for weeks
+    await user_db.users.insert_one({"id": user_id, "planEndsAt": start_of_day() + timedelta(days=PLAN_HORIZON_DAYS + 7)})
+
+    response = await client.get("/api/workouts/today", headers=auth_headers(user_id))
+
+    assert response.status_code == 404
+    assert await user_db.workouts.count_documents({"userId": user_id}) == 0
+
+async def test_new_plan_keeps_the_days_already_trained_or_skipped(indexed, client):
+    user_id = user_on(indexed, "east")
+    user_db = get_user_database(user_id)
+    await user_db.users.insert_one({"id": user_id, "email": "plan@example.com"})
+    today = start_of_day()
+    every_day = {weekday: DEFAULT_SPLIT[0] for weekday in range(7)}
+    await user_db.workouts.insert_many(build_plan(user_id, every_day, 1, today))
+    await user_db.workouts.update_one({"userId": user_id, "date": today}, {"$set": {"status": "completed"}})
+    await user_db.workouts.update_one({"userId": user_id, "date": today + timedelta(days=1)}, {"$set": {"status": "skipped"}})
+
+    response = await client.post(
+        "/api/workouts/plan",
+        json={"weeks": 2, "split": [{"weekday": weekday, "template": "Costas e Bíceps"} for weekday in range(7)]},
+        headers=auth_headers(user_id)
+    )
+
+    assert response.status_code == 200
+    assert response.json()["created"] == 12
+    workouts = await user_db.workouts.find({"userId": user_id}).to_list(None)
+    assert len(workouts) == len({workout["date"] for workout in workouts}) == 14
+    kept = {workout["date"]: workout for workout in workouts if workout["name"] == DEFAULT_SPLIT[0]}
+    assert [kept[day]["status"] for day in sorted(kept)] == ["completed", "skipped"]
+    user = await user_db.users.find_one({"id": user_id})
+    assert user["planEndsAt"] == today + timedelta(days=13)
+
+async def test_a_day_is_booked_once(indexed):
+    db = indexed.home.database
+    workout = build_plan("ana", DEFAULT_SPLIT, 1, start_of_day())[0]
+    await db.workouts.insert_one(dict(workout))
+
+    with pytest.raises(DuplicateKeyError):
+        await db.workouts.insert_one({**workout, "id": "another", "_id": "another"})
+
+async def test_day_index_stays_non_unique_over_duplicate_days(db, caplog):
+    workout = build_plan("ana", DEFAULT_SPLIT, 1, start_of_day())[0]
+    await db.workouts.insert_many([{**workout, "id": "one"}, {**workout, "id": "two"}])
+
+    await ensure_workout_day_index(db)
+
+    assert "Days booked twice" in caplog.text
+    indexes = await db.workouts.index_information()
+    assert not indexes["userId_1_date_1"].get("unique")
+
+async def test_plans_running_out_are_extended_with_the_stored_split(indexed):
+    home, east = indexed.home.database, indexed.shards["east"].database
+    running_out, planned = user_on(indexed, "east", "short"), user_on(indexed, "east", "long")
+    await home.users.insert_many([
+        {"id": running_out, "email": "short@example.com", "planSplit": {"0": "Costas e Bíceps", "9": "Desconhecido"}},
+        {"id": planned, "email": "long@example.com"},
+    ])
+    today = start_of_day()
+    await east.workouts.insert_many(build_plan(running_out, {today.weekday(): "Costas e Bíceps"}, 1, today))
+    await east.workouts.insert_many(build_plan(planned, {(today.weekday() + 1) % 7: "Costas e Bíceps"}, 4, today))
+    # Leftover of a user moved to east: the home shard's run leaves it alone
+    await home.workouts.insert_one(build_plan(running_out, {today.weekday(): "Costas e Bíceps"}, 1, today)[0])
+
+    await jobs.extend_all_plans()
+
+    scheduled = await east.workouts.find({"userId": running_out}, {"date": 1, "name": 1}).to_list(None)
+    added = [workout for workout in scheduled if workout["date"] > today]
+    assert len(added) == 4
+    assert all(workout["date"].weekday() == 0 for workout in added)
+    assert await east.workouts.count_documents({"userId": planned}) == 4
+    assert await home.workouts.count_documents({}) == 1
+    assert max(workout["date"] for workout in scheduled) >= today + timedelta(days=PLAN_HORIZON_DAYS)
+    # Running again books nothing twice
+    await jobs.extend_all_plans()
+    assert await east.workouts.count_documents({"userId": running_out}) == len(scheduled)
+
@@ -0,0 +1,96 @@
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+import httpx
+import pytest
+
+from middleware import rate_limit
+from middleware.rate_limit import BucketStore, InMemoryBucketStore, RateLimit, RateLimitMiddleware
+
+pytestmark = pytest.mark.anyio
+
+RULES = {"/login": (RateLimit(3, 60), RateLimit(2, 60))}
+
+async def echo(request: Request):
+    return JSONResponse(await request.json())
+
+def limited_client(middleware: RateLimitMiddleware, warmup: bool = False) -> httpx.AsyncClient:
+    async def app(scope, receive, send):
+        if warmup:
+            scope["warmup"] = True
+        await middleware(scope, receive, send)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+@pytest.fixture
+def middleware():
+    return RateLimitMiddleware(Starlette(routes=[Route("/login", echo, methods=["POST"])]), rules=RULES)
+
+async def test_email_limit_is_case_insensitive_and_body_reaches_the_app(middleware):
+    async with limited_client(middleware) as client:
+        first = await client.post("/login", json={"email": "Ana@Example.com", "password": "x"})
+        assert first.json() == {"email": "Ana@Example.com", "password": "x"}
+        await client.post("/login", json={"email": " ana@example.com", "password": "x"})
+
+        response = await client.post("/login", json={"email": "ANA@example.com", "password": "x"})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) == 30
+
+async def test_ip_limit_applies_across_emails(middleware):
+    async with limited_client(middleware) as client:
+        for number in range(3):
+            response = await client.post("/login", json={"email": f"user{number}@example.com"})
+            assert response.status_code == 200
+        response = await client.post("/login", json={"email": "other@example.com"})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) == 20
+
+async def test_warmup_requests_and_other_paths_are_not_limited(middleware):
+    async with limited_client(middleware, warmup=True) as client:
+        for _ in range(5):
+            assert (await client.post("/login", json={"email": "ana@example.com"})).status_code == 200
+    async with limited_client(middleware) as client:
+        assert (await client.post("/login", json={"email": "ana@example.com"})).status_code == 200
+        for _ in range(5):
+            assert (await client.post("/elsewhere", json={})).status_code != 429
+
+async def test_oversized_bodies_are_refused(middleware):
+    async with limited_client(middleware) as client:
+        response = await client.post("/login", content=b"x" * (rate_limit.MAX_BODY_BYTES + 1))
+
+    assert response.status_code == 413
+
+async def test_buckets_refill_over_time(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: clock[0])
+    store = InMemoryBucketStore()
+    limit = RateLimit(2, 60)
+
+    assert await store.take("key", limit) == 0
+    assert await store.take("key", limit) == 0
+    assert await store.take("key", limit) == pytest.approx(30)
+    clock[0] += 30
+    assert await store.take("key", limit) == 0
+    assert await store.take("key", limit) > 0
+
+async def test_idle_and_excess_buckets_are_evicted(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: clock[0])
+    store = InMemoryBucketStore(max_buckets=2, idle_seconds=60)
+    limit = RateLimit(1, 60)
+
+    for key in ("a", "b", "c"):
+        await store.take(key, limit)
+    assert len(store) == 2
+    # "a" was evicted, so it starts again with a full bucket
+    assert await store.take("a", limit) == 0
+
+    clock[0] += 61
+    await store.take("d", limit)
+    assert len(store) == 1
+
+def test_bucket_store_is_an_interface():
+    with pytest.raises(TypeError):
+        BucketStore()
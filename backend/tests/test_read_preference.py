@@ -0,0 +1,93 @@
+from bson import Timestamp
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from types import SimpleNamespace
+import pytest
+
+import database
+from conftest import user_on
+from database import CausalTokens, build_read_preference, causal_session, get_user_database
+
+class FakeSession:
+    def __init__(self):
+        self.operation_time = None
+        self.cluster_time = None
+        self.advanced_to = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def advance_operation_time(self, operation_time):
+        self.advanced_to = operation_time
+
+    def advance_cluster_time(self, cluster_time):
+        self.cluster_time = cluster_time
+
+class FakeClient:
+    def __init__(self):
+        self.sessions = []
+
+    async def start_session(self, causal_consistency: bool):
+        assert causal_consistency
+        self.sessions.append(FakeSession())
+        return self.sessions[-1]
+
+def test_read_preference_modes():
+    assert build_read_preference("primary", 90) == Primary()
+    preference = build_read_preference("secondaryPreferred", 120)
+    assert isinstance(preference, SecondaryPreferred)
+    assert preference.max_staleness == 120
+    with pytest.raises(ValueError):
+        build_read_preference("closest", 90)
+
+def test_tokens_skip_standalone_sessions_and_evict_the_oldest_users():
+    tokens = CausalTokens(max_users=2)
+    standalone = FakeSession()
+    tokens.record("ana", standalone)
+    for user_id, time in (("ana", 1), ("bia", 2), ("ana", 3), ("caio", 4)):
+        session = FakeSession()
+        session.operation_time = session.cluster_time = Timestamp(time, 0)
+        tokens.record(user_id, session)
+
+    ana, bia, caio = FakeSession(), FakeSession(), FakeSession()
+    for user_id, session in (("ana", ana), ("bia", bia), ("caio", caio)):
+        tokens.apply(user_id, session)
+
+    assert ana.advanced_to == Timestamp(3, 0) and ana.cluster_time == Timestamp(3, 0)
+    assert bia.advanced_to is None  # least recently written
+    assert caio.advanced_to == Timestamp(4, 0)
+
+@pytest.mark.anyio
+async def test_reads_continue_from_the_users_last_write_on_the_same_client(monkeypatch):
+    monkeypatch.setattr(database, "causal_tokens", CausalTokens())
+    primary, other_shard = FakeClient(), FakeClient()
+    db = SimpleNamespace(client=primary)
+
+    async with causal_session("ana", db) as session:
+        session.operation_time = Timestamp(42, 1)  # what the write's reply reported
+    async with causal_session("ana", db) as ana_read:
+        pass
+    async with causal_session("bia", db) as bia_read:
+        pass
+    async with causal_session("ana", SimpleNamespace(client=other_shard)) as elsewhere:
+        pass
+
+    assert ana_read.advanced_to == Timestamp(42, 1)
+    assert bia_read.advanced_to is None
+    assert elsewhere.advanced_to is None
+
+def test_analytics_handles_route_every_collection_to_the_analytics_databases(router):
+    for shard in router.shards.values():
+        shard.analytics_database = shard.client["fitness_analytics"]
+    user_id = user_on(router, "east")
+
+    analytics = get_user_database(user_id, analytics=True)
+    primary = get_user_database(user_id)
+
+    assert analytics.shard_name == primary.shard_name == "east"
+    assert analytics.workouts.database is router.shards["east"].analytics_database
+    assert analytics.users.database is router.home.analytics_database
+    assert primary.workouts.database is router.shards["east"].database
+    assert primary.users.database is router.home.database
@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+import pytest
+
+import archive
+import jobs
+import sharding
+from conftest import auth_headers, user_on
+from database import get_user_database
+from sharding import ShardRouter
+
+pytestmark = pytest.mark.anyio
+
+async def test_user_collections_live_on_the_users_shard(router):
+    user_id = user_on(router, "east")
+    user_db = get_user_database(user_id)
+
+    await user_db.workouts.insert_one({"id": "w1", "userId": user_id})
+    await user_db.users.insert_one({"id": user_id})
+
+    east, home = router.shards["east"].database, router.home.database
+    assert await east.workouts.count_documents({"userId": user_id}) == 1
+    assert await home.workouts.count_documents({}) == 0
+    assert await home.users.count_documents({"id": user_id}) == 1
+    assert await east.users.count_documents({}) == 0
+
+async def test_group_by_shard_follows_overrides(router):
+    home_user, east_user = user_on(router, "home"), user_on(router, "east")
+    router.overrides[home_user] = {"_id": home_user, "shard": "east", "state": "active"}
+
+    assert router.group_by_shard([home_user, east_user]) == {"east": [home_user, east_user]}
+
+async def test_move_user_copies_switches_and_cleans_up(router):
+    user_id = user_on(router, "home")
+    home, east = router.shards["home"].database, router.shards["east"].database
+    await home.workouts.insert_many([{"id": f"w{i}", "userId": user_id, "updatedAt": datetime.utcnow()} for i in range(3)])
+    await home.set_logs.insert_one({"userId": user_id, "workoutId": "w0", "completedAt": datetime.utcnow()})
+
+    await router.move_user(user_id, "east")
+
+    assert router.shard_name(user_id) == "east"
+    assert await east.workouts.count_documents({"userId": user_id}) == 3
+    assert await east.set_logs.count_documents({"userId": user_id}) == 1
+    assert await home.workouts.count_documents({"userId": user_id}) == 0
+    assert (await home.shard_overrides.find_one({"_id": user_id}))["state"] == "active"
+
+    # Moving back to the ring shard drops the override
+    await router.move_user(user_id, "home")
+    assert user_id not in router.overrides
+    assert await home.shard_overrides.count_documents({"state": {"$ne": "dropped"}}) == 0
+    assert await home.workouts.count_documents({"userId": user_id}) == 3
+
+async def test_move_user_rejects_unknown_shard(router):
+    with pytest.raises(ValueError):
+        await router.move_user(user_on(router, "home"), "west")
+
+async def test_writes_are_refused_while_a_user_is_locked(router, client):
+    user_id = user_on(router, "home")
+    router.overrides[user_id] = {"_id": user_id, "shard": "home", "state": "locked", "movingTo": "east"}
+
+    response = await client.post("/api/workouts/plan", json={"weeks": 1}, headers=auth_headers(user_id))
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+    # Reads keep going to the source shard
+    response = await client.get("/api/workouts/", headers=auth_headers(user_id))
+    assert response.status_code == 200
+
+async def test_workers_sync_override_changes_incrementally(router, monkeypatch):
+    home = router.home.database
+    worker = ShardRouter(router.specs)
+    worker.shards = router.shards
+    moved, pinned = user_on(router, "home", "moved"), user_on(router, "home", "pinned")
+    await router._set_override(pinned, shard="east", state="active")
+    queries = []
+    find = type(home.shard_overrides).find
+
+    def recording_find(self, filter=None, *args, **kwargs):
+        queries.append(filter)
+        return find(self, filter, *args, **kwargs)
+    monkeypatch.setattr(type(home.shard_overrides), "find", recording_find)
+
+    await worker.refresh_overrides()
+    assert worker.shard_name(pinned) == "east"
+
+    await router._set_override(moved, shard="home", state="copying", movingTo="east")
+    await router._drop_override(pinned)
+    await worker.refresh_overrides()
+
+    assert "updatedAt" in queries[-1]
+    assert worker.moving_users() == [moved]
+    assert worker.shard_name(pinned) == "home"
+    tombstone = await home.shard_overrides.find_one({"_id": pinned})
+    assert tombstone["state"] == "dropped" and tombstone["expiresAt"] > datetime.utcnow()
+
+    # Overrides re-set after a drop lose the tombstone's expiry
+    await router._set_override(pinned, shard="east", state="active")
+    assert "expiresAt" not in await home.shard_overrides.find_one({"_id": pinned})
+
+    # Removed without a tombstone (e.g. by hand): only the full reconcile notices
+    await home.shard_overrides.delete_one({"_id": moved})
+    await worker.refresh_overrides()
+    assert worker.is_moving(moved)
+    monkeypatch.setattr(sharding, "OVERRIDE_RECONCILE_SECONDS", 0)
+    await worker.refresh_overrides()
+    assert not worker.is_moving(moved)
+    assert queries[-1] == {"state": {"$ne": "dropped"}}
+
+def old_workout(user_id: str, status: str, days_ago: int) -> dict:
+    date = datetime.utcnow() - timedelta(days=days_ago)
+    return {
+        "id": f"{user_id}-{status}-{days_ago}", "userId": user_id, "name": "Treino A", "status": status,
+        "date": date, "completedAt": date, "updatedAt": date, "version": 1,
+        "exercises": [{"id": "ex_0", "name": "Supino", "sets": 3, "reps": 10, "weight": 50.0, "completed": True, "completedSets": 3}]
+    }
+
+@pytest.mark.parametrize("state", ["copying", "locked"])
+async def test_jobs_leave_users_moving_between_shards_alone(router, monkeypatch, state):
+    monkeypatch.setattr(archive, "ARCHIVE_BATCH_PAUSE_SECONDS", 0)
+    home = router.home.database
+    moving, settled = user_on(router, "home", "moving"), user_on(router, "home", "settled")
+    await home.users.insert_many([{"id": moving}, {"id": settled}])
+    for user_id in (moving, settled):
+        await home.workouts.insert_many([old_workout(user_id, "completed", 400), old_workout(user_id, "pending", 2)])
+    router.overrides[moving] = {"_id": moving, "shard": "home", "state": state, "movingTo": "east"}
+
+    assert await archive.archive_workouts(home, home, cutoff=datetime.utcnow() - timedelta(days=30)) == 1
+    await jobs.advance_stale_workouts(home)
+    assert await jobs.backfill_set_logs(home) == 0
+
+    assert await home.workouts_archive.distinct("userId") == [settled]
+    assert await home.workouts.count_documents({"userId": moving, "archiveBatch": {"$exists": True}}) == 0
+    assert (await home.workouts.find_one({"userId": moving, "status": {"$ne": "completed"}}))["status"] == "pending"
+    assert (await home.workouts.find_one({"userId": settled, "status": {"$ne": "completed"}}))["status"] == "skipped"
+    assert await home.migrations.count_documents({}) == 0
+
+    # Once the move is over, the next runs catch up
+    router.overrides.pop(moving)
+    assert await archive.archive_workouts(home, home, cutoff=datetime.utcnow() - timedelta(days=30)) == 1
+    await jobs.advance_stale_workouts(home)
+    assert await home.workouts.count_documents({"status": "pending"}) == 0
+    assert await jobs.backfill_set_logs(home) > 0
+
+async def test_archive_batches_claimed_before_a_move_finish_on_the_target(router, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_BATCH_PAUSE_SECONDS", 0)
+    home = router.home.database
+    moving, settled = user_on(router, "home", "moving"), user_on(router, "home", "settled")
+    await home.users.insert_many([{"id": moving}, {"id": settled}])
+    await home.workouts.insert_many([
+        {**old_workout(user_id, "completed", 400), "archiveBatch": "interrupted"} for user_id in (moving, settled)
+    ])
+    router.overrides[moving] = {"_id": moving, "shard": "home", "state": "copying", "movingTo": "east"}
+
+    assert await archive.archive_workouts(home, home, cutoff=datetime.utcnow() - timedelta(days=30)) == 1
+    assert await home.workouts.count_documents({"userId": moving, "archiveBatch": "interrupted"}) == 1
+
+    await router.move_user(moving, "east")
+    east = router.shards["east"].database
+    assert await archive.archive_workouts(east, home, cutoff=datetime.utcnow() - timedelta(days=30)) == 1
+    assert await east.workouts_archive.distinct("userId") == [moving]
+    assert await east.workouts.count_documents({}) == 0
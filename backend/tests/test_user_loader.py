@@ -0,0 +1,89 @@
+from fastapi import Depends, FastAPI
+import httpx
+import pytest
+
+from auth.dependencies import UserLoader, current_user_document, get_user_loader
+from conftest import auth_headers
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def users(db, monkeypatch):
+    """Three users, and the list of queries made to the users collection"""
+    await db.users.insert_many([
+        {"id": user_id, "name": user_id.title(), "email": f"{user_id}@example.com", "streak": number}
+        for number, user_id in enumerate(("ana", "bia", "caio"))
+    ])
+    queries = []
+    find = type(db.users).find
+
+    def counting_find(self, filter=None, *args, **kwargs):
+        if self.name == "users":
+            queries.append((filter, args[0] if args else kwargs.get("projection")))
+        return find(self, filter, *args, **kwargs)
+    monkeypatch.setattr(type(db.users), "find", counting_find)
+    return queries
+
+async def test_fields_are_read_once_and_widened_by_union(db, users):
+    loader = UserLoader(db, "ana")
+
+    assert await loader.current(["name"]) == {"id": "ana", "name": "Ana"}
+    assert await loader.current(["name"]) == {"id": "ana", "name": "Ana"}
+    assert len(users) == 1
+
+    # A field outside the memo re-reads once, keeping the fields already read
+    widened = await loader.current(["email"])
+    assert widened == {"id": "ana", "name": "Ana", "email": "ana@example.com"}
+    assert set(users[1][1]) == {"_id", "id", "name", "email"}
+    await loader.current(["name", "email"])
+    assert len(users) == 2
+
+    whole = await loader.current()
+    assert whole["streak"] == 0
+    await loader.current(["streak"])
+    assert len(users) == 3
+
+async def test_batches_are_one_query_and_missing_users_are_remembered(db, users):
+    loader = UserLoader(db, "ana")
+
+    found = await loader.load_many(["bia", "ghost", "caio", "bia"], ("name",))
+
+    assert found == {"bia": {"id": "bia", "name": "Bia"}, "caio": {"id": "caio", "name": "Caio"}}
+    assert users[0][0] == {"id": {"$in": ["bia", "ghost", "caio"]}}
+    assert await loader.load("ghost", ("name",)) is None
+    assert await loader.load("caio", ("name",)) == {"id": "caio", "name": "Caio"}
+    # Only the users not memoized yet are fetched
+    await loader.load_many(["bia", "ana"], ("name",))
+    assert users[1][0] == {"id": {"$in": ["ana"]}}
+    assert len(users) == 2
+
+async def test_forget_rereads_after_a_write(db, users):
+    loader = UserLoader(db, "ana")
+    await loader.current(["name"])
+    await db.users.update_one({"id": "ana"}, {"$set": {"name": "Ana Maria"}})
+
+    assert (await loader.current(["name"]))["name"] == "Ana"
+    loader.forget("ana")
+    assert (await loader.current(["name"]))["name"] == "Ana Maria"
+
+async def test_one_loader_per_request(router, db, users):
+    app = FastAPI()
+
+    @app.get("/me")
+    async def me(
+        user: dict = Depends(current_user_document("name")),
+        loader: UserLoader = Depends(get_user_loader)
+    ):
+        again = await loader.current(["name"])
+        return {"name": user["name"], "same": again is user}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        first = await client.get("/me", headers=auth_headers("ana"))
+        await db.users.update_one({"id": "ana"}, {"$set": {"name": "Ana Maria"}})
+        second = await client.get("/me", headers=auth_headers("ana"))
+        gone = await client.get("/me", headers=auth_headers("ghost"))
+
+    assert first.json() == {"name": "Ana", "same": True}
+    assert second.json()["name"] == "Ana Maria"
+    assert gone.status_code == 404
+    assert len(users) == 3
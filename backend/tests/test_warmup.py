@@ -0,0 +1,74 @@
+from mongomock.database import Database
+import json
+import logging
+import pytest
+
+import warmup
+from middleware import rate_limit
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def app(indexed, monkeypatch):
+    """The application on shards that answer pings (and, like old servers, nothing else)"""
+    from server import app
+    command = Database.command
+
+    def ping_only(self, command_name, *args, **kwargs):
+        if command_name == "ping":
+            return {"ok": 1.0}
+        return command(self, command_name, *args, **kwargs)
+    monkeypatch.setattr(Database, "command", ping_only)
+    return app
+
+async def test_every_phase_runs_and_is_timed(app, caplog):
+    caplog.set_level(logging.INFO, logger="warmup")
+
+    await warmup.run_warmup(app)
+
+    finished = next(record.getMessage() for record in caplog.records if record.getMessage().startswith("Warmup finished"))
+    for phase in ("pool", "indexes", "serializers", "crypto", "routes"):
+        assert f"{phase}=" in finished
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+
+async def test_a_failing_phase_does_not_stop_startup(app, caplog, monkeypatch):
+    caplog.set_level(logging.INFO, logger="warmup")
+    async def broken():
+        raise RuntimeError("no database")
+    monkeypatch.setattr(warmup, "prime_connection_pool", broken)
+
+    await warmup.run_warmup(app)
+
+    assert "Warmup phase 'pool' failed: no database" in caplog.text
+    assert "Warmup finished" in caplog.text
+
+async def test_synthetic_requests_touch_no_data_and_no_rate_limits(app, db, monkeypatch):
+    statuses = []
+    synthetic_request = warmup._synthetic_request
+
+    async def record_status(app_, method, path):
+        status = await synthetic_request(app_, method, path)
+        statuses.append((method, path, status))
+        return status
+    monkeypatch.setattr(warmup, "_synthetic_request", record_status)
+    take = rate_limit.InMemoryBucketStore.take
+    taken = []
+
+    async def record_take(self, key, *args, **kwargs):
+        taken.append(key)
+        return await take(self, key, *args, **kwargs)
+    monkeypatch.setattr(rate_limit.InMemoryBucketStore, "take", record_take)
+
+    await warmup.exercise_routes(app)
+
+    assert ("POST", "/api/auth/login", 422) in statuses
+    assert all(status < 500 for _, _, status in statuses), [entry for entry in statuses if entry[2] >= 500]
+    assert taken == []
+    for name in await db.list_collection_names():
+        assert await db[name].count_documents({}) == 0, name
+
+async def test_import_time_summary():
+    summary = json.loads(await warmup.import_time_summary())
+
+    assert summary["total_ms"] > 0 and summary["modules"] > 0
+    assert len(summary["slowest_cumulative_ms"]) == warmup.IMPORTTIME_TOP
@@ -0,0 +1,179 @@
+"""
+Startup warmup.
+
+Runs once per worker from the startup hook so the first real requests after a
+deploy do not pay for opening connections, building indexes, generating the
+OpenAPI schema or loading the crypto modules. Every phase is timed and a
+failing phase is logged without aborting startup.
+"""
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from typing import get_args
+from pathlib import Path
+import asyncio
+import json
+import os
+import sys
+import time
+import logging
+
+from database import get_shard_databases, ensure_indexes
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent
+
+WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', '1') == '1'
+WARMUP_IMPORTTIME = os.environ.get('WARMUP_IMPORTTIME', '0') == '1'
+IMPORTTIME_TOP = 10
+
+async def prime_connection_pool():
+    """Open minPoolSize connections to every shard up front with concurrent pings"""
+    connections = max(int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)), 1)
+    await asyncio.gather(*(db.command("ping") for db in get_shard_databases() for _ in range(connections)))
+
+async def check_indexes():
+    for db in get_shard_databases():
+        await ensure_indexes(db)
+
+def _response_models(route: APIRoute):
+    """Yield the pydantic models in a route's response_model, unwrapping List[...]"""
+    candidates = [route.response_model]
+    while candidates:
+        candidate = candidates.pop()
+        if isinstance(candidate, type) and issubclass(candidate, BaseModel):
+            yield candidate
+        else:
+            candidates.extend(get_args(candidate))
+
+async def build_serializers(app: FastAPI):
+    """Finish building response models and generate the OpenAPI schema"""
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            for model in _response_models(route):
+                model.model_rebuild(force=True)
+    app.openapi()
+
+async def load_crypto():
+    """Import and exercise the JWT and bcrypt code paths once"""
+    import bcrypt
+    from auth.jwt_handler import create_access_token, verify_token
+
+    verify_token(create_access_token({"user_id": "warmup"}))
+    hashed = bcrypt.hashpw(b"warmup", bcrypt.gensalt(4))
+    bcrypt.checkpw(b"warmup", hashed)
+
+async def _synthetic_request(app: FastAPI, method: str, path: str) -> int:
+    """Send an unauthenticated request through the full ASGI stack (rate limits do not apply to it)"""
+    body = b"{}" if method in ("POST", "PUT", "PATCH") else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"warmup"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("warmup", 80),
+        "warmup": True,
+    }
+    status = {}
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await app(scope, receive, send)
+    return status.get("code", 0)
+
+async def exercise_routes(app: FastAPI):
+    """Fire one synthetic request per route.
+
+    Requests carry no credentials and an empty body, so protected routes stop at
+    authentication and public ones at validation: routing, dependency
+    resolution and error serialization are exercised without touching data.
+    """
+    for route in app.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        path = route.path_format.format(**{name: "warmup" for name in route.param_convertors})
+        for method in sorted(route.methods):
+            await _synthetic_request(app, method, path)
+
+async def import_time_summary() -> str:
+    """Profile `import server` in a fresh interpreter with -X importtime"""
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-X", "importtime", "-c", "import server",
+        cwd=str(ROOT_DIR),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+
+    modules = []
+    for line in stderr.decode(errors="replace").splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((int(fields[1]), name.strip(), depth))
+
+    total_us = sum(cumulative for cumulative, _, depth in modules if depth == 0)
+    slowest = sorted(modules, key=lambda module: module[0], reverse=True)[:IMPORTTIME_TOP]
+    return json.dumps({
+        "total_ms": round(total_us / 1000, 1),
+        "modules": len(modules),
+        "slowest_cumulative_ms": {name: round(cumulative / 1000, 1) for cumulative, name, _ in slowest},
+    }, ensure_ascii=False)
+
+async def run_warmup(app: FastAPI):
+    """Run every warmup phase and log a per-phase timing breakdown"""
+    if not WARMUP_ENABLED:
+        return
+
+    phases = [
+        ("pool", prime_connection_pool),
+        ("indexes", check_indexes),
+        ("serializers", lambda: build_serializers(app)),
+        ("crypto", load_crypto),
+        ("routes", lambda: exercise_routes(app)),
+    ]
+    timings = {}
+    started = time.perf_counter()
+    for name, phase in phases:
+        phase_started = time.perf_counter()
+        try:
+            await phase()
+        except Exception as e:
+            logger.error("Warmup phase '%s' failed: %s", name, e)
+        timings[name] = round((time.perf_counter() - phase_started) * 1000, 1)
+
+    total = round((time.perf_counter() - started) * 1000, 1)
+    breakdown = ", ".join(f"{name}={ms}ms" for name, ms in timings.items())
+    logger.info("Warmup finished in %sms (%s)", total, breakdown)
+
+    if WARMUP_IMPORTTIME:
+        try:
+            logger.info("Import time summary: %s", await import_time_summary())
+        except Exception as e:
+            logger.error("Import time profiling failed: %s", e)
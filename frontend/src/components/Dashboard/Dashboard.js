@@ -38,7 +38,7 @@ const Dashboard = () => {
       // Load today's workout and weekly progress in parallel
       const [workoutResponse, progressResponse] = await Promise.all([
         api.workouts.getToday().catch(() => ({ data: null })),
-        api.progress.getWeekly().catch(() => ({ data: [] }))
+        api.progress.getWeekly('week,volume').catch(() => ({ data: [] }))
       ]);
 
       setTodayWorkout(workoutResponse.data);
@@ -32,6 +32,7 @@ export const AuthProvider = ({ children }) => {
       } catch (error) {
         console.error('Erro ao carregar dados do usuário:', error);
         localStorage.removeItem('fitness_token');
+        localStorage.removeItem('fitness_refresh_token');
         localStorage.removeItem('fitness_user');
       }
     }
@@ -47,10 +48,11 @@ export const AuthProvider = ({ children }) => {
         password
       });
 
-      const { user: userData, token } = response.data;
+      const { user: userData, token, refreshToken } = response.data;
       
       setUser(userData);
       localStorage.setItem('fitness_token', token);
+      localStorage.setItem('fitness_refresh_token', refreshToken);
       localStorage.setItem('fitness_user', JSON.stringify(userData));
       
       // Configurar token padrão para futuras requisições
@@ -76,10 +78,11 @@ export const AuthProvider = ({ children }) => {
         password
       });
 
-      const { user: userData, token } = response.data;
+      const { user: userData, token, refreshToken } = response.data;
       
       setUser(userData);
       localStorage.setItem('fitness_token', token);
+      localStorage.setItem('fitness_refresh_token', refreshToken);
       localStorage.setItem('fitness_user', JSON.stringify(userData));
       
       // Configurar token padrão para futuras requisições
@@ -96,8 +99,13 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    // Revogar tokens no servidor (melhor esforço)
+    const refreshToken = localStorage.getItem('fitness_refresh_token');
+    axios.post(`${API}/auth/logout`, { refreshToken }).catch(() => {});
+
     setUser(null);
     localStorage.removeItem('fitness_token');
+    localStorage.removeItem('fitness_refresh_token');
     localStorage.removeItem('fitness_user');
     delete axios.defaults.headers.common['Authorization'];
   };
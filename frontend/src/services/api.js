@@ -20,15 +20,53 @@ axios.interceptors.request.use(
   }
 );
 
+const clearSession = () => {
+  localStorage.removeItem('fitness_token');
+  localStorage.removeItem('fitness_refresh_token');
+  localStorage.removeItem('fitness_user');
+  window.location.href = '/auth';
+};
+
+// Access tokens are short-lived: share one in-flight refresh between requests
+let refreshPromise = null;
+
+const refreshSession = () => {
+  if (!refreshPromise) {
+    const refreshToken = localStorage.getItem('fitness_refresh_token');
+    refreshPromise = axios
+      .post('/auth/refresh', { refreshToken })
+      .then(({ data }) => {
+        localStorage.setItem('fitness_token', data.token);
+        localStorage.setItem('fitness_refresh_token', data.refreshToken);
+        axios.defaults.headers.common['Authorization'] = `Bearer ${data.token}`;
+        return data.token;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 // Add response interceptor to handle auth errors
 axios.interceptors.response.use(
   (response) => response,
-  (error) => {
-    if (error.response?.status === 401) {
+  async (error) => {
+    const config = error.config;
+    if (error.response?.status === 401 && config && !config._retry && !config.url?.includes('/auth/')) {
+      if (localStorage.getItem('fitness_refresh_token')) {
+        config._retry = true;
+        try {
+          const token = await refreshSession();
+          config.headers.Authorization = `Bearer ${token}`;
+          return axios(config);
+        } catch (refreshError) {
+          clearSession();
+          return Promise.reject(refreshError);
+        }
+      }
       // Token expired or invalid
-      localStorage.removeItem('fitness_token');
-      localStorage.removeItem('fitness_user');
-      window.location.href = '/auth';
+      clearSession();
     }
     return Promise.reject(error);
   }
@@ -39,6 +77,7 @@ export const api = {
   auth: {
     login: (email, password) => axios.post('/auth/login', { email, password }),
     register: (name, email, password) => axios.post('/auth/register', { name, email, password }),
+    logout: (refreshToken) => axios.post('/auth/logout', { refreshToken }),
   },
 
   // User endpoints  
@@ -50,13 +89,17 @@ export const api = {
   workouts: {
     getAll: () => axios.get('/workouts'),
     getToday: () => axios.get('/workouts/today'),
-    completeSet: (workoutId, exerciseId, setData) => 
-      axios.post(`/workouts/${workoutId}/exercises/${exerciseId}/complete-set`, setData),
+    // The key names the set itself, so any retry of it is answered with the first response
+    completeSet: (workoutId, exerciseId, setData) =>
+      axios.post(`/workouts/${workoutId}/exercises/${exerciseId}/complete-set`, setData, {
+        headers: { 'Idempotency-Key': `complete-set:${workoutId}:${exerciseId}:${setData.setNumber}` },
+      }),
   },
 
   // Progress endpoints
   progress: {
-    getWeekly: () => axios.get('/progress/weekly'),
+    // fields: optional comma-separated subset of the response fields
+    getWeekly: (fields) => axios.get('/progress/weekly', { params: { fields } }),
     getStats: () => axios.get('/progress/stats'),
   },
 };